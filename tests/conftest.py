@@ -0,0 +1,30 @@
+import glob
+import os
+import shutil
+import sys
+
+import pytest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+REGION_DIR = os.path.join(REPO_DIR, 'georgia')
+CROSSWALK_FILE = 'ssp_georgia_transformation_cw.xlsx'
+
+# The utils modules import each other by their flat module names, as in the notebooks
+sys.path.insert(0, os.path.join(REPO_DIR, 'utils'))
+
+
+@pytest.fixture
+def region_copy(tmp_path):
+    """
+    Copy the crosswalk and the transformation templates of a region, without its strategy YAMLs.
+
+    Returns:
+        tuple: The paths of the crosswalk and of the transformations directory.
+    """
+    yaml_directory = tmp_path / 'transformations'
+    shutil.copytree(os.path.join(REGION_DIR, 'transformations'), yaml_directory)
+    for path in glob.glob(str(yaml_directory / '*_strategy_*.yaml')):
+        os.remove(path)
+    excel_file = tmp_path / CROSSWALK_FILE
+    shutil.copy(os.path.join(REGION_DIR, 'data', CROSSWALK_FILE), excel_file)
+    return str(excel_file), str(yaml_directory)
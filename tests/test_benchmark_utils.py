@@ -0,0 +1,39 @@
+import json
+
+from BenchmarkUtils import compare_benchmarks, run_benchmarks, save_benchmarks
+
+
+def get_run(wall_times):
+    return {
+        'results': [
+            {'case': case, 'n_transformations': 50, 'n_strategies': 3, 'wall_s_min': wall_s, 'peak_mb': 1.0}
+            for case, wall_s in wall_times.items()
+        ],
+    }
+
+
+def test_compare_flags_slowdowns_over_the_threshold_and_timer_noise(tmp_path):
+    baseline = get_run({'process_yaml_files': 1.0, 'add_strategy': 0.001, 'compare_dfs': 0.5, 'add_strategies': 0.1})
+    current = get_run({'process_yaml_files': 1.5, 'add_strategy': 0.002, 'compare_dfs': 0.55, 'input_schema_align': 0.1})
+    baseline_file = str(tmp_path / 'baseline.json')
+    with open(baseline_file, 'w') as file:
+        json.dump(baseline, file)
+
+    comparison = compare_benchmarks(baseline_file, current, threshold=0.2).set_index('case')
+    # Cases that are only in one of the runs are left out
+    assert sorted(comparison.index) == ['add_strategy', 'compare_dfs', 'process_yaml_files']
+    assert comparison.at['process_yaml_files', 'ratio'] == 1.5
+    # add_strategy is twice as slow, but by less than min_delta_s
+    assert comparison['regression'].to_dict() == {'process_yaml_files': True, 'add_strategy': False, 'compare_dfs': False}
+
+
+def test_run_benchmarks_records_every_case_and_size(tmp_path):
+    cases = ['process_yaml_files_full', 'get_transformation_specification']
+    benchmarks = run_benchmarks(sizes=[(6, 2), (8, 3)], cases=cases, repeat=1, trace_memory=False, work_dir=str(tmp_path))
+    assert [(result['case'], result['n_transformations']) for result in benchmarks['results']] == \
+        [(case, n_transformations) for n_transformations in (6, 8) for case in cases]
+    assert all(result['wall_s_min'] > 0 and result['file_ops'] for result in benchmarks['results'])
+
+    output_file = str(tmp_path / 'benchmark.json')
+    save_benchmarks(benchmarks, output_file)
+    assert not compare_benchmarks(output_file, benchmarks, threshold=0.0, min_delta_s=0.0)['regression'].any()
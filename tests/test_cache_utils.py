@@ -0,0 +1,86 @@
+import os
+
+import pandas as pd
+import pytest
+
+from CacheUtils import ExampleCache, WorkbookCache
+
+
+def write_workbook(excel_file, df_yaml):
+    with pd.ExcelWriter(excel_file) as writer:
+        df_yaml.to_excel(writer, sheet_name='yaml', index=False)
+        pd.DataFrame({'note': ['a', 'b']}).to_excel(writer, sheet_name='notes', index=False)
+
+
+def test_workbook_sheets_are_served_from_sidecars(tmp_path, monkeypatch):
+    excel_file = str(tmp_path / 'crosswalk.xlsx')
+    df_yaml = pd.DataFrame({'transformation_code': ['TX:A', 'TX:B'], 'strategy_NZ': [1.5, 0.5]})
+    write_workbook(excel_file, df_yaml)
+    cache = WorkbookCache()
+
+    pd.testing.assert_frame_equal(cache.read_excel(excel_file, sheet_name='yaml'), df_yaml)
+    assert cache.get_sheet_names(excel_file) == ['yaml', 'notes']
+
+    # Once cached, the workbook is never parsed again
+    def fail_read_excel(*args, **kwargs):
+        raise AssertionError("the workbook was parsed again")
+    monkeypatch.setattr(pd, 'read_excel', fail_read_excel)
+    pd.testing.assert_frame_equal(cache.read_excel(excel_file, sheet_name='yaml'), df_yaml)
+    assert list(WorkbookCache().read_excel(excel_file, sheet_name=None)) == ['yaml', 'notes']
+
+
+def test_editing_a_workbook_replaces_its_sidecars(tmp_path):
+    excel_file = str(tmp_path / 'crosswalk.xlsx')
+    write_workbook(excel_file, pd.DataFrame({'transformation_code': ['TX:A'], 'strategy_NZ': [1.0]}))
+    cache = WorkbookCache()
+    cache.read_excel(excel_file, sheet_name=None)
+    cache_dir = cache.get_cache_dir(excel_file)
+    old_files = set(os.listdir(cache_dir))
+
+    df_edited = pd.DataFrame({'transformation_code': ['TX:A', 'TX:C'], 'strategy_NZ': [2.5, 0.25]})
+    write_workbook(excel_file, df_edited)
+    pd.testing.assert_frame_equal(cache.read_excel(excel_file, sheet_name='yaml'), df_edited)
+    cache.read_excel(excel_file, sheet_name=None)
+
+    new_files = set(os.listdir(cache_dir))
+    assert new_files and not old_files & new_files
+    digest = cache.get_file_hash(excel_file)[:16]
+    assert all(f"__{digest}" in file_name for file_name in new_files)
+
+
+class FakeExamples:
+    """
+    Stands in for `SISEPUEDEExamples()`.
+    """
+
+    def __init__(self, n_columns):
+        self.input_data_frame = pd.DataFrame({f'frac_{i}': [0.5, 0.25] for i in range(n_columns)})
+
+    def __call__(self, name):
+        return pd.DataFrame({'variable_trajectory_group': [1, 1], 'variable': ['frac_0', 'frac_1']})
+
+
+def test_example_snapshots_are_kept_per_version(tmp_path, monkeypatch):
+    cache_dir = str(tmp_path / 'examples')
+    for version, n_columns in (('1.0.0', 2), ('2.0.0', 3)):
+        ExampleCache(cache_dir, version=version).snapshot(FakeExamples(n_columns))
+    # The manifest marks a complete snapshot; the newest one is the fallback
+    os.utime(os.path.join(cache_dir, '1.0.0', 'manifest.json'), (0, 0))
+
+    examples = ExampleCache(cache_dir, version='1.0.0')
+    assert examples.is_cached()
+    assert list(examples.input_data_frame.columns) == ['frac_0', 'frac_1']
+    assert examples.get_schema() == {'columns': ['frac_0', 'frac_1'], 'dtypes': ['float64', 'float64']}
+    assert examples('variable_trajectory_group_specification')['variable'].tolist() == ['frac_0', 'frac_1']
+    assert not ExampleCache(cache_dir, version='3.0.0').is_cached()
+
+    monkeypatch.setattr(ExampleCache, 'get_installed_version', staticmethod(lambda: None))
+    assert ExampleCache(cache_dir).version == '2.0.0'
+    assert len(ExampleCache(cache_dir).input_data_frame.columns) == 3
+    with pytest.raises(KeyError):
+        examples('variable_trajectory_groups')
+
+    examples.clear()
+    assert not examples.is_cached() and sorted(os.listdir(cache_dir)) == ['2.0.0']
+    with pytest.raises(ImportError):
+        ExampleCache(str(tmp_path / 'empty')).input_data_frame
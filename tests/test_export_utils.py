@@ -0,0 +1,71 @@
+import os
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from ExportUtils import SummaryExporter
+from OutputUtils import OutputStore
+
+PRIMARY_IDS = [0, 1001, 2002]
+N_PERIODS = 3
+
+
+def get_frames():
+    primary_ids = np.repeat(PRIMARY_IDS, N_PERIODS)
+    ids = {'primary_id': primary_ids, 'region': 'georgia', 'time_period': np.tile(np.arange(N_PERIODS), len(PRIMARY_IDS))}
+    df_out = pd.DataFrame({**ids, 'emission_co2e_subsector_total_agrc': primary_ids + 0.5})
+    df_in = pd.DataFrame({**ids, 'frac_agrc_rice': primary_ids / 10000.0})
+    return df_out, df_in
+
+
+def get_exporter(tmp_path, file_format='csv', df_in=None):
+    df_out, df_in_all = get_frames()
+    df_in = df_in_all if df_in is None else df_in
+    return SummaryExporter(
+        read_output=lambda primary_id: df_out[df_out['primary_id'] == primary_id],
+        read_input=lambda primary_id: df_in[df_in['primary_id'] == primary_id],
+        dir_pkg=str(tmp_path / 'package'),
+        file_stem='sisepuede_results_WIDE_INPUTS_OUTPUTS',
+        file_format=file_format,
+    )
+
+
+def test_streamed_export_matches_a_full_merge(tmp_path):
+    df_out, df_in = get_frames()
+    df_expected = pd.merge(df_out, df_in, how='left')
+
+    csv_path = get_exporter(tmp_path).export(PRIMARY_IDS)
+    pd.testing.assert_frame_equal(pd.read_csv(csv_path), df_expected)
+
+    store_path = get_exporter(tmp_path, file_format='parquet').export(PRIMARY_IDS)
+    df_store = OutputStore(store_path).read().sort_values(['primary_id', 'time_period']).reset_index(drop=True)
+    pd.testing.assert_frame_equal(df_store, df_expected, check_dtype=False)
+
+
+def test_primaries_without_inputs_or_outputs(tmp_path):
+    df_out, df_in = get_frames()
+    exporter = get_exporter(tmp_path, df_in=df_in[df_in['primary_id'] != 1001])
+    df_export = pd.read_csv(exporter.export(PRIMARY_IDS + [3003]))
+    assert sorted(df_export['primary_id'].unique()) == PRIMARY_IDS
+    assert df_export.loc[df_export['primary_id'] == 1001, 'frac_agrc_rice'].isna().all()
+
+    with pytest.raises(ValueError, match='No outputs'):
+        exporter.export([3003])
+    assert os.listdir(exporter.dir_pkg) == ['sisepuede_results_WIDE_INPUTS_OUTPUTS.csv']
+
+
+def test_export_package_writes_the_attribute_tables(tmp_path):
+    df_primary = pd.DataFrame({'primary_id': PRIMARY_IDS, 'strategy_id': [0, 1001, 2002]})
+    ssp = SimpleNamespace(
+        database=SimpleNamespace(db=SimpleNamespace(read_table=lambda table: pd.DataFrame({'strategy_id': [0, 1001, 2002]}))),
+        odpt_primary=SimpleNamespace(get_indexing_dataframe=lambda primary_ids: df_primary[df_primary['primary_id'].isin(primary_ids)]),
+    )
+    exporter = get_exporter(tmp_path)
+    exporter.export_package(ssp, [2002, 0])
+
+    assert sorted(os.listdir(exporter.dir_pkg)) == [
+        'ATTRIBUTE_PRIMARY.csv', 'ATTRIBUTE_STRATEGY.csv', 'sisepuede_results_WIDE_INPUTS_OUTPUTS.csv',
+    ]
+    assert pd.read_csv(os.path.join(exporter.dir_pkg, 'ATTRIBUTE_PRIMARY.csv'))['primary_id'].tolist() == [0, 2002]
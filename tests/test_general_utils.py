@@ -0,0 +1,45 @@
+import numpy as np
+import pandas as pd
+
+from GeneralUtils import InputSchema
+
+
+def get_frames():
+    df_example = pd.DataFrame({
+        'region': ['georgia', 'georgia'],
+        'time_period': [0, 1],
+        'frac_a': [0.2, 0.3],
+        'qty_b': [1.0, 2.0],
+    })
+    df_input = pd.DataFrame({
+        'time_period': [0, 1],
+        'region': ['croatia', 'croatia'],
+        'qty_b': [5, 6],
+        'extra_c': [9.0, 9.0],
+    })
+    return df_example, df_input
+
+
+def test_diff_lists_missing_extra_and_dtype_mismatches():
+    df_example, df_input = get_frames()
+    schema_diff = InputSchema(df_example).diff(df_input)
+    assert schema_diff['missing'] == ['frac_a']
+    assert schema_diff['extra'] == ['extra_c']
+    assert list(schema_diff['dtype_mismatch']) == ['qty_b']
+    assert schema_diff['dtype_mismatch']['qty_b'] == (np.dtype('float64'), np.dtype('int64'))
+
+
+def test_align_fills_missing_columns_and_casts_dtypes():
+    df_example, df_input = get_frames()
+    schema = InputSchema(df_example)
+
+    df_aligned, schema_diff = schema.align(df_input)
+    assert list(df_aligned.columns) == list(df_example.columns)
+    assert df_aligned['frac_a'].tolist() == [0.2, 0.3]
+    assert df_aligned['qty_b'].dtype == np.float64
+    assert df_aligned['region'].tolist() == ['croatia', 'croatia']
+    assert schema_diff == schema.diff(df_input)
+
+    df_kept, _ = schema.align(df_input, drop_extra=False, downcast_float32=True)
+    assert list(df_kept.columns) == list(df_example.columns) + ['extra_c']
+    assert (df_kept[['frac_a', 'qty_b', 'extra_c']].dtypes == np.float32).all()
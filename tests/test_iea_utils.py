@@ -0,0 +1,108 @@
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import REPO_DIR
+from IEAUtils import IEAIngestor, IEATarget
+
+IEA_DATA_DIR = os.path.join(REPO_DIR, 'iran', 'data')
+TIME_PERIODS = list(range(36))
+YEAR_0 = 2015
+
+TARGET_ELECTRICITY = IEATarget(
+    'electricity generation sources',
+    {
+        'Coal': 'frac_coal',
+        'Natural gas': 'frac_gas',
+        'Oil': 'frac_oil',
+        'Hydro': 'frac_renewable',
+        'Solar PV': 'frac_renewable',
+        'Wind': 'frac_renewable',
+    },
+    fields=['frac_coal', 'frac_gas', 'frac_oil', 'frac_renewable', 'frac_geothermal'],
+    calculate_proportion=True,
+)
+TARGET_CONSUMPTION = IEATarget(
+    'total final energy consumption',
+    {'Industry': 'consumption_industry', 'Residential': 'consumption_residential', 'Transport': 'consumption_transport'},
+    scale=0.001,
+)
+TARGETS = [TARGET_ELECTRICITY, TARGET_CONSUMPTION]
+
+
+def get_iea_file(dataset):
+    return os.path.join(IEA_DATA_DIR, f"International Energy Agency - {dataset} in Iran.csv")
+
+
+def pivot_single_region(dict_files, target):
+    """
+    The loop of the Iran data modifications notebook, for one region and one target: shares year by
+    year, categories mapped to fields, pivoted and filled backwards and forwards on the time periods.
+    """
+    df = dict_files[target.dataset].copy()
+    df = df.rename(columns={df.columns[0]: 'Tech'})
+    df['Tech'] = df['Tech'].str.strip()
+    df['Value'] = df['Value'].fillna(0.0)
+
+    if target.calculate_proportion:
+        df_years = []
+        for _, df_year in df.groupby('Year'):
+            df_year = df_year.copy()
+            df_year['Value'] = df_year['Value'] / df_year['Value'].sum()
+            df_years.append(df_year)
+        df = pd.concat(df_years)
+
+    df['field'] = df['Tech'].map(target.field_map)
+    df = df.dropna(subset=['field'])
+    df['Value'] = df['Value'] * target.scale
+    df_wide = df.pivot_table(index='Year', columns='field', values='Value', aggfunc='sum')
+    df_wide.index = df_wide.index - YEAR_0
+    df_wide = df_wide.reindex(index=TIME_PERIODS, columns=target.fields).bfill().ffill()
+    return df_wide.fillna(target.fill_value)
+
+
+@pytest.fixture
+def regions_dir(tmp_path):
+    """
+    Two regions: `iran` with all the IEA files, and `partial` with the electricity generation only.
+    """
+    for region in ('iran', 'partial'):
+        os.makedirs(tmp_path / region / 'data')
+    for target in TARGETS:
+        shutil.copy(get_iea_file(target.dataset), tmp_path / 'iran' / 'data')
+    shutil.copy(get_iea_file(TARGET_ELECTRICITY.dataset), tmp_path / 'partial' / 'data')
+    return str(tmp_path)
+
+
+def test_pivot_matches_notebook_loop(regions_dir):
+    ingestor = IEAIngestor(cache_dir=os.path.join(regions_dir, '.iea_cache'), year_0=YEAR_0)
+    df_wide = ingestor.build(ingestor.discover(regions_dir), TARGETS, TIME_PERIODS)
+
+    dict_files = {target.dataset: pd.read_csv(get_iea_file(target.dataset)) for target in TARGETS}
+    df_iran = df_wide[df_wide['region'] == 'iran'].set_index('time_period')
+    for target in TARGETS:
+        df_expected = pivot_single_region(dict_files, target)
+        np.testing.assert_allclose(df_iran[target.fields].to_numpy(), df_expected.to_numpy(), rtol=1e-12)
+
+
+def test_regions_without_a_dataset_keep_their_inputs(regions_dir):
+    ingestor = IEAIngestor(cache_dir=os.path.join(regions_dir, '.iea_cache'), year_0=YEAR_0)
+    df_wide = ingestor.build(ingestor.discover(regions_dir), TARGETS, TIME_PERIODS)
+    df_partial = df_wide[df_wide['region'] == 'partial']
+    assert df_partial[TARGET_CONSUMPTION.fields].isna().all().all()
+    assert df_partial['frac_geothermal'].eq(0.0).all()
+
+    fields = TARGET_ELECTRICITY.fields + TARGET_CONSUMPTION.fields
+    df_inputs = pd.DataFrame({
+        'region': np.repeat(['iran', 'partial'], len(TIME_PERIODS)),
+        'time_period': TIME_PERIODS * 2,
+        **{field: -1.0 for field in fields},
+    })
+    df_out = ingestor.apply(df_inputs, df_wide)
+    rows_partial = df_out['region'] == 'partial'
+    assert df_out.loc[rows_partial, TARGET_CONSUMPTION.fields].eq(-1.0).all().all()
+    assert df_out.loc[rows_partial, TARGET_ELECTRICITY.fields].ne(-1.0).all().all()
+    assert df_out.loc[~rows_partial, fields].ne(-1.0).all().all()
@@ -0,0 +1,64 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from ImpactUtils import StrategyImpacts
+
+FIELDS = ['emission_co2e_subsector_total_agrc', 'emission_co2e_subsector_total_waso']
+
+
+@pytest.fixture
+def df_out():
+    """
+    The baseline primary 0 and the strategy primary 1, one region and three time periods.
+    """
+    return pd.DataFrame({
+        'primary_id': [0, 0, 0, 1, 1, 1],
+        'region': 'croatia',
+        'time_period': [0, 1, 2, 0, 1, 2],
+        FIELDS[0]: [10.0, 10.0, 20.0, 10.0, 5.0, 10.0],
+        FIELDS[1]: [0.0, 4.0, 4.0, 1.0, 2.0, 6.0],
+    })
+
+
+def test_deltas_against_the_baseline(df_out):
+    impacts = StrategyImpacts(df_out)
+    assert impacts.fields == FIELDS
+
+    delta = impacts.deltas()
+    np.testing.assert_array_equal(delta[0], 0.0)
+    np.testing.assert_array_equal(delta[1, 0], [[0.0, 1.0], [-5.0, -2.0], [-10.0, 2.0]])
+
+    delta_percent = impacts.deltas(percent=True)
+    # The percent delta against a zero baseline is NaN
+    np.testing.assert_array_equal(delta_percent[1, 0], [[0.0, np.nan], [-50.0, -50.0], [-50.0, 50.0]])
+
+    df_delta = impacts.to_frame(delta, time_periods=[1, 2])
+    assert df_delta[['primary_id', 'time_period']].values.tolist() == [[0, 1], [0, 2], [1, 1], [1, 2]]
+
+
+def test_cumulative_summary(df_out):
+    df_summary = StrategyImpacts(df_out).summary(time_periods=[1, 2])
+    df_strategy = df_summary[df_summary['primary_id'] == 1].set_index('field')
+    assert df_strategy['baseline_primary_id'].eq(0).all()
+    assert df_strategy['total'].tolist() == [15.0, 8.0]
+    assert df_strategy['baseline_total'].tolist() == [30.0, 8.0]
+    assert df_strategy['delta'].tolist() == [-15.0, 0.0]
+    assert df_strategy['delta_percent'].tolist() == [-50.0, 0.0]
+
+
+def test_baselines_follow_the_primary_attribute_table(df_out):
+    # A second future, where the baseline is primary 2 and the strategy primary 3
+    df_future = df_out.assign(primary_id=df_out['primary_id'] + 2)
+    df_future[FIELDS] *= 2
+    df_primary = pd.DataFrame({'primary_id': [0, 1, 2, 3], 'strategy_id': [0, 6000, 0, 6000], 'future_id': [0, 0, 1, 1]})
+
+    impacts = StrategyImpacts(pd.concat([df_out, df_future], ignore_index=True), df_primary=df_primary)
+    assert impacts.baseline_primary_ids.tolist() == [0, 0, 2, 2]
+    np.testing.assert_array_equal(impacts.deltas()[3], 2 * impacts.deltas()[1])
+
+
+def test_duplicated_rows_are_rejected(df_out):
+    df_duplicated = pd.concat([df_out, df_out.iloc[[4]]], ignore_index=True)
+    with pytest.raises(ValueError, match='duplicated primary_id/region/time_period'):
+        StrategyImpacts(df_duplicated)
@@ -0,0 +1,66 @@
+import numpy as np
+import pandas as pd
+
+from OutputUtils import ColumnIndex, OutputStore
+
+COLUMNS = [
+    'primary_id',
+    'region',
+    'time_period',
+    'emission_co2e_subsector_total_agrc',
+    'emission_co2e_subsector_total_ippu',
+    'prod_ippu_cement_tonne',
+    'prod_ippu_cement_tonne_imported',
+    'prod_agrc_rice_tonne',
+    'emission_co2e_ch4_agrc_rice',
+]
+
+
+def test_column_index_matches_a_scan_of_the_names():
+    index = ColumnIndex(COLUMNS)
+    for prefix in ('emission_co2e_subsector_total', 'prod_', 'zzz'):
+        assert index.prefix(prefix) == [col for col in COLUMNS if col.startswith(prefix)]
+    for substring in ('prod_ippu_cement_tonne', 'ippu_cement', 'rice', '_co2e_ch4_'):
+        assert index.contains(substring) == [col for col in COLUMNS if substring in col]
+    assert index.subsector('AGRC') == ['emission_co2e_subsector_total_agrc', 'prod_agrc_rice_tonne', 'emission_co2e_ch4_agrc_rice']
+    assert index.regex(r'_tonne$') == ['prod_ippu_cement_tonne', 'prod_agrc_rice_tonne']
+
+    # Criteria are intersected, and the values of a criterion are united
+    assert index.select(prefix='prod_', subsector=['ippu', 'agrc'], contains='tonne') == \
+        ['prod_ippu_cement_tonne', 'prod_ippu_cement_tonne_imported', 'prod_agrc_rice_tonne']
+    assert index.select(columns=['prod_agrc_rice_tonne', 'unknown', 'region']) == ['region', 'prod_agrc_rice_tonne']
+    assert index.select() == COLUMNS
+
+
+def get_output_frame():
+    n_periods = 3
+    primary_ids = np.repeat([0, 1, 2], n_periods)
+    df = pd.DataFrame({
+        'primary_id': primary_ids,
+        'region': 'georgia',
+        'time_period': np.tile(np.arange(n_periods), 3),
+    })
+    for i, col in enumerate(COLUMNS[3:]):
+        df[col] = primary_ids * 100.0 + i
+    return df
+
+
+def test_output_store_reads_partitions_and_columns(tmp_path):
+    df = get_output_frame()
+    csv_file = str(tmp_path / 'sisepuede_outputs.csv')
+    df.to_csv(csv_file, index=False)
+
+    store = OutputStore.from_csv(csv_file, chunksize=4)
+    assert store.primary_ids == ['0', '1', '2'] and store.columns == COLUMNS
+    df_read = store.read(primary_ids=[2, 0], prefix='emission_co2e_subsector_total')
+    expected = df[df['primary_id'].isin([0, 2])][COLUMNS[:5]]
+    pd.testing.assert_frame_equal(
+        df_read.sort_values(['primary_id', 'time_period']).reset_index(drop=True),
+        expected.reset_index(drop=True),
+    )
+    assert list(store.read(columns=['prod_agrc_rice_tonne'], include_ids=False).columns) == ['prod_agrc_rice_tonne']
+
+    # The store is reused while the CSV is unchanged and rebuilt when it changes
+    assert OutputStore.from_csv(csv_file).store_dir == store.store_dir
+    df[df['primary_id'] < 2].to_csv(csv_file, index=False)
+    assert OutputStore.from_csv(csv_file).primary_ids == ['0', '1']
@@ -0,0 +1,57 @@
+import glob
+import json
+import os
+import shutil
+
+import pandas as pd
+import yaml
+
+from conftest import CROSSWALK_FILE, REGION_DIR
+from PipelineUtils import discover_regions, main
+
+
+def write_config(region_dir, crosswalk_file, strategies=None):
+    os.makedirs(os.path.join(region_dir, 'config_files'), exist_ok=True)
+    config = {
+        'country_name': os.path.basename(region_dir),
+        'ssp_input_file_name': 'sisepuede_inputs.csv',
+        'ssp_transformation_cw': crosswalk_file,
+        'strategies': strategies or [],
+    }
+    with open(os.path.join(region_dir, 'config_files', f"{os.path.basename(region_dir)}_config.yaml"), 'w') as file:
+        yaml.safe_dump(config, file)
+
+
+def test_cli_prepares_regions_and_reports_failures(tmp_path):
+    # georgia can be prepared, armenia's crosswalk is missing
+    georgia_dir = tmp_path / 'georgia'
+    shutil.copytree(os.path.join(REGION_DIR, 'transformations'), georgia_dir / 'transformations')
+    for path in glob.glob(str(georgia_dir / 'transformations' / '*_strategy_*.yaml')):
+        os.remove(path)
+    os.makedirs(georgia_dir / 'data')
+    shutil.copy(os.path.join(REGION_DIR, 'data', CROSSWALK_FILE), georgia_dir / 'data')
+    write_config(str(georgia_dir), CROSSWALK_FILE, strategies=[
+        {'strategy_group': 'PFLO', 'description': 'NDC unconditional', 'yaml_file_suffix': 'NDC_Uncon'},
+        {'strategy_group': 'PFLO', 'description': 'NDC net zero', 'yaml_file_suffix': 'net_zero', 'custom_id': 6006, 'update_flag': True},
+    ])
+    write_config(str(tmp_path / 'armenia'), 'missing_transformation_cw.xlsx')
+    os.makedirs(tmp_path / 'notes')
+    assert discover_regions(str(tmp_path)) == [str(tmp_path / 'armenia'), str(georgia_dir)]
+
+    summary_file = str(tmp_path / 'summary.json')
+    exit_code = main([str(tmp_path / 'armenia'), str(georgia_dir), '--skip-align', '--max-workers', '1', '--summary-file', summary_file])
+    assert exit_code == 1
+
+    with open(summary_file) as file:
+        summary = {row['region']: row for row in json.load(file)}
+    assert summary['georgia']['status'] == 'ok'
+    assert summary['armenia']['status'] == 'failed' and summary['armenia']['failed_stage'] == 'yaml'
+    assert os.path.exists(tmp_path / 'armenia' / 'pipeline.log')
+
+    assert sorted(os.path.basename(path) for path in glob.glob(str(georgia_dir / 'transformations' / '*_strategy_*.yaml'))) == \
+        sorted(os.path.basename(path) for path in glob.glob(os.path.join(REGION_DIR, 'transformations', '*_strategy_*.yaml')))
+    df_strategies = pd.read_csv(georgia_dir / 'transformations' / 'strategy_definitions.csv').set_index('strategy_code')
+    assert df_strategies.at['PFLO:NDC_UNCON', 'strategy_id'] == 6007
+    df_committed = pd.read_csv(os.path.join(REGION_DIR, 'transformations', 'strategy_definitions.csv')).set_index('strategy_code')
+    assert sorted(df_strategies.at['PFLO:NET_ZERO', 'transformation_specification'].split('|')) == \
+        sorted(df_committed.at['PFLO:NET_ZERO', 'transformation_specification'].split('|'))
@@ -0,0 +1,212 @@
+import itertools
+import multiprocessing
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+import yaml
+
+from CacheUtils import ResultCache
+from OutputUtils import OutputStore
+from ScenarioUtils import get_strategy_hashes, merge_shards, run_cached_scenarios, run_shard, run_sharded_scenarios, split_shards
+
+TIME_PERIODS = 4
+
+
+def get_primary_id(strategy, design, future):
+    return strategy * 100 + design * 10 + future
+
+
+class FakeSession:
+    """
+    Stands in for a SISEPUEDE session: every strategy gets one primary per design and future, and
+    the outputs of a primary are derived from its ID.
+    """
+
+    key_design = 'design_id'
+    key_future = 'future_id'
+    key_primary = 'primary_id'
+    key_strategy = 'strategy_id'
+
+    def __init__(self, failed_strategies=()):
+        self.failed_strategies = set(failed_strategies)
+        self.projected = []
+        self.df_primary = pd.DataFrame(columns=[self.key_primary, self.key_design, self.key_future, self.key_strategy])
+        self.odpt_primary = self
+
+    def project_scenarios(self, dict_scens, save_inputs=True):
+        strategies = dict_scens[self.key_strategy]
+        failed = self.failed_strategies.intersection(strategies)
+        if failed:
+            raise RuntimeError(f"strategies {sorted(failed)} failed")
+        self.projected.append(list(strategies))
+        rows = [
+            {self.key_primary: get_primary_id(strategy, design, future), self.key_design: design,
+             self.key_future: future, self.key_strategy: strategy}
+            for strategy, design, future in itertools.product(strategies, dict_scens[self.key_design], dict_scens[self.key_future])
+        ]
+        self.df_primary = pd.concat([self.df_primary, pd.DataFrame(rows)], ignore_index=True).astype(int)
+
+    def get_indexing_dataframe(self, primary_ids):
+        return self.df_primary[self.df_primary[self.key_primary].isin(primary_ids)].reset_index(drop=True)
+
+    def read_frame(self, field):
+        primary_ids = self.df_primary[self.key_primary].to_numpy()
+        return pd.DataFrame({
+            self.key_primary: np.repeat(primary_ids, TIME_PERIODS),
+            'time_period': np.tile(np.arange(TIME_PERIODS), len(primary_ids)),
+            field: np.repeat(primary_ids, TIME_PERIODS) * 10.0 + np.tile(np.arange(TIME_PERIODS), len(primary_ids)),
+        })
+
+    def read_output(self, primary_ids):
+        return self.read_frame('emission_co2e')
+
+    def read_input(self, primary_ids):
+        return self.read_frame('frac_input')
+
+
+class FakeSessionFactory:
+    """
+    Picklable session factory of the sharding tests; the shards with a failed strategy raise.
+    """
+
+    def __init__(self, failed_strategies=()):
+        self.failed_strategies = failed_strategies
+
+    def __call__(self, shard_id):
+        return FakeSession(self.failed_strategies)
+
+
+def test_split_shards_deals_strategies_in_turn():
+    assert split_shards([0, 6000, 6001, 6002, 6003], 2) == [[0, 6001, 6003], [6000, 6002]]
+    assert split_shards([0, 6000], 4) == [[0], [6000]]
+    assert split_shards([0, 6000], 0) == [[0, 6000]]
+
+
+def test_merge_shards_builds_one_partitioned_store(tmp_path):
+    shards = split_shards([0, 6000, 6001], 2)
+    results = [
+        run_shard(FakeSessionFactory(), shard_id, shard, str(tmp_path / f"shard_{shard_id}"), futures=(0, 1))
+        for shard_id, shard in enumerate(shards)
+    ]
+    assert [result['status'] for result in results] == ['ok', 'ok']
+
+    merged = merge_shards(results, str(tmp_path / 'merged'))
+    df_out = OutputStore(merged['outputs']).read()
+    primary_ids = sorted(get_primary_id(strategy, 0, future) for strategy in (0, 6000, 6001) for future in (0, 1))
+    assert sorted(df_out['primary_id'].unique()) == primary_ids
+    assert len(df_out) == len(primary_ids) * TIME_PERIODS
+    assert sorted(OutputStore(merged['inputs']).read()['primary_id'].unique()) == primary_ids
+    assert pd.read_csv(merged['attribute_primary'])['primary_id'].tolist() == primary_ids
+
+
+@pytest.mark.skipif('fork' not in multiprocessing.get_all_start_methods(), reason="requires the fork start method")
+def test_failed_shard_is_reported_and_left_out_of_the_merge(tmp_path):
+    output_dir = str(tmp_path / 'run')
+    # The shards are [0, 6001] and [6000]; the first one fails
+    summary, stats = run_sharded_scenarios(FakeSessionFactory(failed_strategies=[6001]), [0, 6000, 6001], output_dir,
+                                           n_shards=2, max_workers=2)
+
+    assert summary['strategies'].tolist() == ['0 6001', '6000']
+    assert summary['status'].tolist() == ['failed', 'ok']
+    assert summary.at[0, 'error'].startswith('project: RuntimeError')
+    assert os.path.exists(os.path.join(output_dir, 'shard_0', 'shard.log'))
+
+    df_out = OutputStore(stats['merged']['outputs']).read()
+    assert sorted(df_out['primary_id'].unique()) == [get_primary_id(6000, 0, 0)]
+    assert pd.read_csv(stats['merged']['attribute_primary'])['strategy_id'].tolist() == [6000]
+
+
+def write_code(yaml_path, transformation_code, magnitude=1.0):
+    with open(yaml_path, 'w') as file:
+        yaml.safe_dump({'identifiers': {'transformation_code': transformation_code}, 'parameters': {'magnitude': magnitude}}, file)
+
+
+@pytest.fixture
+def transformations(tmp_path):
+    """
+    A transformations directory with BASE and two strategies that share one transformation.
+    """
+    dir_transformations = tmp_path / 'transformations'
+    dir_transformations.mkdir()
+    write_code(dir_transformations / 'transformation_a.yaml', 'TX:A')
+    write_code(dir_transformations / 'transformation_b.yaml', 'TX:B')
+    write_code(dir_transformations / 'transformation_shared.yaml', 'TX:SHARED')
+    pd.DataFrame({
+        'strategy_id': [0, 6000, 6001],
+        'strategy_code': ['BASE', 'PFLO:A', 'PFLO:B'],
+        'strategy': ['base', 'a', 'b'],
+        'description': '',
+        'transformation_specification': ['TX:BASE', 'TX:A|TX:SHARED', 'TX:B|TX:SHARED'],
+    }).to_csv(dir_transformations / 'strategy_definitions.csv', index=False)
+    return str(dir_transformations)
+
+
+def test_editing_a_yaml_changes_the_hash_of_its_strategies_only(transformations):
+    csv_file = f"{transformations}/strategy_definitions.csv"
+    hashes = get_strategy_hashes(csv_file, transformations)
+    write_code(f"{transformations}/transformation_a.yaml", 'TX:A', magnitude=0.5)
+    edited = get_strategy_hashes(csv_file, transformations)
+    assert [strategy for strategy in hashes if hashes[strategy] != edited[strategy]] == [6000]
+
+    write_code(f"{transformations}/transformation_shared.yaml", 'TX:SHARED', magnitude=0.5)
+    shared_edited = get_strategy_hashes(csv_file, transformations)
+    assert [strategy for strategy in edited if edited[strategy] != shared_edited[strategy]] == [6000, 6001]
+
+
+def test_cached_scenarios_rerun_only_the_edited_strategy(transformations, tmp_path):
+    strategies = [0, 6000, 6001]
+    df_inputs = pd.DataFrame({'time_period': range(TIME_PERIODS), 'frac_input': 0.5})
+    cache = ResultCache(str(tmp_path / 'cache'))
+
+    ssp = FakeSession()
+    df_first, status = run_cached_scenarios(ssp, strategies, cache, df_inputs, transformations)
+    assert status == {'hits': [], 'misses': strategies}
+    assert sorted(df_first['primary_id'].unique()) == [get_primary_id(strategy, 0, 0) for strategy in strategies]
+
+    ssp = FakeSession()
+    df_second, status = run_cached_scenarios(ssp, strategies, cache, df_inputs, transformations)
+    assert status == {'hits': strategies, 'misses': []} and ssp.projected == []
+    pd.testing.assert_frame_equal(df_second, df_first)
+
+    write_code(f"{transformations}/transformation_b.yaml", 'TX:B', magnitude=0.5)
+    ssp = FakeSession()
+    df_third, status = run_cached_scenarios(ssp, strategies, cache, df_inputs, transformations)
+    assert status == {'hits': [0, 6000], 'misses': [6001]} and ssp.projected == [[6001]]
+    pd.testing.assert_frame_equal(df_third, df_first)
+
+
+def get_frame(value, n_rows=100):
+    return pd.DataFrame({'primary_id': np.arange(n_rows), 'value': np.full(n_rows, float(value))})
+
+
+def test_result_cache_evicts_least_recently_used_entries(tmp_path):
+    cache = ResultCache(str(tmp_path / 'cache'), max_entries=2)
+    cache.put('c', get_frame(0))
+    cache.put('b', get_frame(1))
+    # Reading c makes b the least recently used entry
+    assert cache.get('c') is not None
+    cache.put('a', get_frame(2))
+
+    assert 'b' not in cache and cache.get('b') is None
+    assert cache.get('c')['value'].eq(0).all() and cache.get('a')['value'].eq(2).all()
+    assert (cache.hits, cache.misses) == (3, 1)
+
+
+def test_result_cache_stays_within_max_bytes(tmp_path):
+    cache = ResultCache(str(tmp_path / 'cache'))
+    cache.put('probe', get_frame(0))
+    entry_size = cache.load_index()['probe']['size']
+    cache.clear()
+
+    cache = ResultCache(str(tmp_path / 'cache'), max_bytes=int(entry_size * 2.5))
+    for key in 'cba':
+        cache.put(key, get_frame(0))
+    index = cache.load_index()
+    assert sorted(index) == ['a', 'b']
+    assert sum(entry['size'] for entry in index.values()) <= cache.max_bytes
+
+    # An entry over the limit on its own is kept until the next one is added
+    cache.put('large', get_frame(0, n_rows=10000))
+    assert sorted(cache.load_index()) == ['large']
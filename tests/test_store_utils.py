@@ -0,0 +1,48 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from StoreUtils import DatasetStore
+
+
+def get_frame():
+    return pd.DataFrame({
+        'region': ['georgia', 'georgia', None],
+        'time_period': np.arange(3),
+        'frac_a': [0.1, 0.2, 0.3],
+        'qty_b': [1.0, 2.0, np.nan],
+    })
+
+
+def test_versions_round_trip(tmp_path):
+    store = DatasetStore(str(tmp_path / 'store'))
+    df = get_frame()
+    store.add_frame(df, 'updated_georgia_input_data_20240105_1200')
+    df_indexed = df.set_index(pd.Index([10, 20, 30], name='row'))
+    store.add_frame(df_indexed, 'indexed')
+
+    # A new store reads the records from disk
+    store = DatasetStore(str(tmp_path / 'store'))
+    pd.testing.assert_frame_equal(store.load('latest'), df)
+    pd.testing.assert_frame_equal(store.load('20240105_1200', columns=['frac_a']), df[['frac_a']])
+    pd.testing.assert_frame_equal(store.load('indexed', mmap=False), df_indexed)
+    np.testing.assert_array_equal(store.load_array('indexed', 'qty_b'), df['qty_b'].to_numpy())
+    assert store.list_versions()['name'].tolist() == ['indexed', 'updated_georgia_input_data_20240105_1200']
+
+
+def test_unchanged_columns_are_stored_once_and_diffed_from_records(tmp_path):
+    store = DatasetStore(str(tmp_path / 'store'))
+    df = get_frame()
+    store.add_frame(df, 'v1')
+    n_packs = len(os.listdir(store.packs_dir))
+
+    df_v2 = df.drop(columns='qty_b').assign(frac_a=[0.1, 0.2, 0.4], frac_c=0.5)
+    record = store.add_frame(df_v2, 'v2')
+    assert len(os.listdir(store.packs_dir)) == n_packs + 1
+    packs_v1 = {entry['pack'] for entry in store.get_version('v1')['columns']}
+    shared = [entry['name'] for entry in record['columns'] if entry['pack'] in packs_v1]
+    assert shared == ['region', 'time_period']
+
+    assert store.diff('v1', 'v2') == {'changed': ['frac_a'], 'added': ['frac_c'], 'removed': ['qty_b']}
+    assert store.diff('v1', 'v1') == {'changed': [], 'added': [], 'removed': []}
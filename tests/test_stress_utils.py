@@ -0,0 +1,62 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from StressUtils import StressedInputGenerator, read_future
+
+SPEC = [
+    {'prefix': 'elasticity_', 'type': 'multiplicative', 'low': 0.8, 'high': 1.2, 'per_column': True},
+    {'prefix': 'frac_waso_non_recycled_', 'type': 'multiplicative', 'low': 0.5, 'high': 1.5, 'per_column': True},
+    {'prefix': 'qty_', 'type': 'trend', 'low': -0.2, 'high': 0.2, 'start_period': 2},
+]
+
+
+@pytest.fixture
+def df_inputs():
+    n_periods = 6
+    return pd.DataFrame({
+        'region': 'croatia',
+        'time_period': np.arange(n_periods),
+        'elasticity_a': np.linspace(1.0, 2.0, n_periods),
+        'elasticity_b': 0.5,
+        'frac_waso_non_recycled_food': 0.5,
+        'frac_waso_non_recycled_paper': 0.3,
+        'frac_waso_non_recycled_wood': 0.2,
+        'qty_waso_total': np.linspace(100.0, 150.0, n_periods),
+    })
+
+
+def generate(df_inputs, output_file, chunk_size, n_futures=9):
+    generator = StressedInputGenerator(df_inputs, SPEC, chunk_size=chunk_size, seed=3)
+    draws = generator.generate(n_futures, str(output_file))
+    return draws, [read_future(str(output_file), future_id) for future_id in range(n_futures + 1)]
+
+
+def test_futures_do_not_depend_on_the_chunk_size(df_inputs, tmp_path):
+    draws_small, futures_small = generate(df_inputs, tmp_path / 'small.parquet', chunk_size=4)
+    draws_large, futures_large = generate(df_inputs, tmp_path / 'large.parquet', chunk_size=64)
+
+    pd.testing.assert_frame_equal(draws_small, draws_large)
+    for df_small, df_large in zip(futures_small, futures_large):
+        pd.testing.assert_frame_equal(df_small, df_large)
+    # Future 0 is the unperturbed frame, the others are not
+    pd.testing.assert_frame_equal(futures_small[0], df_inputs)
+    assert not np.allclose(futures_small[1]['elasticity_a'], df_inputs['elasticity_a'])
+
+
+def test_npy_and_parquet_futures_match(df_inputs, tmp_path):
+    _, futures_parquet = generate(df_inputs, tmp_path / 'futures.parquet', chunk_size=4)
+    _, futures_npy = generate(df_inputs, tmp_path / 'futures.npy', chunk_size=4)
+    for df_parquet, df_npy in zip(futures_parquet, futures_npy):
+        assert list(df_npy.columns) == list(df_inputs.columns)
+        pd.testing.assert_frame_equal(df_npy, df_parquet)
+
+
+def test_fraction_groups_are_renormalized(df_inputs, tmp_path):
+    _, futures = generate(df_inputs, tmp_path / 'futures.parquet', chunk_size=4)
+    group = [col for col in df_inputs.columns if col.startswith('frac_waso_non_recycled_')]
+    for df in futures[1:]:
+        np.testing.assert_allclose(df[group].sum(axis=1), 1.0)
+        assert ((df[group] >= 0.0) & (df[group] <= 1.0)).all().all()
+        # The draws are per column, so the shares move away from the inputs
+        assert not np.allclose(df[group].to_numpy(), df_inputs[group].to_numpy())
@@ -0,0 +1,82 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from SweepUtils import STRATEGY_MAPPING_FILE, MagnitudeSweep, load_strategy_registry
+from TransformationUtils import ExcelYAMLHandler, StrategyCSVHandler
+
+
+@pytest.fixture
+def handler(region_copy):
+    excel_file, yaml_directory = region_copy
+    return ExcelYAMLHandler(excel_file, yaml_directory)
+
+
+def test_unseeded_latin_hypercube_reloads_same_scalars(handler, tmp_path):
+    sweep = MagnitudeSweep.from_crosswalk(handler, name='sweep_a')
+    sweep.latin_hypercube(20, bounds=(0.5, 1.5))
+    record_file = str(tmp_path / 'sweep_a.yaml')
+    sweep.save(record_file)
+    assert os.path.exists(str(tmp_path / 'sweep_a.npy'))
+
+    id_registry = load_strategy_registry()
+    loaded = MagnitudeSweep.load(record_file, handler, id_registry=id_registry)
+    assert np.array_equal(loaded.scalars, sweep.scalars)
+    assert np.array_equal(loaded.strategy_ids, sweep.strategy_ids)
+    assert loaded.transformation_codes == sweep.transformation_codes
+    # The IDs of the loaded sweep are reserved, so a new sweep gets the next ones
+    assert id_registry.next_id('SWEEP') == sweep.strategy_ids[-1] + 1
+
+
+def test_seeded_latin_hypercube_is_rebuilt_from_its_definition(handler, tmp_path):
+    sweep = MagnitudeSweep.from_crosswalk(handler, name='sweep_b')
+    sweep.latin_hypercube(10, bounds=(0.5, 1.5), seed=7)
+    record_file = str(tmp_path / 'sweep_b.yaml')
+    sweep.save(record_file)
+    assert not os.path.exists(str(tmp_path / 'sweep_b.npy'))
+
+    loaded = MagnitudeSweep.load(record_file, handler)
+    assert np.array_equal(loaded.scalars, sweep.scalars)
+
+
+def test_grid_over_max_samples_raises(handler):
+    sweep = MagnitudeSweep.from_crosswalk(handler, name='sweep_c')
+    with pytest.raises(ValueError, match='max_samples'):
+        sweep.grid([0.5, 1.0, 1.5], max_samples=3 ** sweep.n_transformations - 1)
+    assert sweep.n_samples == 0
+
+
+def test_sweeps_of_a_region_share_its_registry(handler):
+    csv_file = os.path.join(handler.yaml_directory, 'strategy_definitions.csv')
+    df = pd.read_csv(csv_file)
+    df.loc[len(df)] = {'strategy_id': 100000, 'strategy_code': 'SWEEP:OLD_0', 'strategy': 'old_0'}
+    df.to_csv(csv_file, index=False)
+
+    sweep_a = MagnitudeSweep.from_crosswalk(handler, name='sweep_a')
+    sweep_a.latin_hypercube(3, seed=0)
+    sweep_b = MagnitudeSweep.from_crosswalk(handler, name='sweep_b')
+    sweep_b.latin_hypercube(3, seed=1)
+    assert sweep_a.strategy_ids.tolist() == [100001, 100002, 100003]
+    assert sweep_b.strategy_ids.tolist() == [100004, 100005, 100006]
+
+
+def test_materialized_strategies_are_added_to_the_csv(handler):
+    csv_file = os.path.join(handler.yaml_directory, 'strategy_definitions.csv')
+    n_rows = len(pd.read_csv(csv_file))
+    sweep = MagnitudeSweep.from_crosswalk(handler, name='sweep_d')
+    sweep.latin_hypercube(4, seed=0)
+    strategy_rows = sweep.materialize([1, 3])
+
+    csv_handler = StrategyCSVHandler(csv_file, handler.yaml_directory, STRATEGY_MAPPING_FILE, {})
+    assert csv_handler.add_strategy_rows(strategy_rows)['strategy_id'].tolist() == sweep.strategy_ids[[1, 3]].tolist()
+    df = pd.read_csv(csv_file)
+    assert len(df) == n_rows + 2
+    assert df['transformation_specification'].iloc[-1] == sweep[3].transformation_specification
+    for transformation in sweep[3].get_transformations():
+        assert os.path.exists(os.path.join(handler.yaml_directory, transformation.get_yaml_name()))
+
+    # Rows already in the CSV are rejected and nothing is written
+    assert csv_handler.add_strategy_rows(strategy_rows) is None
+    assert len(pd.read_csv(csv_file)) == n_rows + 2
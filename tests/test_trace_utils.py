@@ -0,0 +1,66 @@
+import json
+import threading
+
+import pytest
+
+from TraceUtils import Tracer
+
+
+def read_events(jsonl_file):
+    with open(jsonl_file) as file:
+        return [json.loads(line) for line in file]
+
+
+def test_capture_collects_counters_stages_and_events(tmp_path):
+    tracer = Tracer(logger_name='test_capture')
+    jsonl_file = str(tmp_path / 'run.jsonl')
+    with tracer.capture('process', jsonl_file=jsonl_file) as run:
+        with tracer.stage('outer'):
+            with tracer.stage('inner'):
+                tracer.count('yaml_written', 2)
+                tracer.warning("Missing file", event='yaml_not_found', yaml_name='a.yaml')
+
+    assert run['summary']['counters'] == {'yaml_written': 2}
+    assert set(run['summary']['stages']) == {'outer', 'outer/inner'}
+    events = read_events(jsonl_file)
+    assert [event['event'] for event in events] == ['run_start', 'yaml_not_found', 'stage', 'stage', 'run_end']
+    assert all(event['run_id'] == run['id'] for event in events)
+    assert events[1]['stage'] == 'outer/inner' and events[1]['yaml_name'] == 'a.yaml'
+
+
+def test_reserved_fields_are_rejected(tmp_path):
+    tracer = Tracer(logger_name='test_reserved', jsonl_file=str(tmp_path / 'events.jsonl'))
+    for field in ('stage', 'run_id', 'time'):
+        with pytest.raises(ValueError, match='reserved'):
+            tracer.info("Message", event='pipeline_stage', **{field: 'value'})
+    assert not (tmp_path / 'events.jsonl').exists()
+
+
+def test_events_and_captures_from_several_threads(tmp_path):
+    tracer = Tracer(logger_name='test_threads', jsonl_file=str(tmp_path / 'events.jsonl'))
+    n_threads, n_events = 4, 200
+    errors = []
+
+    def work(thread):
+        try:
+            with tracer.capture(f'thread_{thread}', jsonl_file=str(tmp_path / f'thread_{thread}.jsonl')):
+                for i in range(n_events):
+                    tracer.count('events')
+                    tracer.debug(f"Event {i}", event='work', thread=thread)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=work, args=(thread,)) for thread in range(n_threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert tracer.counters['events'] == n_threads * n_events
+    events = read_events(str(tmp_path / 'events.jsonl'))
+    assert sum(event['event'] == 'work' for event in events) == n_threads * n_events
+    for thread in range(n_threads):
+        # The file of a capture gets at least the events of its own thread
+        work_events = [event for event in read_events(str(tmp_path / f'thread_{thread}.jsonl')) if event['event'] == 'work']
+        assert sum(event['thread'] == thread for event in work_events) == n_events
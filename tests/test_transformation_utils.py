@@ -0,0 +1,205 @@
+import filecmp
+import glob
+import json
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+import pytest
+import yaml
+
+from conftest import REGION_DIR, REPO_DIR
+from TraceUtils import tracer
+from TransformationUtils import ExcelYAMLHandler, StrategyCSVHandler, StrategyIDRegistry, TransformationDirectoryIndex
+
+STRATEGY_MAPPING_FILE = os.path.join(REPO_DIR, 'utils', 'strategy_mapping.yaml')
+
+
+def get_strategy_files(yaml_directory):
+    return sorted(os.path.basename(path) for path in glob.glob(os.path.join(yaml_directory, '*_strategy_*.yaml')))
+
+
+def assert_matches_committed(yaml_directory):
+    committed_directory = os.path.join(REGION_DIR, 'transformations')
+    committed = get_strategy_files(committed_directory)
+    assert get_strategy_files(yaml_directory) == committed
+    _, mismatch, errors = filecmp.cmpfiles(committed_directory, yaml_directory, committed, shallow=False)
+    assert mismatch == [] and errors == []
+
+
+def write_code(yaml_path, transformation_code):
+    with open(yaml_path, 'w') as file:
+        yaml.safe_dump({'identifiers': {'transformation_code': transformation_code}}, file)
+
+
+def test_strategy_yamls_match_committed_files(region_copy):
+    excel_file, yaml_directory = region_copy
+    ExcelYAMLHandler(excel_file, yaml_directory).process_yaml_files()
+    assert_matches_committed(yaml_directory)
+
+
+def test_unchanged_strategy_yamls_are_skipped(region_copy):
+    excel_file, yaml_directory = region_copy
+    first = ExcelYAMLHandler(excel_file, yaml_directory).process_yaml_files()
+    assert first['written'] > 0 and first['skipped'] == 0
+
+    # A generated file edited by hand is written again, the others are skipped
+    edited_file = os.path.join(yaml_directory, get_strategy_files(yaml_directory)[0])
+    with open(edited_file, 'a') as file:
+        file.write('# edited\n')
+    second = ExcelYAMLHandler(excel_file, yaml_directory).process_yaml_files()
+    assert second == {'written': 1, 'skipped': first['written'] - 1, 'removed': 0}
+    assert_matches_committed(yaml_directory)
+
+
+def test_orphaned_strategy_yamls_are_removed(region_copy):
+    excel_file, yaml_directory = region_copy
+    handler = ExcelYAMLHandler(excel_file, yaml_directory)
+    handler.process_yaml_files()
+
+    # A file generated by an earlier run for a strategy that is no longer in the crosswalk
+    orphan_file = os.path.join(yaml_directory, 'transformation_test_strategy_OLD.yaml')
+    write_code(orphan_file, 'TX:TEST_OLD')
+    with open(handler.manifest_file) as file:
+        manifest = json.load(file)
+    manifest['outputs']['transformation_test_strategy_OLD.yaml'] = {'input_hash': 'old', 'output_hash': 'old'}
+    with open(handler.manifest_file, 'w') as file:
+        json.dump(manifest, file)
+
+    summary = ExcelYAMLHandler(excel_file, yaml_directory).process_yaml_files()
+    assert summary['removed'] == 1 and summary['written'] == 0
+    assert not os.path.exists(orphan_file)
+
+
+def test_directory_index_picks_up_files_rewritten_in_place(tmp_path):
+    yaml_path = tmp_path / 'transformation_test_strategy_A.yaml'
+    write_code(yaml_path, 'TX:TEST_A')
+    index = TransformationDirectoryIndex(str(tmp_path))
+    assert index.get_transformation_codes('strategy_A') == ['TX:TEST_A']
+
+    # Same file name and directory entry, new content and size
+    write_code(yaml_path, 'TX:TEST_A_REVISED')
+    assert index.get_transformation_codes('strategy_A') == ['TX:TEST_A_REVISED']
+
+    write_code(tmp_path / 'transformation_other_strategy_A.yaml', 'TX:OTHER_A')
+    assert sorted(index.get_transformation_codes('strategy_A')) == ['TX:OTHER_A', 'TX:TEST_A_REVISED']
+
+
+def test_transformation_specification_reads_only_the_strategy_files(tmp_path):
+    for suffix in ('A', 'B', 'C'):
+        write_code(tmp_path / f'transformation_test_strategy_{suffix}.yaml', f'TX:TEST_{suffix}')
+    write_code(tmp_path / 'transformation_shared_shared_A_B.yaml', 'TX:SHARED_SHARED_A_B')
+    handler = StrategyCSVHandler(
+        str(tmp_path / 'strategy_definitions.csv'), str(tmp_path), STRATEGY_MAPPING_FILE,
+        {'strategy_A': ['TX:TEST_A', 'TX:SHARED_SHARED_A_B'], 'strategy_C': ['TX:TEST_C']},
+    )
+
+    parsed = tracer.counters['yaml_parsed']
+    assert handler.get_transformation_specification('A') == 'TX:SHARED_SHARED_A_B|TX:TEST_A'
+    # The strategy's own file and the shared file, not the files of B and C
+    assert tracer.counters['yaml_parsed'] - parsed == 2
+    assert handler.get_transformation_specification('C') == 'TX:TEST_C'
+    assert tracer.counters['yaml_parsed'] - parsed == 3
+
+
+@pytest.fixture
+def strategy_csv(tmp_path):
+    """
+    An empty strategy CSV and a transformations directory with one YAML per strategy.
+    """
+    yaml_directory = tmp_path / 'transformations'
+    yaml_directory.mkdir()
+    for suffix in ('A', 'B', 'C', 'D'):
+        write_code(yaml_directory / f'transformation_test_strategy_{suffix}.yaml', f'TX:TEST_{suffix}')
+    return str(tmp_path / 'strategy_definitions.csv'), str(yaml_directory)
+
+
+def test_rejected_batch_leaves_csv_unchanged(strategy_csv):
+    csv_file, yaml_directory = strategy_csv
+    handler = StrategyCSVHandler(csv_file, yaml_directory, STRATEGY_MAPPING_FILE, {'strategy_A': ['TX:TEST_A']})
+    handler.add_strategies([('PFLO', 'Strategy A', 'A')])
+    with open(csv_file, 'rb') as file:
+        content = file.read()
+
+    # The second strategy reuses the code of the first one, so neither is added
+    assert handler.add_strategies([('PFLO', 'Strategy B', 'B'), ('PFLO', 'Strategy A again', 'A')]) is None
+    with open(csv_file, 'rb') as file:
+        assert file.read() == content
+
+
+def test_unreadable_csv_is_not_overwritten(strategy_csv):
+    csv_file, yaml_directory = strategy_csv
+    with open(csv_file, 'w') as file:
+        file.write('strategy_id\n"unterminated')
+
+    handler = StrategyCSVHandler(csv_file, yaml_directory, STRATEGY_MAPPING_FILE, {})
+    assert handler.data is None
+    assert handler.add_strategy('PFLO', 'Strategy A', 'A') is None
+    with open(csv_file) as file:
+        assert file.read() == 'strategy_id\n"unterminated'
+
+
+def test_registry_shares_ids_across_groups_of_a_range():
+    registry = StrategyIDRegistry({'AGRC': '1000-1003', 'LNDU': '1000-1003', 'PFLO': '6000-6999'}, [1001])
+
+    assert registry.allocate('AGRC') == 1000
+    # 1001 is already used and 1000 was taken by AGRC
+    assert registry.allocate('LNDU') == 1002
+    assert registry.next_id('AGRC') == 1003
+    assert registry.allocate('PFLO') == 6000
+    assert registry.is_reserved(1001) and not registry.is_reserved(1003)
+
+
+def test_registry_reuses_gaps_and_raises_when_exhausted():
+    registry = StrategyIDRegistry({'AGRC': '1000-1002', 'LNDU': '1000-1002'}, [1000, 1002])
+
+    assert registry.allocate('LNDU') == 1001
+    with pytest.raises(ValueError, match='Exceeded ID range'):
+        registry.allocate('AGRC')
+    with pytest.raises(ValueError, match='Unknown strategy group'):
+        registry.next_id('WASO')
+
+
+def add_strategy_worker(csv_file, yaml_directory, suffix):
+    handler = StrategyCSVHandler(csv_file, yaml_directory, STRATEGY_MAPPING_FILE, {f'strategy_{suffix}': [f'TX:TEST_{suffix}']})
+    new_rows = handler.add_strategies([('PFLO', f'Strategy {suffix}', suffix)])
+    return int(new_rows['strategy_id'].iloc[0])
+
+
+@pytest.mark.skipif('fork' not in multiprocessing.get_all_start_methods(), reason="requires the fork start method")
+def test_parallel_add_strategies_allocate_distinct_ids(strategy_csv):
+    csv_file, yaml_directory = strategy_csv
+    suffixes = ['A', 'B', 'C', 'D']
+    with ProcessPoolExecutor(max_workers=4, mp_context=multiprocessing.get_context('fork')) as executor:
+        strategy_ids = list(executor.map(add_strategy_worker, [csv_file] * 4, [yaml_directory] * 4, suffixes))
+
+    assert sorted(strategy_ids) == [6000, 6001, 6002, 6003]
+    df = pd.read_csv(csv_file)
+    assert sorted(df['strategy_id']) == [6000, 6001, 6002, 6003]
+    assert sorted(df['transformation_specification']) == [f'TX:TEST_{suffix}' for suffix in suffixes]
+    # Every update was written through a temporary file that replaced the CSV
+    assert glob.glob(f'{csv_file}.*.tmp') == []
+
+
+def test_deduplicate_off_restores_per_strategy_files(region_copy):
+    excel_file, yaml_directory = region_copy
+    ExcelYAMLHandler(excel_file, yaml_directory, deduplicate=True).process_yaml_files()
+    assert glob.glob(os.path.join(yaml_directory, '*_shared_*.yaml'))
+
+    ExcelYAMLHandler(excel_file, yaml_directory).process_yaml_files()
+    assert_matches_committed(yaml_directory)
+    assert glob.glob(os.path.join(yaml_directory, '*_shared_*.yaml')) == []
+
+
+def test_shared_yamls_resolve_in_strategy_specifications(region_copy, tmp_path):
+    excel_file, yaml_directory = region_copy
+    handler = ExcelYAMLHandler(excel_file, yaml_directory, deduplicate=True)
+    handler.process_yaml_files()
+    transformations_per_strategy = handler.get_transformations_per_strategy_dict()
+
+    csv_handler = StrategyCSVHandler(str(tmp_path / 'strategy_definitions.csv'), yaml_directory, STRATEGY_MAPPING_FILE,
+                                     transformations_per_strategy)
+    for strategy, codes in transformations_per_strategy.items():
+        specification = csv_handler.get_transformation_specification(strategy[len('strategy_'):])
+        assert sorted(specification.split('|')) == sorted(codes)
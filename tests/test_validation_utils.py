@@ -0,0 +1,61 @@
+import numpy as np
+import pandas as pd
+
+from ValidationUtils import InputValidator
+
+
+def get_report_rows(report):
+    return sorted(zip(report['rule'], report['target'], report['n_violations']))
+
+
+def test_valid_frame_has_an_empty_report():
+    df = pd.DataFrame({
+        'region': 'georgia',
+        'time_period': [0, 1, 2],
+        'frac_waso_non_recycled_food': [0.6, 0.5, 0.5],
+        'frac_waso_non_recycled_paper': [0.4, 0.5, 0.5],
+        'qty_waso_total': [1.0, 2.0, 3.0],
+    })
+    report = InputValidator.default(allowed_regions=['georgia']).validate(df)
+    assert report.empty
+    assert list(report.columns) == ['rule', 'target', 'n_violations', 'first_row']
+
+
+def test_violations_are_reported_per_rule_and_column():
+    df = pd.DataFrame({
+        'region': ['georgia', 'georgia', 'croatia'],
+        'time_period': [0, 0, 1],
+        'frac_waso_non_recycled_food': [0.6, 1.5, np.nan],
+        'frac_waso_non_recycled_paper': [0.4, 0.5, 0.5],
+        'qty_waso_total': [1.0, -2.0, 3.0],
+        'other_field': [0.0, 0.0, 0.0],
+    })
+    validator = InputValidator(
+        bounds={'frac_': (0.0, 1.0), 'qty_': (0.0, None)},
+        sum_to_one_groups=['frac_waso_non_recycled_'],
+        allowed_regions=['georgia'],
+        allowed_prefixes=['frac_', 'qty_'],
+    )
+    report = validator.validate(df)
+
+    assert get_report_rows(report) == [
+        ('bounds', 'frac_waso_non_recycled_food', 1),
+        ('bounds', 'qty_waso_total', 1),
+        ('nan', 'frac_waso_non_recycled_food', 1),
+        ('prefix', 'other_field', 3),
+        ('region', 'region', 1),
+        ('sum_to_one', 'frac_waso_non_recycled_', 2),
+        ('time_period', 'time_period', 1),
+    ]
+    first_rows = dict(zip(report['rule'] + ':' + report['target'], report['first_row']))
+    assert first_rows['bounds:qty_waso_total'] == 1 and first_rows['region:region'] == 2
+
+
+def test_validate_many_names_the_frames():
+    validator = InputValidator(sum_to_one_groups=['frac_missing_'])
+    df = pd.DataFrame({'time_period': [0, 1], 'qty_a': [1.0, 2.0]})
+    report = validator.validate_many({'georgia': df, 'croatia': df})
+    assert report[['name', 'rule', 'target']].values.tolist() == [
+        ['georgia', 'missing_group', 'frac_missing_'],
+        ['croatia', 'missing_group', 'frac_missing_'],
+    ]
@@ -0,0 +1,493 @@
+import argparse
+import contextlib
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import yaml
+
+from GeneralUtils import GeneralUtils, InputSchema
+from TraceUtils import tracer
+from TransformationUtils import ExcelYAMLHandler, StrategyCSVHandler
+
+
+UTILS_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_SIZES = [(50, 3), (200, 20), (500, 50)]
+
+
+class FileOpCounter:
+    """
+    Count the file operations made while the counter is active, from the interpreter's audit events:
+    files opened for reading and for writing, removals, renames (including os.replace) and
+    directory listings. Operations made by C libraries outside of Python are not seen.
+    """
+
+    _active = []
+    _lock = threading.Lock()
+    _hook_installed = False
+
+    def __init__(self):
+        self.counts = Counter()
+
+    @classmethod
+    def install_hook(cls):
+        # Audit hooks can't be removed, so a single hook dispatches to the active counters
+        if not cls._hook_installed:
+            sys.addaudithook(cls.audit_hook)
+            cls._hook_installed = True
+
+    @classmethod
+    def audit_hook(cls, event, args):
+        if not cls._active:
+            return
+        if event == 'open':
+            mode, flags = args[1], args[2]
+            if isinstance(mode, str):
+                is_write = any(char in mode for char in 'wax+')
+            else:
+                is_write = bool(flags & (os.O_WRONLY | os.O_RDWR))
+            key = 'open_write' if is_write else 'open_read'
+        elif event == 'os.remove':
+            key = 'remove'
+        elif event == 'os.rename':
+            key = 'rename'
+        elif event in ('os.listdir', 'os.scandir'):
+            key = 'listdir'
+        else:
+            return
+        with cls._lock:
+            for counter in cls._active:
+                counter.counts[key] += 1
+
+    def __enter__(self):
+        self.install_hook()
+        with self._lock:
+            self._active.append(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        with self._lock:
+            self._active.remove(self)
+        return False
+
+
+class SyntheticFixtures:
+    """
+    Synthetic region fixtures at a configurable scale: a directory of transformation YAML templates,
+    a crosswalk workbook with a 'yaml' sheet, a `strategy_definitions.csv` file and the strategy
+    mapping, laid out like a region directory. Example and input frames for the alignment helpers
+    are built in memory.
+    """
+
+    def __init__(
+        self,
+        root_dir,
+        n_transformations,
+        n_strategies,
+        n_input_columns=2000,
+        n_rows=36,
+        density=0.5,
+        no_magnitude_share=0.1,
+        seed=0,
+    ):
+        """
+        Args:
+            root_dir (str): The directory where the fixtures are written.
+            n_transformations (int): The number of transformation templates and crosswalk rows.
+            n_strategies (int): The number of strategy columns of the crosswalk.
+            n_input_columns (int, optional): The number of columns of the example input frame. Defaults to 2000.
+            n_rows (int, optional): The number of rows (time periods) of the input frames. Defaults to 36.
+            density (float, optional): The share of crosswalk cells with a scalar, i.e. of transformations
+                used by each strategy. Defaults to 0.5.
+            no_magnitude_share (float, optional): The share of templates without a 'magnitude' parameter.
+                Defaults to 0.1.
+            seed (int, optional): The random seed. Defaults to 0.
+        """
+        self.root_dir = root_dir
+        self.n_transformations = n_transformations
+        self.n_strategies = n_strategies
+        self.n_input_columns = n_input_columns
+        self.n_rows = n_rows
+        self.density = density
+        self.no_magnitude_share = no_magnitude_share
+        self.rng = np.random.default_rng(seed)
+
+        self.yaml_directory = os.path.join(root_dir, 'transformations')
+        self.excel_file = os.path.join(root_dir, 'data', 'synthetic_transformation_cw.xlsx')
+        self.csv_file = os.path.join(self.yaml_directory, 'strategy_definitions.csv')
+        self.csv_template = os.path.join(root_dir, 'strategy_definitions_template.csv')
+        self.mapping_file = os.path.join(root_dir, 'strategy_mapping.yaml')
+        self.strategy_suffixes = [f"S{j:03d}" for j in range(n_strategies)]
+
+    def build(self):
+        """
+        Write the fixtures and build the input frames.
+
+        Returns:
+            SyntheticFixtures: The fixtures, for chaining.
+        """
+        os.makedirs(self.yaml_directory, exist_ok=True)
+        os.makedirs(os.path.dirname(self.excel_file), exist_ok=True)
+
+        subsectors = ['AGRC', 'ENTC', 'INEN', 'IPPU', 'LNDU', 'SCOE', 'TRNS', 'WASO']
+        no_magnitude = self.rng.random(self.n_transformations) < self.no_magnitude_share
+        rows = []
+        for i in range(self.n_transformations):
+            subsector = subsectors[i % len(subsectors)]
+            yaml_name = f"transformation_{subsector.lower()}_synthetic_{i:05d}.yaml"
+            code = f"TX:{subsector}:SYNTHETIC_{i:05d}"
+            parameters = {'vec_implementation_ramp': None}
+            if not no_magnitude[i]:
+                parameters['magnitude'] = round(float(self.rng.uniform(0.05, 1.0)), 4)
+            template = {
+                'citations': None,
+                'description': f"Synthetic transformation {i} of {subsector}.",
+                'identifiers': {
+                    'transformation_code': code,
+                    'transformation_name': f"Default Value - {subsector}: Synthetic transformation {i}",
+                },
+                'parameters': parameters,
+                'transformer': f"TFR:{subsector}:SYNTHETIC_{i:05d}",
+            }
+            with open(os.path.join(self.yaml_directory, yaml_name), 'w') as file:
+                yaml.dump(template, file, default_flow_style=False)
+            rows.append({
+                'subsector': subsector,
+                'transformation_name': f"Synthetic transformation {i}",
+                'transformation_yaml_name': yaml_name,
+                'transformation_code': code,
+            })
+
+        df_cw = pd.DataFrame(rows)
+        scalars = np.round(self.rng.uniform(0.1, 1.0, (self.n_transformations, self.n_strategies)), 2)
+        scalars[self.rng.random(scalars.shape) >= self.density] = np.nan
+        df_scalars = pd.DataFrame(scalars, columns=[f"strategy_{suffix}" for suffix in self.strategy_suffixes])
+        pd.concat([df_cw, df_scalars], axis=1).to_excel(self.excel_file, sheet_name='yaml', index=False)
+
+        df_strategies = pd.DataFrame({
+            'strategy_id': [0, 6000, 6001],
+            'strategy_code': ['BASE', 'PFLO:INC_HEALTHIER_DIETS', 'PFLO:INC_IND_CCS'],
+            'strategy': ['Strategy TX:BASE', 'Singleton - PFLO: Change diets', 'Singleton - PFLO: Industrial CCS'],
+            'description': ['', '', ''],
+            'transformation_specification': ['', 'TX:PFLO:INC_HEALTHIER_DIETS', 'TX:PFLO:INC_IND_CCS'],
+        })
+        df_strategies.to_csv(self.csv_template, index=False)
+        self.reset_csv()
+        shutil.copyfile(os.path.join(UTILS_DIR, 'strategy_mapping.yaml'), self.mapping_file)
+
+        # The example frame has every column, the input frame misses a tenth of them and has a few extra
+        columns = [f"var_synthetic_{k:05d}" for k in range(self.n_input_columns)]
+        values = self.rng.random((self.n_rows, self.n_input_columns))
+        self.df_example = pd.DataFrame(values, columns=columns)
+        self.df_example.insert(0, 'time_period', np.arange(self.n_rows))
+        self.df_example.insert(1, 'region', 'synthetic')
+        keep = self.rng.random(self.n_input_columns) >= 0.1
+        self.df_input = self.df_example.loc[:, [True, True] + list(keep)].copy()
+        self.df_input['iso_code3'] = 'SYN'
+        return self
+
+    def reset_csv(self):
+        """
+        Restore `strategy_definitions.csv` to its initial content.
+        """
+        shutil.copyfile(self.csv_template, self.csv_file)
+
+    def clean_generated(self):
+        """
+        Remove the generated strategy YAMLs, their manifest and the workbook cache.
+        """
+        for file_name in os.listdir(self.yaml_directory):
+            if '_strategy_' in file_name:
+                os.remove(os.path.join(self.yaml_directory, file_name))
+        manifest_file = os.path.join(self.root_dir, 'transformations_manifest.json')
+        if os.path.exists(manifest_file):
+            os.remove(manifest_file)
+        shutil.rmtree(os.path.join(os.path.dirname(self.excel_file), '.workbook_cache'), ignore_errors=True)
+
+    def get_excel_yaml_handler(self):
+        return ExcelYAMLHandler(excel_file=self.excel_file, yaml_directory=self.yaml_directory)
+
+    def get_csv_handler(self):
+        transformation_per_strategy_dict = self.get_excel_yaml_handler().get_transformations_per_strategy_dict()
+        return StrategyCSVHandler(self.csv_file, self.yaml_directory, self.mapping_file, transformation_per_strategy_dict)
+
+
+def setup_generated(fixtures):
+    # Strategy YAMLs are generated once, so that the cases reading them have something to read
+    fixtures.get_excel_yaml_handler().process_yaml_files()
+
+
+def setup_load_cold(fixtures):
+    shutil.rmtree(os.path.join(os.path.dirname(fixtures.excel_file), '.workbook_cache'), ignore_errors=True)
+    return fixtures
+
+
+def setup_load_cached(fixtures):
+    fixtures.get_excel_yaml_handler()
+    return fixtures
+
+
+def setup_incremental(fixtures):
+    setup_generated(fixtures)
+    return fixtures.get_excel_yaml_handler()
+
+
+def setup_csv_handler(fixtures):
+    setup_generated(fixtures)
+    fixtures.reset_csv()
+    return fixtures.get_csv_handler(), fixtures.strategy_suffixes
+
+
+def run_transformation_specification(state):
+    csv_handler, suffixes = state
+    for suffix in suffixes:
+        csv_handler.get_transformation_specification(suffix)
+
+
+def run_add_strategy(state):
+    csv_handler, suffixes = state
+    for suffix in suffixes:
+        csv_handler.add_strategy(strategy_group='PFLO', description=f"Synthetic {suffix}", yaml_file_suffix=suffix)
+
+
+def run_add_strategies(state):
+    csv_handler, suffixes = state
+    csv_handler.add_strategies([
+        {'strategy_group': 'PFLO', 'description': f"Synthetic {suffix}", 'yaml_file_suffix': suffix}
+        for suffix in suffixes
+    ])
+
+
+# Benchmark cases: name -> (setup, run). The setup is not timed and returns the state passed to run.
+CASES = {
+    'load_excel_data_cold': (setup_load_cold, lambda fixtures: fixtures.get_excel_yaml_handler()),
+    'load_excel_data_cached': (setup_load_cached, lambda fixtures: fixtures.get_excel_yaml_handler()),
+    'process_yaml_files_full': (
+        lambda fixtures: fixtures.get_excel_yaml_handler(),
+        lambda handler: handler.process_yaml_files(force=True),
+    ),
+    'process_yaml_files_incremental': (setup_incremental, lambda handler: handler.process_yaml_files()),
+    'get_transformations_per_strategy_dict': (
+        lambda fixtures: fixtures.get_excel_yaml_handler(),
+        lambda handler: handler.get_transformations_per_strategy_dict(),
+    ),
+    'get_transformation_specification': (setup_csv_handler, run_transformation_specification),
+    'add_strategy': (setup_csv_handler, run_add_strategy),
+    'add_strategies': (setup_csv_handler, run_add_strategies),
+    'compare_dfs': (
+        lambda fixtures: fixtures,
+        lambda fixtures: GeneralUtils().compare_dfs(fixtures.df_example, fixtures.df_input),
+    ),
+    'add_missing_cols': (
+        lambda fixtures: fixtures,
+        lambda fixtures: GeneralUtils().add_missing_cols(fixtures.df_example, fixtures.df_input),
+    ),
+    'input_schema_align': (
+        lambda fixtures: fixtures,
+        lambda fixtures: InputSchema(fixtures.df_example).align(fixtures.df_input),
+    ),
+}
+
+
+def run_case(fixtures, setup, run, repeat=3, trace_memory=True):
+    """
+    Benchmark a case: time `repeat` runs, counting the file operations of the last one, then measure
+    the peak memory of one more run with tracemalloc. Everything the case prints is discarded.
+
+    Args:
+        fixtures (SyntheticFixtures): The fixtures.
+        setup (callable): Builds the state of a run from the fixtures; it is not timed.
+        run (callable): The benchmarked function, called with the state.
+        repeat (int, optional): The number of timed runs. Defaults to 3.
+        trace_memory (bool, optional): Whether to measure the peak memory. Defaults to True.
+    Returns:
+        dict: The minimum and median wall times in seconds, the peak memory in MB and the file operation counts.
+    """
+    times = []
+    file_ops = {}
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        for _ in range(repeat):
+            state = setup(fixtures)
+            with FileOpCounter() as counter:
+                t0 = time.perf_counter()
+                run(state)
+                times.append(time.perf_counter() - t0)
+            file_ops = dict(counter.counts)
+
+        peak_mb = None
+        if trace_memory:
+            state = setup(fixtures)
+            tracemalloc.start()
+            try:
+                run(state)
+                peak_mb = tracemalloc.get_traced_memory()[1] / 1e6
+            finally:
+                tracemalloc.stop()
+
+    return {
+        'wall_s_min': min(times),
+        'wall_s_median': float(np.median(times)),
+        'peak_mb': peak_mb,
+        'file_ops': file_ops,
+    }
+
+
+def get_git_commit():
+    try:
+        output = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=UTILS_DIR, capture_output=True, text=True, check=True,
+        )
+        return output.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(sizes=DEFAULT_SIZES, cases=None, repeat=3, trace_memory=True, work_dir=None, seed=0, **fixture_options):
+    """
+    Run the benchmark cases on synthetic fixtures of each size.
+
+    Args:
+        sizes (list, optional): (number of transformations, number of strategies) tuples. Defaults to DEFAULT_SIZES.
+        cases (list, optional): The names of the cases to run. Defaults to all the cases in CASES.
+        repeat (int, optional): The number of timed runs of each case. Defaults to 3.
+        trace_memory (bool, optional): Whether to measure the peak memory. Defaults to True.
+        work_dir (str, optional): The directory where the fixtures are built. Defaults to a temporary
+            directory that is removed afterwards.
+        seed (int, optional): The random seed of the fixtures. Defaults to 0.
+        **fixture_options: Additional arguments passed to SyntheticFixtures.
+    Returns:
+        dict: The benchmark run, with the commit, the environment and one result per case and size.
+    """
+    case_names = list(CASES) if cases is None else cases
+    unknown = [name for name in case_names if name not in CASES]
+    if unknown:
+        raise ValueError(f"Unknown benchmark cases: {', '.join(unknown)}")
+
+    results = []
+    with contextlib.ExitStack() as stack:
+        if work_dir is None:
+            work_dir = stack.enter_context(tempfile.TemporaryDirectory(prefix='ssp_benchmark_'))
+
+        for n_transformations, n_strategies in sizes:
+            fixtures_dir = os.path.join(work_dir, f"synthetic_{n_transformations}x{n_strategies}")
+            shutil.rmtree(fixtures_dir, ignore_errors=True)
+            fixtures = SyntheticFixtures(fixtures_dir, n_transformations, n_strategies, seed=seed, **fixture_options).build()
+
+            for name in case_names:
+                setup, run = CASES[name]
+                result = run_case(fixtures, setup, run, repeat=repeat, trace_memory=trace_memory)
+                results.append({'case': name, 'n_transformations': n_transformations, 'n_strategies': n_strategies, **result})
+                tracer.info(f"{name} [{n_transformations}x{n_strategies}]: {result['wall_s_min']:.4f} s, "
+                            f"{result['peak_mb'] if result['peak_mb'] is not None else float('nan'):.1f} MB, {result['file_ops']}",
+                            event='benchmark_case', case=name, n_transformations=n_transformations, n_strategies=n_strategies,
+                            wall_s_min=result['wall_s_min'], peak_mb=result['peak_mb'])
+
+            fixtures.clean_generated()
+
+    return {
+        'commit': get_git_commit(),
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'platform': platform.platform(),
+        'repeat': repeat,
+        'results': results,
+    }
+
+
+def save_benchmarks(benchmarks, output_file):
+    """
+    Save a benchmark run to a JSON file.
+
+    Args:
+        benchmarks (dict): The benchmark run, see `run_benchmarks`.
+        output_file (str): The path to the JSON file.
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(output_file)), exist_ok=True)
+    with open(output_file, 'w') as file:
+        json.dump(benchmarks, file, indent=2)
+    tracer.info(f"Benchmarks saved to {output_file}", event='benchmarks_saved', path=output_file)
+
+
+def compare_benchmarks(baseline, current, threshold=0.2, min_delta_s=0.005):
+    """
+    Compare two benchmark runs case by case.
+
+    Args:
+        baseline (dict or str): The baseline run, or the path to its JSON file.
+        current (dict or str): The current run, or the path to its JSON file.
+        threshold (float, optional): The relative increase of the minimum wall time reported as a
+            regression. Defaults to 0.2.
+        min_delta_s (float, optional): The minimum absolute increase of the wall time reported as a
+            regression, so that timer noise on very fast cases is ignored. Defaults to 0.005.
+    Returns:
+        pd.DataFrame: One row per case and size present in both runs, with the wall times, their ratio,
+            the peak memories and a 'regression' flag.
+    """
+    runs = []
+    for run in (baseline, current):
+        if isinstance(run, str):
+            with open(run, 'r') as file:
+                run = json.load(file)
+        runs.append(pd.DataFrame(run['results']))
+
+    keys = ['case', 'n_transformations', 'n_strategies']
+    columns = keys + ['wall_s_min', 'peak_mb']
+    df = runs[0][columns].merge(runs[1][columns], on=keys, suffixes=('_baseline', '_current'))
+    df['ratio'] = df['wall_s_min_current'] / df['wall_s_min_baseline']
+    df['regression'] = (df['ratio'] > 1 + threshold) & (df['wall_s_min_current'] - df['wall_s_min_baseline'] > min_delta_s)
+    return df
+
+
+def parse_size(size):
+    n_transformations, n_strategies = size.lower().split('x')
+    return int(n_transformations), int(n_strategies)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the transformation and strategy tooling on synthetic fixtures.")
+    parser.add_argument('--sizes', nargs='+', type=parse_size, default=DEFAULT_SIZES,
+                        help="Fixture sizes as <transformations>x<strategies>, e.g. 50x3 2000x200.")
+    parser.add_argument('--cases', nargs='+', default=None, choices=list(CASES), help="Cases to run. Defaults to all.")
+    parser.add_argument('--repeat', type=int, default=3, help="Number of timed runs of each case.")
+    parser.add_argument('--no-memory', action='store_true', help="Skip the tracemalloc run of each case.")
+    parser.add_argument('--work-dir', default=None, help="Directory where the fixtures are built. Defaults to a temporary directory.")
+    parser.add_argument('--seed', type=int, default=0, help="Random seed of the fixtures.")
+    parser.add_argument('--output', default=None, help="JSON file of the results. Defaults to benchmark_<commit>.json.")
+    parser.add_argument('--compare', default=None, help="JSON file of a baseline run to compare against.")
+    parser.add_argument('--threshold', type=float, default=0.2, help="Relative slowdown reported as a regression.")
+    args = parser.parse_args(argv)
+
+    benchmarks = run_benchmarks(
+        sizes=args.sizes,
+        cases=args.cases,
+        repeat=args.repeat,
+        trace_memory=not args.no_memory,
+        work_dir=args.work_dir,
+        seed=args.seed,
+    )
+    save_benchmarks(benchmarks, args.output or f"benchmark_{benchmarks['commit'] or 'local'}.json")
+
+    if args.compare is not None:
+        comparison = compare_benchmarks(args.compare, benchmarks, threshold=args.threshold)
+        tracer.info(comparison.to_string(index=False, float_format=lambda x: f"{x:.4f}"), event='benchmark_comparison')
+        if comparison['regression'].any():
+            tracer.warning(f"{int(comparison['regression'].sum())} cases are slower than the baseline by more than {args.threshold:.0%}.",
+                           event='benchmark_regressions', n_regressions=int(comparison['regression'].sum()))
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,676 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+import time
+
+import pandas as pd
+
+from TraceUtils import tracer
+
+try:
+    import fcntl
+except ImportError:
+    # Windows
+    fcntl = None
+    import msvcrt
+
+try:
+    import pyarrow.feather as feather
+except ImportError:
+    feather = None
+
+
+def read_frame(stem):
+    """
+    Read a frame written by `write_frame`.
+
+    Args:
+        stem (str): The file path without extension.
+    Returns:
+        pd.DataFrame: The frame, or None if there is no file.
+    """
+    feather_path = f"{stem}.feather"
+    if feather is not None and os.path.exists(feather_path):
+        return feather.read_table(feather_path, memory_map=True).to_pandas()
+
+    pickle_path = f"{stem}.pkl"
+    if os.path.exists(pickle_path):
+        return pd.read_pickle(pickle_path)
+
+    return None
+
+
+def write_frame(stem, df):
+    """
+    Atomically write a frame as Feather if possible, or as a pickle otherwise.
+
+    Args:
+        stem (str): The file path without extension.
+        df (pd.DataFrame): The frame.
+    Returns:
+        str: The path of the written file.
+    """
+    os.makedirs(os.path.dirname(stem), exist_ok=True)
+
+    # Feather stores column names as strings, so only use it when they roundtrip
+    if feather is not None and all(isinstance(col, str) for col in df.columns):
+        tmp_path = f"{stem}.feather.{os.getpid()}.tmp"
+        try:
+            # Uncompressed so that the file can be memory-mapped
+            feather.write_feather(df, tmp_path, compression='uncompressed')
+            os.replace(tmp_path, f"{stem}.feather")
+            return f"{stem}.feather"
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    tmp_path = f"{stem}.pkl.{os.getpid()}.tmp"
+    df.to_pickle(tmp_path)
+    os.replace(tmp_path, f"{stem}.pkl")
+    return f"{stem}.pkl"
+
+
+class WorkbookCache:
+    """
+    Columnar sidecar cache for Excel workbooks.
+
+    Parsing .xlsx files through openpyxl is slow, so the first read of a workbook converts each
+    of its sheets to a sidecar file keyed on the workbook's content hash and the sheet name.
+    Later reads are served from the sidecar: Feather files read through a memory map when
+    pyarrow is installed, or pickles for sheets Arrow can't represent (e.g. columns mixing
+    numbers and text). Editing the workbook changes its hash, so stale sidecars are never used;
+    they are removed when the sidecars of the new version are written.
+    """
+
+    def __init__(self, cache_dir=None):
+        """
+        Args:
+            cache_dir (str, optional): The directory where sidecars are stored. Defaults to a
+                `.workbook_cache` directory next to each workbook.
+        """
+        self.cache_dir = cache_dir
+        # Path -> (stat key, content hash), to avoid hashing unchanged workbooks again
+        self._hashes = {}
+
+    def get_cache_dir(self, excel_file):
+        """
+        Get the directory where the sidecars of a workbook are stored.
+
+        Args:
+            excel_file (str): The path to the Excel file.
+        Returns:
+            str: The sidecar directory.
+        """
+        if self.cache_dir is not None:
+            return self.cache_dir
+        return os.path.join(os.path.dirname(os.path.abspath(excel_file)), '.workbook_cache')
+
+    def get_file_hash(self, excel_file):
+        """
+        Compute the SHA-256 hash of a workbook, reusing the last hash if its mtime and size didn't change.
+
+        Args:
+            excel_file (str): The path to the Excel file.
+        Returns:
+            str: The hex digest of the workbook content.
+        """
+        path = os.path.abspath(excel_file)
+        stat = os.stat(path)
+        stat_key = (stat.st_mtime_ns, stat.st_size)
+        cached = self._hashes.get(path)
+        if cached is not None and cached[0] == stat_key:
+            return cached[1]
+
+        with open(path, 'rb') as file:
+            digest = hashlib.sha256(file.read()).hexdigest()
+        self._hashes[path] = (stat_key, digest)
+        return digest
+
+    def get_sidecar_stem(self, excel_file, sheet_name):
+        """
+        Build the path of a sheet's sidecar, without its extension.
+
+        Args:
+            excel_file (str): The path to the Excel file.
+            sheet_name (str or int): The sheet name or position.
+        Returns:
+            str: The sidecar path without extension.
+        """
+        workbook_name = os.path.splitext(os.path.basename(excel_file))[0]
+        safe_sheet = re.sub(r'[^A-Za-z0-9_.-]', '_', str(sheet_name))
+        digest = self.get_file_hash(excel_file)[:16]
+        return os.path.join(self.get_cache_dir(excel_file), f"{workbook_name}__{digest}__{safe_sheet}")
+
+    def get_sheet_index_path(self, excel_file):
+        """
+        Build the path of the file listing the cached sheet names of a workbook.
+
+        Args:
+            excel_file (str): The path to the Excel file.
+        Returns:
+            str: The path of the sheet index.
+        """
+        workbook_name = os.path.splitext(os.path.basename(excel_file))[0]
+        digest = self.get_file_hash(excel_file)[:16]
+        return os.path.join(self.get_cache_dir(excel_file), f"{workbook_name}__{digest}.sheets.json")
+
+    def read_sidecar(self, sidecar_stem):
+        """
+        Read a sheet from its sidecar.
+
+        Args:
+            sidecar_stem (str): The sidecar path without extension.
+        Returns:
+            pd.DataFrame: The sheet, or None if there is no sidecar.
+        """
+        return read_frame(sidecar_stem)
+
+    def write_sidecar(self, sidecar_stem, df):
+        """
+        Write a sheet to its sidecar, as Feather if possible or as a pickle otherwise.
+
+        Args:
+            sidecar_stem (str): The sidecar path without extension.
+            df (pd.DataFrame): The sheet.
+        Returns:
+            None
+        """
+        write_frame(sidecar_stem, df)
+
+    def prune_sidecars(self, excel_file):
+        """
+        Remove the sidecars and sheet index of the earlier versions of a workbook, i.e. the files of the
+        cache directory named after the workbook with another content hash.
+
+        Args:
+            excel_file (str): The path to the Excel file.
+        Returns:
+            list: The paths of the removed files.
+        """
+        cache_dir = self.get_cache_dir(excel_file)
+        workbook_name = os.path.splitext(os.path.basename(excel_file))[0]
+        digest = self.get_file_hash(excel_file)[:16]
+        pattern = re.compile(rf"{re.escape(workbook_name)}__([0-9a-f]{{16}})(__|\.sheets\.json$)")
+
+        removed = []
+        for file_name in os.listdir(cache_dir):
+            match = pattern.match(file_name)
+            if match is None or match.group(1) == digest:
+                continue
+            path = os.path.join(cache_dir, file_name)
+            try:
+                os.remove(path)
+                removed.append(path)
+            except FileNotFoundError:
+                pass
+        if removed:
+            tracer.debug(f"Removed {len(removed)} stale sidecars of {excel_file}", event='sidecars_pruned',
+                         excel_file=str(excel_file), n_files=len(removed))
+        return removed
+
+    def get_sheet_names(self, excel_file):
+        """
+        Get the sheet names of a workbook, caching the whole workbook if it isn't cached yet.
+
+        Args:
+            excel_file (str): The path to the Excel file.
+        Returns:
+            list: The sheet names.
+        """
+        index_path = self.get_sheet_index_path(excel_file)
+        if os.path.exists(index_path):
+            with open(index_path, 'r') as file:
+                return json.load(file)
+
+        return list(self.read_excel(excel_file, sheet_name=None).keys())
+
+    def read_excel(self, excel_file, sheet_name=0):
+        """
+        Read one or all sheets of a workbook, from the sidecars when available.
+
+        Args:
+            excel_file (str): The path to the Excel file.
+            sheet_name (str, int or None, optional): The sheet name or position, or None to read all
+                the sheets. Defaults to the first sheet.
+        Returns:
+            pd.DataFrame: The sheet, or a dictionary of DataFrames keyed by sheet name if `sheet_name`
+                is None.
+        """
+        if sheet_name is None:
+            index_path = self.get_sheet_index_path(excel_file)
+            if os.path.exists(index_path):
+                with open(index_path, 'r') as file:
+                    sheet_names = json.load(file)
+                sheets = {name: self.read_sidecar(self.get_sidecar_stem(excel_file, name)) for name in sheet_names}
+                if all(df is not None for df in sheets.values()):
+                    return sheets
+
+            # Parse the whole workbook once and cache every sheet
+            sheets = pd.read_excel(excel_file, sheet_name=None)
+            for name, df in sheets.items():
+                self.write_sidecar(self.get_sidecar_stem(excel_file, name), df)
+            with open(index_path, 'w') as file:
+                json.dump(list(sheets.keys()), file)
+            self.prune_sidecars(excel_file)
+            return sheets
+
+        if isinstance(sheet_name, int):
+            sheet_name = self.get_sheet_names(excel_file)[sheet_name]
+
+        sidecar_stem = self.get_sidecar_stem(excel_file, sheet_name)
+        df = self.read_sidecar(sidecar_stem)
+        if df is None:
+            df = pd.read_excel(excel_file, sheet_name=sheet_name)
+            self.write_sidecar(sidecar_stem, df)
+            self.prune_sidecars(excel_file)
+        return df
+
+
+class FileLock:
+    """
+    Advisory lock on a lock file, used as a context manager.
+
+    The lock is exclusive across processes, so several region workers can safely read,
+    modify and write the same file while holding it.
+    """
+
+    def __init__(self, lock_file, timeout=60, poll_interval=0.1):
+        self.lock_file = lock_file
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self._file = None
+
+    def acquire(self):
+        """
+        Block until the lock is acquired.
+
+        Raises:
+            TimeoutError: If the lock can't be acquired within `timeout` seconds.
+        """
+        self._file = open(self.lock_file, 'a+')
+        deadline = time.monotonic() + self.timeout
+        while True:
+            try:
+                if fcntl is not None:
+                    fcntl.flock(self._file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                else:
+                    self._file.seek(0)
+                    msvcrt.locking(self._file.fileno(), msvcrt.LK_NBLCK, 1)
+                return
+            except OSError:
+                if time.monotonic() > deadline:
+                    self._file.close()
+                    self._file = None
+                    raise TimeoutError(f"Could not acquire lock on {self.lock_file} within {self.timeout} seconds.")
+                time.sleep(self.poll_interval)
+
+    def release(self):
+        """
+        Release the lock.
+        """
+        if self._file is None:
+            return
+        if fcntl is not None:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+        else:
+            self._file.seek(0)
+            msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+        self._file.close()
+        self._file = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+
+
+class ResultCache:
+    """
+    Columnar cache of result frames keyed by fingerprint, with LRU eviction.
+
+    Every entry is a frame stored with `write_frame` (Feather when possible) in the cache directory,
+    and `index.json` records its size, creation time and last access. When a new entry brings the
+    cache over `max_bytes` or `max_entries`, the least recently used entries are removed. Every
+    update of the index holds `index.json.lock`, so several processes can share the cache.
+    """
+
+    def __init__(self, cache_dir, max_bytes=None, max_entries=None):
+        """
+        Args:
+            cache_dir (str): The cache directory.
+            max_bytes (int, optional): The maximum total size of the entries. Defaults to no limit.
+            max_entries (int, optional): The maximum number of entries. Defaults to no limit.
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+    def get_index_path(self):
+        return os.path.join(self.cache_dir, 'index.json')
+
+    def lock_index(self):
+        """
+        Get the lock guarding the read-modify-write of the index across processes.
+
+        Returns:
+            FileLock: The lock, to be used as a context manager.
+        """
+        os.makedirs(self.cache_dir, exist_ok=True)
+        return FileLock(f"{self.get_index_path()}.lock")
+
+    def load_index(self):
+        """
+        Load the index of the cache, dropping the entries whose file is missing.
+
+        Returns:
+            dict: The entries keyed by fingerprint.
+        """
+        try:
+            with open(self.get_index_path(), 'r') as file:
+                index = json.load(file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+        return {key: entry for key, entry in index.items() if os.path.exists(os.path.join(self.cache_dir, entry['file']))}
+
+    def save_index(self, index):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_path = f"{self.get_index_path()}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as file:
+            json.dump(index, file, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.get_index_path())
+
+    def __contains__(self, key):
+        return key in self.load_index()
+
+    def get(self, key):
+        """
+        Retrieve a frame and mark it as recently used.
+
+        Args:
+            key (str): The fingerprint.
+        Returns:
+            pd.DataFrame: The frame, or None on a cache miss.
+        """
+        # The entry is looked up, read and touched under the lock, so it can't be evicted in between
+        with self.lock_index():
+            index = self.load_index()
+            df = read_frame(os.path.join(self.cache_dir, key)) if key in index else None
+            if df is not None:
+                index[key]['last_access'] = time.time()
+                self.save_index(index)
+
+        if df is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return df
+
+    def put(self, key, df, meta=None):
+        """
+        Store a frame and evict the least recently used entries if the cache is over its limits.
+
+        Args:
+            key (str): The fingerprint.
+            df (pd.DataFrame): The frame.
+            meta (dict, optional): Additional JSON-serializable information kept in the index.
+        """
+        path = write_frame(os.path.join(self.cache_dir, key), df)
+        now = time.time()
+        with self.lock_index():
+            index = self.load_index()
+            index[key] = {
+                'file': os.path.basename(path),
+                'size': os.path.getsize(path),
+                'created': now,
+                'last_access': now,
+                'meta': meta or {},
+            }
+            self.evict(index, keep=key)
+            self.save_index(index)
+
+    def evict(self, index, keep=None):
+        """
+        Remove the least recently used entries until the cache is within its limits; the caller holds
+        the index lock.
+
+        Args:
+            index (dict): The index, updated in place.
+            keep (str, optional): A fingerprint that is never evicted, e.g. the entry just added.
+        Returns:
+            list: The evicted fingerprints.
+        """
+        evicted = []
+        total = sum(entry['size'] for entry in index.values())
+        for key in sorted(index, key=lambda key: index[key]['last_access']):
+            over_bytes = self.max_bytes is not None and total > self.max_bytes
+            over_entries = self.max_entries is not None and len(index) > self.max_entries
+            if not (over_bytes or over_entries):
+                break
+            if key == keep:
+                continue
+            entry = index.pop(key)
+            total -= entry['size']
+            try:
+                os.remove(os.path.join(self.cache_dir, entry['file']))
+            except FileNotFoundError:
+                pass
+            evicted.append(key)
+        return evicted
+
+    def clear(self):
+        """
+        Remove every entry of the cache.
+        """
+        with self.lock_index():
+            index = self.load_index()
+            for entry in index.values():
+                try:
+                    os.remove(os.path.join(self.cache_dir, entry['file']))
+                except FileNotFoundError:
+                    pass
+            self.save_index({})
+
+
+class ExampleCache:
+    """
+    Versioned snapshot of the SISEPUEDE example data used to prepare inputs.
+
+    Building `SISEPUEDEExamples()` imports and initializes the whole sisepuede package, although
+    preparing inputs only needs the example input frame, its column schema and the variable trajectory
+    group table. The first access builds the examples once and snapshots these tables under a
+    directory named after the installed sisepuede version; later accesses, in any notebook or process,
+    read the snapshot without importing sisepuede. Each table is loaded on its first access only.
+
+    The cache can be used in place of `SISEPUEDEExamples()`:
+
+        examples = ExampleCache()
+        df_inputs_example = examples.input_data_frame
+        df_vargroups = examples("variable_trajectory_group_specification")
+    """
+
+    TABLES = ['input_data_frame', 'variable_trajectory_group_specification']
+
+    def __init__(self, cache_dir=None, version=None):
+        """
+        Args:
+            cache_dir (str, optional): The directory of the snapshots. Defaults to a `.example_cache`
+                directory next to this module, shared by all the regions.
+            version (str, optional): The sisepuede version of the snapshot. Defaults to the installed
+                version, read from the package metadata without importing sisepuede; if sisepuede is
+                not installed, the most recent snapshot is used.
+        """
+        if cache_dir is None:
+            cache_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.example_cache')
+        self.cache_dir = cache_dir
+        self._version = version
+        self._tables = {}
+        self._schema = None
+
+    @property
+    def version(self):
+        if self._version is None:
+            self._version = self.get_installed_version() or self.get_latest_snapshot()
+        return self._version
+
+    @staticmethod
+    def get_installed_version():
+        """
+        Get the installed sisepuede version without importing the package.
+
+        Returns:
+            str: The version, or None if sisepuede is not installed.
+        """
+        from importlib.metadata import version, PackageNotFoundError
+
+        try:
+            return version('sisepuede')
+        except PackageNotFoundError:
+            return None
+
+    def get_latest_snapshot(self):
+        """
+        Get the version of the most recent complete snapshot.
+
+        Returns:
+            str: The version, or None if there is no snapshot.
+        """
+        snapshots = []
+        if os.path.isdir(self.cache_dir):
+            for version in os.listdir(self.cache_dir):
+                manifest_path = os.path.join(self.cache_dir, version, 'manifest.json')
+                if os.path.exists(manifest_path):
+                    snapshots.append((os.path.getmtime(manifest_path), version))
+        if not snapshots:
+            return None
+
+        version = max(snapshots)[1]
+        tracer.warning(f"sisepuede is not installed, using the example snapshot of version {version}.",
+                       event='example_cache_fallback', version=version)
+        return version
+
+    def get_snapshot_dir(self):
+        if self.version is None:
+            raise ImportError("sisepuede is not installed and there is no example snapshot in "
+                              f"{self.cache_dir}; install sisepuede to build one.")
+        safe_version = re.sub(r'[^A-Za-z0-9_.+-]', '_', self.version)
+        return os.path.join(self.cache_dir, safe_version)
+
+    def snapshot(self, examples=None):
+        """
+        Build the example tables and write them to the snapshot of the installed version.
+
+        Args:
+            examples (SISEPUEDEExamples, optional): The examples to snapshot. Defaults to a new
+                `SISEPUEDEExamples()`.
+        Returns:
+            str: The snapshot directory.
+        """
+        with tracer.stage('example_snapshot'):
+            if examples is None:
+                from sisepuede.manager.sisepuede_examples import SISEPUEDEExamples
+                examples = SISEPUEDEExamples()
+
+            snapshot_dir = self.get_snapshot_dir()
+            tables = {
+                'input_data_frame': examples.input_data_frame,
+                'variable_trajectory_group_specification': examples("variable_trajectory_group_specification"),
+            }
+            for name, df in tables.items():
+                write_frame(os.path.join(snapshot_dir, name), df)
+
+            df_example = tables['input_data_frame']
+            schema = {
+                'columns': [str(col) for col in df_example.columns],
+                'dtypes': [str(dtype) for dtype in df_example.dtypes],
+            }
+            with open(os.path.join(snapshot_dir, 'schema.json'), 'w') as file:
+                json.dump(schema, file)
+
+            # The manifest is written last and marks the snapshot as complete
+            with open(os.path.join(snapshot_dir, 'manifest.json'), 'w') as file:
+                json.dump({'version': self.version, 'created': time.time(), 'tables': list(tables)}, file, indent=2)
+
+        self._tables.update(tables)
+        self._schema = schema
+        tracer.info(f"SISEPUEDE examples {self.version} snapshot written to {snapshot_dir}",
+                    event='example_snapshot_written', version=self.version)
+        return snapshot_dir
+
+    def is_cached(self):
+        try:
+            return os.path.exists(os.path.join(self.get_snapshot_dir(), 'manifest.json'))
+        except ImportError:
+            return False
+
+    def get_table(self, name):
+        """
+        Get an example table, building the snapshot if there is none for the version.
+
+        Args:
+            name (str): One of `TABLES`.
+        Returns:
+            pd.DataFrame: The table.
+        """
+        if name not in self.TABLES:
+            raise KeyError(f"Unknown example table {name!r}, expected one of {self.TABLES}.")
+
+        df = self._tables.get(name)
+        if df is not None:
+            return df
+
+        if not self.is_cached():
+            tracer.count('example_cache_misses')
+            self.snapshot()
+            return self._tables[name]
+
+        tracer.count('example_cache_hits')
+        df = read_frame(os.path.join(self.get_snapshot_dir(), name))
+        self._tables[name] = df
+        return df
+
+    def __call__(self, name):
+        return self.get_table(name)
+
+    @property
+    def input_data_frame(self):
+        return self.get_table('input_data_frame')
+
+    @property
+    def variable_trajectory_groups(self):
+        return self.get_table('variable_trajectory_group_specification')
+
+    def get_schema(self):
+        """
+        Get the columns and dtypes of the example input frame without loading the frame.
+
+        Returns:
+            dict: The 'columns' and 'dtypes' lists.
+        """
+        if self._schema is None:
+            if not self.is_cached():
+                self.snapshot()
+            else:
+                with open(os.path.join(self.get_snapshot_dir(), 'schema.json'), 'r') as file:
+                    self._schema = json.load(file)
+        return self._schema
+
+    def clear(self):
+        """
+        Remove the snapshot of the version.
+        """
+        self._tables = {}
+        self._schema = None
+        snapshot_dir = self.get_snapshot_dir()
+        if os.path.isdir(snapshot_dir):
+            shutil.rmtree(snapshot_dir)
+
+
+# Caches shared by all the handlers of a session
+workbook_cache = WorkbookCache()
+example_cache = ExampleCache()
@@ -0,0 +1,174 @@
+import os
+
+import pandas as pd
+
+from OutputUtils import OutputStore
+from TraceUtils import tracer
+
+
+class SummaryExporter:
+    """
+    Streaming export of the merged inputs and outputs of a SISEPUEDE run.
+
+    Instead of merging the full output and input frames, the export reads the outputs and inputs of
+    one primary ID at a time, merges them and appends them to the package, so the peak memory is the
+    size of a single primary ID whatever the number of strategies. The package is either a single
+    wide CSV or a columnar store partitioned by primary ID (see `OutputUtils.OutputStore`).
+
+    Example:
+        exporter = SummaryExporter.from_sisepuede(ssp)
+        exporter.export_package(ssp, primary_ids=[0, 69069, 70070, 71071])
+    """
+
+    def __init__(self, read_output, read_input, dir_pkg, file_stem, file_format='csv', key_primary='primary_id'):
+        """
+        Args:
+            read_output (callable): A function returning the output frame of a primary ID.
+            read_input (callable): A function returning the input frame of a primary ID.
+            dir_pkg (str): The package directory.
+            file_stem (str): The name of the merged file, without extension.
+            file_format (str, optional): 'csv' or 'parquet'. Defaults to 'csv'.
+            key_primary (str, optional): The primary key field. Defaults to 'primary_id'.
+        """
+        if file_format not in ('csv', 'parquet'):
+            raise ValueError(f"Unknown export format {file_format!r}, expected 'csv' or 'parquet'.")
+        self.read_output = read_output
+        self.read_input = read_input
+        self.dir_pkg = dir_pkg
+        self.file_stem = file_stem
+        self.file_format = file_format
+        self.key_primary = key_primary
+
+    @classmethod
+    def from_sisepuede(cls, ssp, dir_pkg=None, file_format='csv'):
+        """
+        Build an exporter that reads from a SISEPUEDE session. Inputs that were not saved with the run
+        are rebuilt with `generate_scenario_database_from_primary_key`, one primary ID at a time.
+
+        Args:
+            ssp (sisepuede.SISEPUEDE): The SISEPUEDE session.
+            dir_pkg (str, optional): The package directory. Defaults to
+                `<output directory>/sisepuede_summary_results_run_<id>`, as in the notebooks.
+            file_format (str, optional): 'csv' or 'parquet'. Defaults to 'csv'.
+        Returns:
+            SummaryExporter: The exporter.
+        """
+        if dir_pkg is None:
+            dir_pkg = os.path.join(ssp.file_struct.dir_out, f"sisepuede_summary_results_run_{ssp.id_fs_safe}")
+
+        def read_input(primary_id):
+            df_in = ssp.read_input([primary_id])
+            if df_in is not None and len(df_in) > 0:
+                return df_in
+            # Build if unable to simply read the data frame
+            dict_in = ssp.generate_scenario_database_from_primary_key(primary_id)
+            frames = [dict_in.get(region) for region in ssp.regions if dict_in.get(region) is not None]
+            return pd.concat(frames, axis=0).reset_index(drop=True) if frames else None
+
+        return cls(
+            read_output=lambda primary_id: ssp.read_output([primary_id]),
+            read_input=read_input,
+            dir_pkg=dir_pkg,
+            file_stem=f"sisepuede_results_{ssp.id_fs_safe}_WIDE_INPUTS_OUTPUTS",
+            file_format=file_format,
+            key_primary=ssp.key_primary,
+        )
+
+    def get_export_path(self):
+        extension = '.csv' if self.file_format == 'csv' else ''
+        return os.path.join(self.dir_pkg, f"{self.file_stem}{extension}")
+
+    def iter_merged(self, primary_ids):
+        """
+        Yield the merged outputs and inputs of each primary ID, with the columns of the first one.
+
+        Args:
+            primary_ids (list): The primary IDs.
+        Yields:
+            pd.DataFrame: The merged frame of a primary ID.
+        """
+        columns = None
+        for primary_id in primary_ids:
+            with tracer.stage('merge_primary', primary_id=primary_id):
+                df_out = self.read_output(primary_id)
+                if df_out is None or len(df_out) == 0:
+                    tracer.warning(f"No outputs found for primary_id {primary_id}.", event='export_no_outputs', primary_id=primary_id)
+                    continue
+                df_in = self.read_input(primary_id)
+                if df_in is None or len(df_in) == 0:
+                    tracer.warning(f"No inputs found for primary_id {primary_id}, exporting its outputs only.",
+                                   event='export_no_inputs', primary_id=primary_id)
+                    df_merged = df_out
+                else:
+                    df_merged = pd.merge(df_out, df_in, how='left')
+
+            # Every chunk must have the same columns to be appended
+            if columns is None:
+                columns = list(df_merged.columns)
+            elif list(df_merged.columns) != columns:
+                extra = [col for col in df_merged.columns if col not in columns]
+                if extra:
+                    tracer.warning(f"Columns of primary_id {primary_id} not in the export are dropped: {extra}",
+                                   event='export_columns_dropped', primary_id=primary_id, columns=extra)
+                df_merged = df_merged.reindex(columns=columns)
+            tracer.count('primaries_exported')
+            yield df_merged
+
+    def export(self, primary_ids):
+        """
+        Merge the outputs and inputs of the primary IDs and append them to the package, one primary ID
+        at a time. The file is written under a temporary name and renamed once complete.
+
+        Args:
+            primary_ids (list): The primary IDs.
+        Returns:
+            str: The path of the merged CSV or of the columnar store.
+        """
+        os.makedirs(self.dir_pkg, exist_ok=True)
+        export_path = self.get_export_path()
+
+        with tracer.stage('export_merged', n_primaries=len(primary_ids), file_format=self.file_format):
+            if self.file_format == 'parquet':
+                OutputStore(export_path).write(self.iter_merged(primary_ids), partition_field=self.key_primary, source=self.file_stem)
+            else:
+                tmp_path = f"{export_path}.tmp"
+                try:
+                    header = True
+                    for df_merged in self.iter_merged(primary_ids):
+                        df_merged.to_csv(tmp_path, mode='w' if header else 'a', header=header, index=None, encoding='UTF-8')
+                        header = False
+                    if header:
+                        raise ValueError("No outputs found for the primary IDs, nothing was exported.")
+                    os.replace(tmp_path, export_path)
+                finally:
+                    if os.path.exists(tmp_path):
+                        os.remove(tmp_path)
+
+        tracer.info(f"Merged inputs and outputs exported to {export_path}", event='export_written', export_path=export_path)
+        return export_path
+
+    def export_package(self, ssp, primary_ids):
+        """
+        Export the summary package of a SISEPUEDE run: the ATTRIBUTE_STRATEGY and ATTRIBUTE_PRIMARY
+        tables and the merged inputs and outputs.
+
+        Args:
+            ssp (sisepuede.SISEPUEDE): The SISEPUEDE session.
+            primary_ids (list): The primary IDs of the run.
+        Returns:
+            str: The path of the merged CSV or of the columnar store.
+        """
+        os.makedirs(self.dir_pkg, exist_ok=True)
+        primary_ids = sorted(primary_ids)
+
+        for tab in ["ATTRIBUTE_STRATEGY"]:
+            table_df = ssp.database.db.read_table(tab)
+            if table_df is None:
+                tracer.warning(f"Table {tab} not found in the database, skipping its export.", event='export_table_missing', table=tab)
+                continue
+            table_df.to_csv(os.path.join(self.dir_pkg, f"{tab}.csv"), index=None, encoding="UTF-8")
+
+        df_primary = ssp.odpt_primary.get_indexing_dataframe(primary_ids)
+        df_primary.to_csv(os.path.join(self.dir_pkg, "ATTRIBUTE_PRIMARY.csv"), index=None, encoding="UTF-8")
+
+        return self.export(primary_ids)
@@ -1,5 +1,148 @@
+import numpy as np
+import pandas as pd
 import yaml
 
+from CacheUtils import example_cache
+from TraceUtils import tracer
+
+
+class InputSchema:
+    """
+    Compiled column schema of the SISEPUEDE input data frame.
+
+    The schema is built once from an example input frame (usually
+    `SISEPUEDEExamples().input_data_frame`) and then used to align any regional input frame
+    with a single concat/reindex, instead of inserting missing columns one at a time into a
+    frame with thousands of columns.
+
+    Attributes
+    ----------
+    columns : pandas.Index
+        The columns of the example frame, in order.
+    dtypes : pandas.Series
+        The dtypes of the example frame, indexed by column.
+    """
+
+    def __init__(self, df_example):
+        """
+        Args:
+            df_example (pandas.DataFrame): The SSP example DataFrame; its columns, dtypes and
+                values are used to fill missing columns.
+        """
+        self.df_example = df_example
+        self.columns = df_example.columns
+        self.dtypes = df_example.dtypes
+        self._column_set = set(self.columns)
+
+    @classmethod
+    def from_examples(cls, use_cache=True):
+        """
+        Build the schema from the SISEPUEDE example input data frame.
+
+        Args:
+            use_cache (bool, optional): Whether to read the example frame from the versioned snapshot
+                (see `CacheUtils.ExampleCache`) instead of building `SISEPUEDEExamples()`. Defaults to True.
+        Returns:
+            InputSchema: The compiled schema.
+        """
+        if use_cache:
+            return cls(example_cache.input_data_frame)
+
+        from sisepuede.manager.sisepuede_examples import SISEPUEDEExamples
+
+        return cls(SISEPUEDEExamples().input_data_frame)
+
+    def diff(self, df_input):
+        """
+        Compare the columns and dtypes of an input frame with the schema.
+
+        Args:
+            df_input (pandas.DataFrame): Your input df DataFrame to compare.
+        Returns:
+            dict: A dictionary with the keys:
+                - "missing" (list): Columns in the schema but not in df_input, in schema order.
+                - "extra" (list): Columns in df_input but not in the schema, in df_input order.
+                - "dtype_mismatch" (dict): Shared columns whose dtype differs, mapped to a
+                  (schema dtype, input dtype) tuple.
+        """
+        input_columns = set(df_input.columns)
+        missing = [col for col in self.columns if col not in input_columns]
+        extra = [col for col in df_input.columns if col not in self._column_set]
+
+        shared = self.columns[self.columns.isin(df_input.columns)]
+        input_dtypes = df_input.dtypes
+        if input_dtypes.index.has_duplicates:
+            input_dtypes = input_dtypes[~input_dtypes.index.duplicated()]
+        input_dtypes = input_dtypes.reindex(shared)
+        schema_dtypes = self.dtypes.reindex(shared)
+        mismatch = schema_dtypes != input_dtypes
+        dtype_mismatch = {
+            col: (schema_dtypes[col], input_dtypes[col]) for col in shared[mismatch.to_numpy()]
+        }
+
+        return {"missing": missing, "extra": extra, "dtype_mismatch": dtype_mismatch}
+
+    def add_missing(self, df_input, missing=None):
+        """
+        Add the schema columns missing from an input frame in one concat, keeping the input's
+        column order and appending the missing columns in schema order. The values of the missing
+        columns are taken from the example frame, aligned on the index.
+
+        Args:
+            df_input (pandas.DataFrame): Your input df DataFrame.
+            missing (list, optional): The missing columns, if already computed with `diff`.
+        Returns:
+            pandas.DataFrame: The input DataFrame with the missing columns added.
+        """
+        if missing is None:
+            missing = self.diff(df_input)["missing"]
+        if not missing:
+            return df_input
+
+        df_missing = self.df_example[missing].reindex(df_input.index)
+        return pd.concat([df_input, df_missing], axis=1)
+
+    def align(self, df_input, drop_extra=True, cast_dtypes=True, downcast_float32=False):
+        """
+        Align an input frame with the schema in a single pass.
+
+        Args:
+            df_input (pandas.DataFrame): Your input df DataFrame.
+            drop_extra (bool, optional): Whether to drop the columns that are not in the schema.
+                If False, they are kept after the schema columns. Defaults to True.
+            cast_dtypes (bool, optional): Whether to cast the columns to the schema dtypes. Columns
+                that can't be cast keep their dtype. Defaults to True.
+            downcast_float32 (bool, optional): Whether to downcast float64 columns to float32.
+                Defaults to False.
+        Returns:
+            tuple: The aligned DataFrame and the diff of the original input frame (see `diff`).
+        """
+        schema_diff = self.diff(df_input)
+        df_aligned = self.add_missing(df_input, schema_diff["missing"])
+
+        columns = list(self.columns)
+        if not drop_extra:
+            columns += schema_diff["extra"]
+        df_aligned = df_aligned.reindex(columns=columns)
+
+        if cast_dtypes and schema_diff["dtype_mismatch"]:
+            casts = {}
+            for col, (dtype, _) in schema_diff["dtype_mismatch"].items():
+                try:
+                    casts[col] = df_aligned[col].astype(dtype)
+                except (TypeError, ValueError):
+                    continue
+            if casts:
+                df_aligned = df_aligned.assign(**casts)
+
+        if downcast_float32:
+            float_cols = df_aligned.columns[(df_aligned.dtypes == np.float64).to_numpy()]
+            if len(float_cols) > 0:
+                df_aligned = df_aligned.astype({col: np.float32 for col in float_cols})
+
+        return df_aligned, schema_diff
+
+
 class GeneralUtils:
     """
     A utility class that provides general helper functions.
@@ -14,11 +157,14 @@ class GeneralUtils:
         Returns:
         dict: A dictionary containing the retrieved values.
         None: If the file is not found or there is an error parsing the YAML file.
-    compare_dfs(df1, df2):
+    compare_dfs(df1, df2, return_diff=False):
         Compares the columns of two DataFrames and prints the differences.
         Parameters:
         df1 (pandas.DataFrame): The first DataFrame.
         df2 (pandas.DataFrame): The second DataFrame.
+        return_diff (bool, optional): Whether to return the differences. Defaults to False.
+        Returns:
+        dict: The structured diff if return_diff is True, see InputSchema.diff; otherwise None.
     add_missing_cols(df1, df2):
         Adds missing columns from df1 to df2.
         Parameters:
@@ -31,9 +177,9 @@ class GeneralUtils:
 
     def __init__(self):
         """
-        Initializes the instance of the class. Currently, this constructor does not perform any operations.
+        Initializes the instance of the class. The compiled InputSchema of the last example DataFrame is kept so it is reused across calls.
         """
-        pass
+        self._input_schema = None
 
 
     def get_yaml_values(sefl, file_path):
@@ -46,6 +192,8 @@ class GeneralUtils:
                 - "country_name" (str): The name of the country.
                 - "ssp_input_file_name" (str): The name of the SSP input file.
                 - "ssp_transformation_cw" (str): The SSP transformation CW value.
+                - "strategies" (list): The strategies to add or update with StrategyCSVHandler, each a
+                  dictionary of add_strategy arguments. Empty if the config doesn't list any.
             None: If the file is not found or there is an error parsing the YAML file.
         Raises:
             FileNotFoundError: If the file is not found at the given file path.
@@ -61,24 +209,26 @@ class GeneralUtils:
             country_name = data.get("country_name", "Not found")
             ssp_input_file_name = data.get("ssp_input_file_name", "Not found")
             ssp_transformation_cw = data.get("ssp_transformation_cw", "Not found")
+            strategies = data.get("strategies") or []
             
             # Print the values
-            print("Country Name:", country_name)
-            print("SSP Input File Name:", ssp_input_file_name)
-            print("SSP Transformation CW:", ssp_transformation_cw)
+            tracer.info(f"Country Name: {country_name}", event='config_value', key='country_name', value=country_name)
+            tracer.info(f"SSP Input File Name: {ssp_input_file_name}", event='config_value', key='ssp_input_file_name', value=ssp_input_file_name)
+            tracer.info(f"SSP Transformation CW: {ssp_transformation_cw}", event='config_value', key='ssp_transformation_cw', value=ssp_transformation_cw)
             
             # Return the values as a dictionary
             return {
                 "country_name": country_name,
                 "ssp_input_file_name": ssp_input_file_name,
-                "ssp_transformation_cw": ssp_transformation_cw
+                "ssp_transformation_cw": ssp_transformation_cw,
+                "strategies": strategies
             }
         
         except FileNotFoundError:
-            print(f"Error: File not found at {file_path}")
+            tracer.error(f"Error: File not found at {file_path}", event='config_not_found', file_path=str(file_path))
             return None
         except yaml.YAMLError as e:
-            print(f"Error parsing YAML file: {e}")
+            tracer.error(f"Error parsing YAML file: {e}", event='config_parse_failed', file_path=str(file_path), error=repr(e))
             return None
 
     # Example usage
@@ -87,56 +237,68 @@ class GeneralUtils:
         result = get_yaml_values(yaml_file_path)
 
         
-    def compare_dfs(self, df_example, df_input):
+    def compare_dfs(self, df_example, df_input, return_diff=False):
         """
         Compares the columns of two pandas DataFrames and prints the differences.
         Parameters:
-        df_example (pandas.DataFrame): The SSP example DataFrame to compare.
+        df_example (pandas.DataFrame or InputSchema): The SSP example DataFrame, or its compiled schema, to compare.
         df_input (pandas.DataFrame): Your input df DataFrame to compare.
+        return_diff (bool, optional): Whether to return the structured diff. Defaults to False, so notebook
+            cells only show the printed differences.
         Returns:
-        None
+        dict: The structured diff if return_diff is True, see InputSchema.diff; otherwise None.
         Prints:
         - Columns present in df_example but not in df_input.
         - Columns present in df_input but not in df_example.
         """
+        schema_diff = self.get_input_schema(df_example).diff(df_input)
 
-        # Assuming your DataFrames are df_example and df_input
-        columns_df_example = set(df_example.columns)
-        columns_df_input = set(df_input.columns)
+        tracer.info(f"Columns in df_example but not in df_input: {set(schema_diff['missing'])}", event='schema_missing', n_columns=len(schema_diff["missing"]))
+        tracer.info(f"Columns in df_input but not in df_example: {set(schema_diff['extra'])}", event='schema_extra', n_columns=len(schema_diff["extra"]))
 
-        # Columns present in df_example but not in df_input
-        diff_in_df_example = columns_df_example - columns_df_input
+        if return_diff:
+            return schema_diff
+        return None
 
-        # Columns present in df_input but not in df_example
-        diff_in_df_input = columns_df_input - columns_df_example
+    def get_input_schema(self, df_example):
+        """
+        Get the compiled schema of an example DataFrame, reusing it while the same DataFrame is passed.
+        Parameters:
+        df_example (pandas.DataFrame or InputSchema): The SSP example DataFrame or its compiled schema.
+        Returns:
+        InputSchema: The compiled schema.
+        """
+        if isinstance(df_example, InputSchema):
+            return df_example
 
-        print("Columns in df_example but not in df_input:", diff_in_df_example)
-        print("Columns in df_input but not in df_example:", diff_in_df_input)
+        schema = self._input_schema
+        if schema is None or schema.df_example is not df_example:
+            schema = InputSchema(df_example)
+            self._input_schema = schema
+        return schema
 
     def add_missing_cols(self, df_example, df_input):
         
         # Identify columns in df_example but not in df_input
-        columns_to_add = [col for col in df_example.columns if col not in df_input.columns]
+        schema = self.get_input_schema(df_example)
+        columns_to_add = schema.diff(df_input)["missing"]
 
         # Check if there are any columns to add
         if not columns_to_add:
-            print("No missing columns to add.")
+            tracer.info("No missing columns to add.", event='no_missing_columns')
             return df_input
 
-        # Add missing columns to df2 with their values from df1
-        for col in columns_to_add:
-            df_input[col] = df_example[col]
-        
-        return df_input
+        # Add all the missing columns at once with their values from df_example
+        return schema.add_missing(df_input, columns_to_add)
     
     def remove_additional_cols(self, df_example, df_input):
         
         # Identify columns in df_input but not in df_example
-        columns_to_remove = [col for col in df_input.columns if col not in df_example.columns]
+        columns_to_remove = self.get_input_schema(df_example).diff(df_input)["extra"]
 
         # Check if there are any columns to remove
         if not columns_to_remove:
-            print("No additional columns to remove.")
+            tracer.info("No additional columns to remove.", event='no_additional_columns')
             return df_input
 
         # Remove additional columns from df_input
@@ -0,0 +1,450 @@
+import hashlib
+import json
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+from CacheUtils import read_frame, write_frame
+from TraceUtils import tracer
+from TransformationUtils import get_file_hash
+
+
+# IEA country profile exports, e.g. "International Energy Agency - electricity generation sources in Iran.csv"
+IEA_FILE_PATTERN = r'International Energy Agency - (.*\D)\.csv'
+LONG_FIELDS = ['region', 'dataset', 'category', 'year', 'value', 'units']
+
+
+def get_iea_fuel_to_entc_pp_dicts(model_attributes, attribute_field_fuel='electricity_generation_cat_fuel', flag_ccs='_ccs'):
+    """
+    Retrieve the dictionaries mapping ENTC power plant categories to ENFU fuels and ENFU fuels to the
+    power plant used to allocate IEA data. Power plants with CCS are excluded from the allocation.
+
+    Args:
+        model_attributes (ModelAttributes): The SISEPUEDE model attributes.
+        attribute_field_fuel (str, optional): The field of the ENTC attribute table storing the fuel
+            used by each technology. Defaults to 'electricity_generation_cat_fuel'.
+        flag_ccs (str, optional): The flag of the ENTC categories with CCS. Defaults to '_ccs'.
+    Returns:
+        tuple: The (power plant -> fuel, fuel -> power plant) dictionaries.
+    """
+    from sisepuede.core.model_attributes import clean_schema
+
+    attr_enfu = model_attributes.get_attribute_table(model_attributes.subsec_name_enfu)
+    attr_entc = model_attributes.get_attribute_table(model_attributes.subsec_name_entc)
+
+    dict_entc_pp_cat_to_enfu_cat = {}
+    for cat in attr_entc.key_values:
+        fuel = clean_schema(attr_entc.get_attribute(cat, attribute_field_fuel))
+        if fuel in attr_enfu.key_values:
+            dict_entc_pp_cat_to_enfu_cat[cat] = fuel
+
+    # Allocate each fuel to its first power plant without CCS
+    dict_enfu_cat_to_entc_pp_cat = {}
+    for cat, fuel in dict_entc_pp_cat_to_enfu_cat.items():
+        if flag_ccs not in cat:
+            dict_enfu_cat_to_entc_pp_cat.setdefault(fuel, cat)
+
+    return dict_entc_pp_cat_to_enfu_cat, dict_enfu_cat_to_entc_pp_cat
+
+
+def get_iea_fuel_to_field_map(model_attributes, df_crosswalk, modvar='NemoMod MinShareProduction', **kwargs):
+    """
+    Build the map from IEA fuels to the fields of a power plant model variable, from the IEA fuel
+    crosswalk of the SISEPUEDE reference data (`data_crosswalks/iea_fuel_categories.csv`).
+
+    Args:
+        model_attributes (ModelAttributes): The SISEPUEDE model attributes.
+        df_crosswalk (pd.DataFrame): The crosswalk, with an `iea_fuel` column and the ENFU category column.
+        modvar (str, optional): The model variable. Defaults to 'NemoMod MinShareProduction'.
+        **kwargs: Passed to `get_iea_fuel_to_entc_pp_dicts`.
+    Returns:
+        dict: The IEA fuel -> input field map.
+    """
+    from sisepuede.core.model_attributes import clean_schema
+
+    _, dict_enfu_cat_to_entc_pp_cat = get_iea_fuel_to_entc_pp_dicts(model_attributes, **kwargs)
+    field_enfu = model_attributes.get_subsector_attribute(model_attributes.subsec_name_enfu, 'primary_category')
+    dict_cats_to_field = model_attributes.get_category_replacement_field_dict(model_attributes.get_variable(modvar))
+
+    field_map = {}
+    for iea_fuel, enfu_cat in zip(df_crosswalk['iea_fuel'], df_crosswalk[field_enfu]):
+        field = dict_cats_to_field.get(dict_enfu_cat_to_entc_pp_cat.get(clean_schema(enfu_cat)))
+        if field is not None:
+            field_map[iea_fuel] = field
+    return field_map
+
+
+class IEATarget:
+    """
+    Specification of the input fields built from one IEA dataset.
+
+    Example:
+        IEATarget(
+            'electricity generation sources',
+            field_map={'Coal': 'nemomod_entc_frac_min_share_production_pp_coal', ...},
+            calculate_proportion=True,
+        )
+    """
+
+    def __init__(self, dataset, field_map, fields=None, calculate_proportion=False, scale=1.0, fill_value=0.0):
+        """
+        Args:
+            dataset (str): The IEA dataset, i.e. the file name without the prefix and the country,
+                e.g. 'electricity generation sources'.
+            field_map (dict): The IEA category -> input field map. Categories mapped to the same field
+                are summed, and categories that are not mapped are dropped.
+            fields (list, optional): All the fields of the target; in the regions that have the
+                target's dataset, fields without IEA data are set to `fill_value`. Defaults to the
+                fields of `field_map`.
+            calculate_proportion (bool, optional): Whether to convert the values to shares of the
+                region's total for each year, before the categories are mapped. Defaults to False.
+            scale (float, optional): A factor applied to the values, e.g. to convert units. Defaults to 1.
+            fill_value (float, optional): The value of the fields without IEA data in the regions that
+                have the target's dataset; regions without it are left empty. Defaults to 0.
+        """
+        self.dataset = dataset
+        self.field_map = dict(field_map)
+        self.fields = list(fields) if fields is not None else list(dict.fromkeys(self.field_map.values()))
+        self.calculate_proportion = calculate_proportion
+        self.scale = scale
+        self.fill_value = fill_value
+
+    def get_record(self):
+        return {
+            'dataset': self.dataset,
+            'field_map': self.field_map,
+            'fields': self.fields,
+            'calculate_proportion': self.calculate_proportion,
+            'scale': self.scale,
+            'fill_value': self.fill_value,
+        }
+
+
+class IEAIngestor:
+    """
+    Ingestion of IEA country profile exports for many regions at once.
+
+    The `iran/iran_data_modifications` notebook reads the IEA files of one region into a dictionary
+    and reshapes each dataset with a loop over years. Here every file of every region is parsed into
+    a single long table (region, dataset, category, year, value, units), and all the targets are
+    built from it with one groupby and one pivot, reindexed on the time periods of each region and
+    written into the input frame in a single assignment.
+
+    Parsed files are cached as Feather sidecars keyed on their content hash, and the pivoted table is
+    cached on the hashes of all the files and the target specifications, so refreshing unchanged IEA
+    inputs only reads the cached table.
+
+    Example:
+        ingestor = IEAIngestor()
+        files = ingestor.discover('.')  # <region>/data/International Energy Agency - *.csv
+        df_inputs = ingestor.refresh(df_inputs, files, [target_msp])
+    """
+
+    def __init__(self, cache_dir=None, year_0=2015, key_region='region', key_time_period='time_period'):
+        """
+        Args:
+            cache_dir (str, optional): The directory of the cached tables. Defaults to a `.iea_cache`
+                directory next to the IEA files.
+            year_0 (int, optional): The year of time period 0. Defaults to 2015.
+            key_region (str, optional): The region field of the input frame. Defaults to 'region'.
+            key_time_period (str, optional): The time period field of the input frame. Defaults to 'time_period'.
+        """
+        self.cache_dir = cache_dir
+        self.year_0 = year_0
+        self.key_region = key_region
+        self.key_time_period = key_time_period
+
+    def get_cache_dir(self, file_path):
+        if self.cache_dir is not None:
+            return self.cache_dir
+        return os.path.join(os.path.dirname(os.path.abspath(file_path)), '.iea_cache')
+
+    def discover(self, directories, data_subdir='data', pattern=IEA_FILE_PATTERN):
+        """
+        Find the IEA files of each region.
+
+        Args:
+            directories (str or dict): Either a root directory with one `<region>/<data_subdir>` directory
+                per region, or a region -> data directory dictionary.
+            data_subdir (str, optional): The data directory of each region under the root. Defaults to 'data'.
+            pattern (str, optional): The regular expression of the IEA file names; its first group is
+                the dataset name followed by the country. Defaults to `IEA_FILE_PATTERN`.
+        Returns:
+            pd.DataFrame: One row per file, with the region, dataset, country and path.
+        """
+        if isinstance(directories, str):
+            root = directories
+            directories = {
+                region: os.path.join(root, region, data_subdir)
+                for region in sorted(os.listdir(root))
+                if os.path.isdir(os.path.join(root, region, data_subdir))
+            }
+
+        regex = re.compile(pattern)
+        records = []
+        for region, directory in directories.items():
+            for file_name in sorted(os.listdir(directory)):
+                match = regex.match(file_name)
+                if match is None:
+                    continue
+                dataset, _, country = match.groups()[0].rpartition(' in ')
+                if not dataset:
+                    dataset, country = country, None
+                records.append({
+                    'region': region,
+                    'dataset': dataset,
+                    'country': country,
+                    'path': os.path.join(directory, file_name),
+                })
+
+        tracer.count('iea_files_found', len(records))
+        return pd.DataFrame(records, columns=['region', 'dataset', 'country', 'path'])
+
+    def read_file(self, region, dataset, path):
+        """
+        Parse an IEA file into the long format, from its sidecar when it was already parsed.
+
+        Args:
+            region (str): The region of the file.
+            dataset (str): The dataset of the file.
+            path (str): The path of the file.
+        Returns:
+            pd.DataFrame: The long table of the file, with the `LONG_FIELDS` columns.
+        """
+        digest = get_file_hash(path)
+        safe_dataset = re.sub(r'[^A-Za-z0-9_.-]', '_', dataset)
+        sidecar_stem = os.path.join(self.get_cache_dir(path), f"{region}__{safe_dataset}__{digest[:16]}")
+
+        df = read_frame(sidecar_stem)
+        if df is not None:
+            tracer.count('iea_cache_hits')
+            return df
+
+        tracer.count('iea_cache_misses')
+        df_raw = pd.read_csv(path)
+        # The category column is named after the dataset and the country
+        df = pd.DataFrame({
+            'region': region,
+            'dataset': dataset,
+            'category': df_raw.iloc[:, 0].astype(str).str.strip(),
+            'year': pd.to_numeric(df_raw['Year'], errors='coerce'),
+            'value': pd.to_numeric(df_raw['Value'], errors='coerce'),
+            'units': df_raw['Units'].astype(str).str.strip() if 'Units' in df_raw else None,
+        }, columns=LONG_FIELDS)
+        df = df.dropna(subset=['year']).astype({'year': int})
+        write_frame(sidecar_stem, df)
+        return df
+
+    def read(self, files):
+        """
+        Parse IEA files into a single long table.
+
+        Args:
+            files (pd.DataFrame): The files, as returned by `discover`.
+        Returns:
+            pd.DataFrame: The long table, with the `LONG_FIELDS` columns.
+        """
+        with tracer.stage('iea_read', n_files=len(files)):
+            frames = [
+                self.read_file(region, dataset, path)
+                for region, dataset, path in zip(files['region'], files['dataset'], files['path'])
+            ]
+        if not frames:
+            return pd.DataFrame(columns=LONG_FIELDS)
+        return pd.concat(frames, axis=0, ignore_index=True)
+
+    def pivot(self, df_long, targets, time_periods):
+        """
+        Build the input fields of the targets for every region in one pass: shares are computed with a
+        groupby transform, categories are mapped to fields, values are summed by region, year and field
+        and pivoted wide. Each region is then reindexed on the time periods and filled backwards and
+        forwards from its IEA years. The fields of a target are left empty for the regions without
+        the target's dataset, so `apply` keeps their current inputs.
+
+        Args:
+            df_long (pd.DataFrame): The long table, as returned by `read`.
+            targets (list): The `IEATarget` specifications.
+            time_periods (list): The time periods of the input frame.
+        Returns:
+            pd.DataFrame: The region and time period fields followed by the fields of the targets.
+        """
+        key_region, key_time_period = self.key_region, self.key_time_period
+        fields = list(dict.fromkeys(field for target in targets for field in target.fields))
+        time_periods = np.sort(np.unique(np.asarray(time_periods, dtype=int)))
+
+        # One row per (dataset, category) of every target
+        df_map = pd.DataFrame([
+            {
+                'dataset': target.dataset,
+                'category': category,
+                'field': field,
+                'proportion': target.calculate_proportion,
+                'scale': target.scale,
+            }
+            for target in targets for category, field in target.field_map.items()
+        ], columns=['dataset', 'category', 'field', 'proportion', 'scale'])
+
+        df = df_long[df_long['dataset'].isin([target.dataset for target in targets])]
+        df = df.assign(value=df['value'].fillna(0.0))
+
+        # Shares over all the categories of a dataset, before the unmapped ones are dropped
+        totals = df.groupby(['region', 'dataset', 'year'])['value'].transform('sum')
+        df = df.assign(share=(df['value'] / totals.where(totals != 0)).fillna(0.0))
+        df = df.merge(df_map, on=['dataset', 'category'], how='inner')
+        df = df.assign(value=np.where(df['proportion'], df['share'], df['value']) * df['scale'])
+
+        df = df.assign(time_period=df['year'] - self.year_0)
+        df_wide = (
+            df.groupby(['region', 'time_period', 'field'], sort=False)['value']
+            .sum()
+            .unstack('field')
+        )
+
+        # Reindex every region on all the time periods and fill from the nearest IEA year
+        regions = df_long['region'].unique()
+        full_index = pd.MultiIndex.from_product([regions, time_periods], names=['region', 'time_period'])
+        df_wide = (
+            df_wide.reindex(index=full_index, columns=fields)
+            .groupby(level='region', sort=False)
+            .transform(lambda col: col.bfill().ffill())
+        )
+
+        # Fields without IEA data get the fill value of their target, only in the regions that have
+        # the target's dataset; the first target of a field wins
+        region_values = df_wide.index.get_level_values('region')
+        filled = set()
+        for target in targets:
+            target_fields = [field for field in target.fields if field not in filled]
+            filled.update(target_fields)
+            target_regions = df_long.loc[df_long['dataset'] == target.dataset, 'region'].unique()
+            rows = region_values.isin(target_regions)
+            if target_fields and rows.any():
+                df_wide.loc[rows, target_fields] = df_wide.loc[rows, target_fields].fillna(target.fill_value)
+
+        df_wide.index = df_wide.index.set_names([key_region, key_time_period])
+        return df_wide.reset_index()
+
+    def get_pivot_stem(self, files, targets, time_periods):
+        """
+        Build the path of the cached pivoted table, keyed on the content of the files, the targets and
+        the time periods.
+
+        Args:
+            files (pd.DataFrame): The files, as returned by `discover`.
+            targets (list): The `IEATarget` specifications.
+            time_periods (list): The time periods of the input frame.
+        Returns:
+            str: The cache path without extension.
+        """
+        payload = {
+            'files': sorted(
+                [region, dataset, get_file_hash(path)]
+                for region, dataset, path in zip(files['region'], files['dataset'], files['path'])
+            ),
+            'targets': [target.get_record() for target in targets],
+            'time_periods': sorted(int(tp) for tp in np.unique(time_periods)),
+            'year_0': self.year_0,
+            'keys': [self.key_region, self.key_time_period],
+            # Bumped when the pivot itself changes, so older cached tables are not reused
+            'pivot_version': 2,
+        }
+        digest = hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+        # Without a cache directory, the table goes next to the files, or under their common root
+        cache_dir = self.cache_dir
+        if cache_dir is None:
+            root = os.path.commonpath([os.path.dirname(os.path.abspath(path)) for path in files['path']])
+            cache_dir = os.path.join(root, '.iea_cache')
+        return os.path.join(cache_dir, f"pivot__{digest[:16]}")
+
+    def build(self, files, targets, time_periods):
+        """
+        Build the input fields of the targets from the IEA files, from the cache when the files and
+        the targets didn't change.
+
+        Args:
+            files (pd.DataFrame): The files, as returned by `discover`.
+            targets (list): The `IEATarget` specifications.
+            time_periods (list): The time periods of the input frame.
+        Returns:
+            pd.DataFrame: The region and time period fields followed by the fields of the targets.
+        """
+        if len(files) == 0:
+            raise ValueError("No IEA files to build the inputs from.")
+
+        missing = sorted({target.dataset for target in targets} - set(files['dataset']))
+        if missing:
+            tracer.warning(f"No IEA files found for the datasets {missing}; their fields are set to their fill values.",
+                           event='iea_missing_datasets', datasets=missing)
+
+        pivot_stem = self.get_pivot_stem(files, targets, time_periods)
+        df_wide = read_frame(pivot_stem)
+        if df_wide is not None:
+            tracer.count('iea_cache_hits')
+            return df_wide
+
+        tracer.count('iea_cache_misses')
+        with tracer.stage('iea_pivot', n_files=len(files), n_targets=len(targets)):
+            df_wide = self.pivot(self.read(files), targets, time_periods)
+        write_frame(pivot_stem, df_wide)
+        return df_wide
+
+    def apply(self, df_inputs, df_wide, add_missing=False):
+        """
+        Write the IEA fields into an input frame, aligned on its region and time period fields. Rows of
+        regions without IEA data, and fields left empty for regions without a target's dataset, keep
+        their values.
+
+        Args:
+            df_inputs (pd.DataFrame): The input frame, with one or several regions.
+            df_wide (pd.DataFrame): The IEA fields, as returned by `build`.
+            add_missing (bool, optional): Whether to add the IEA fields that are not in the input frame.
+                If False, they are skipped with a warning. Defaults to False.
+        Returns:
+            pd.DataFrame: A copy of the input frame with the IEA fields.
+        """
+        keys = [self.key_region, self.key_time_period]
+        fields = [col for col in df_wide.columns if col not in keys]
+        missing = [col for col in fields if col not in df_inputs.columns]
+        if missing and not add_missing:
+            tracer.warning(f"IEA fields not in the input frame are skipped: {missing}",
+                           event='iea_fields_skipped', fields=missing)
+            fields = [col for col in fields if col in df_inputs.columns]
+
+        # Align the IEA rows on the input rows with a single index lookup
+        index_inputs = pd.MultiIndex.from_frame(df_inputs[keys])
+        df_aligned = df_wide.set_index(keys)[fields].reindex(index_inputs)
+        df_aligned.index = df_inputs.index
+
+        df_current = df_inputs.reindex(columns=fields)
+        values = df_aligned.where(df_aligned.notna(), df_current)
+
+        df_out = df_inputs.copy()
+        df_out[fields] = values
+        tracer.count('iea_fields_written', len(fields))
+        tracer.info(f"IEA data written to {len(fields)} fields for {df_aligned.notna().any(axis=1).sum()} rows.",
+                    event='iea_applied', n_fields=len(fields))
+        return df_out
+
+    def refresh(self, df_inputs, files, targets, add_missing=False):
+        """
+        Build the IEA fields of the targets and write them into the input frame.
+
+        Args:
+            df_inputs (pd.DataFrame): The input frame, with one or several regions.
+            files (pd.DataFrame or str or dict): The files, as returned by `discover`, or the argument of
+                `discover`.
+            targets (list): The `IEATarget` specifications.
+            add_missing (bool, optional): See `apply`. Defaults to False.
+        Returns:
+            pd.DataFrame: A copy of the input frame with the IEA fields.
+        """
+        if not isinstance(files, pd.DataFrame):
+            files = self.discover(files)
+
+        regions = set(df_inputs[self.key_region].unique())
+        files = files[files['region'].isin(regions)]
+        with tracer.stage('iea_refresh', n_regions=len(regions)):
+            df_wide = self.build(files, targets, df_inputs[self.key_time_period].unique())
+            return self.apply(df_inputs, df_wide, add_missing=add_missing)
@@ -0,0 +1,299 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from OutputUtils import ColumnIndex, OutputStore
+from TraceUtils import tracer
+
+DEFAULT_PREFIX = 'emission_co2e_subsector_total'
+
+
+class StrategyImpacts:
+    """
+    Strategy-vs-baseline deltas of a SISEPUEDE output frame.
+
+    The output frame is pivoted once into a (primary_id, region, time_period, field) array. The
+    deltas of every strategy against its baseline primary are then computed for all the fields in a
+    single broadcast, instead of filtering `df_out` one primary ID and one set of columns at a time.
+
+    Without an ATTRIBUTE_PRIMARY table, every primary is compared with `baseline_primary_id`. With
+    the table, each primary is compared with the primary of the baseline strategy that has the same
+    design and future.
+
+    Example:
+        impacts = StrategyImpacts(df_out, prefix='emission_co2e_subsector_total')
+        df_summary = impacts.summary(time_periods=range(10, 36))
+        impacts.export('impacts')
+    """
+
+    def __init__(self, df_out, fields=None, baseline_primary_id=0, df_primary=None, baseline_strategy_id=0,
+                 key_primary='primary_id', key_region='region', key_time_period='time_period',
+                 key_strategy='strategy_id', **select):
+        """
+        Args:
+            df_out (pd.DataFrame): The output frame, with the primary ID, region and time period fields.
+            fields (list, optional): The fields to compare. Defaults to the columns matching `select`, or
+                to the subsector emission totals if no criteria is given.
+            baseline_primary_id (int, optional): The baseline primary, when `df_primary` is not given.
+                Defaults to 0.
+            df_primary (pd.DataFrame, optional): The ATTRIBUTE_PRIMARY table, mapping the primary IDs to
+                their design, strategy and future IDs.
+            baseline_strategy_id (int, optional): The baseline strategy, when `df_primary` is given.
+                Defaults to 0.
+            key_primary (str, optional): The primary key field. Defaults to 'primary_id'.
+            key_region (str, optional): The region field. Defaults to 'region'.
+            key_time_period (str, optional): The time period field. Defaults to 'time_period'.
+            key_strategy (str, optional): The strategy field of `df_primary`. Defaults to 'strategy_id'.
+            **select: Column criteria passed to `ColumnIndex.select`, e.g. contains='prod_ippu_'.
+        """
+        self.key_primary = key_primary
+        self.key_region = key_region
+        self.key_time_period = key_time_period
+
+        if fields is None:
+            index = ColumnIndex(df_out.columns)
+            fields = index.select(**select) if select else index.prefix(DEFAULT_PREFIX)
+            fields = [col for col in fields if col not in (key_primary, key_region, key_time_period)]
+        if not fields:
+            raise ValueError("No output fields to compare.")
+        self.fields = list(fields)
+
+        with tracer.stage('impacts_pivot', n_rows=len(df_out), n_fields=len(self.fields)):
+            self.values = self.pivot(df_out)
+
+        if df_primary is not None:
+            self.baseline_index = self.get_baseline_index(df_primary, baseline_strategy_id, key_strategy)
+        else:
+            positions = np.flatnonzero(self.primary_ids == baseline_primary_id)
+            if len(positions) == 0:
+                raise ValueError(f"The baseline primary {baseline_primary_id} is not in the output frame.")
+            self.baseline_index = np.full(len(self.primary_ids), positions[0])
+
+    @classmethod
+    def from_store(cls, store, primary_ids=None, **kwargs):
+        """
+        Build the impacts from an output store, reading only the compared columns.
+
+        Args:
+            store (OutputStore or str): The store or the output CSV.
+            primary_ids (list, optional): The primary IDs to read. Defaults to all of them.
+            **kwargs: Passed to the constructor; column criteria are applied when reading.
+        Returns:
+            StrategyImpacts: The impacts.
+        """
+        if not isinstance(store, OutputStore):
+            store = OutputStore.from_csv(store)
+
+        fields = kwargs.pop('fields', None)
+        select = {key: kwargs.pop(key) for key in ('prefix', 'contains', 'subsector', 'regex') if key in kwargs}
+        if fields is None and not select:
+            select = {'prefix': DEFAULT_PREFIX}
+        df_out = store.read(columns=fields, primary_ids=primary_ids, **select)
+        return cls(df_out, fields=fields, **select, **kwargs)
+
+    def pivot(self, df_out):
+        """
+        Pivot the output frame into a (primary_id, region, time_period, field) array with one scatter.
+        Missing combinations are NaN.
+
+        Args:
+            df_out (pd.DataFrame): The output frame.
+        Returns:
+            np.ndarray: The array.
+        Raises:
+            ValueError: If several rows have the same primary ID, region and time period.
+        """
+        primary_codes, self.primary_ids = pd.factorize(df_out[self.key_primary], sort=True)
+        if self.key_region in df_out:
+            region_codes, self.regions = pd.factorize(df_out[self.key_region], sort=True)
+        else:
+            region_codes, self.regions = np.zeros(len(df_out), dtype=int), pd.Index([None])
+        time_codes, self.time_periods = pd.factorize(df_out[self.key_time_period], sort=True)
+        self.primary_ids = np.asarray(self.primary_ids)
+        self.regions = np.asarray(self.regions)
+        self.time_periods = np.asarray(self.time_periods)
+
+        shape = (len(self.primary_ids), len(self.regions), len(self.time_periods), len(self.fields))
+        # The scatter keeps the last of several rows with the same cell, so duplicates are rejected first
+        cells = np.ravel_multi_index((primary_codes, region_codes, time_codes), shape[:3])
+        duplicated = pd.Series(cells).duplicated(keep=False).to_numpy()
+        if duplicated.any():
+            key_fields = [col for col in (self.key_primary, self.key_region, self.key_time_period) if col in df_out]
+            df_duplicated = df_out.loc[duplicated, key_fields].drop_duplicates()
+            raise ValueError(f"The output frame has {len(df_duplicated)} duplicated {'/'.join(key_fields)} rows, e.g. "
+                             f"{df_duplicated.head(5).to_dict('records')}.")
+
+        values = np.full(shape, np.nan)
+        values[primary_codes, region_codes, time_codes] = df_out[self.fields].to_numpy(dtype=float)
+        return values
+
+    def get_baseline_index(self, df_primary, baseline_strategy_id, key_strategy):
+        """
+        Find the position of the baseline primary of every primary: the primary of the baseline strategy
+        with the same design and future.
+
+        Args:
+            df_primary (pd.DataFrame): The ATTRIBUTE_PRIMARY table.
+            baseline_strategy_id (int): The baseline strategy.
+            key_strategy (str): The strategy field.
+        Returns:
+            np.ndarray: The baseline position of each primary.
+        """
+        keys = [col for col in df_primary.columns if col not in (self.key_primary, key_strategy)]
+        df = df_primary.set_index(self.key_primary).reindex(self.primary_ids)
+        if df[key_strategy].isna().any():
+            missing = list(self.primary_ids[df[key_strategy].isna().to_numpy()])
+            raise ValueError(f"Primary IDs missing from the primary attribute table: {missing}")
+
+        df_baseline = df[df[key_strategy] == baseline_strategy_id].reset_index()
+        df_baseline['baseline_primary'] = df_baseline[self.key_primary]
+        df = df.reset_index().merge(df_baseline[keys + ['baseline_primary']], on=keys, how='left')
+        if df['baseline_primary'].isna().any():
+            missing = list(df.loc[df['baseline_primary'].isna(), self.key_primary])
+            raise ValueError(f"No baseline primary for the primary IDs {missing}")
+
+        positions = pd.Index(self.primary_ids).get_indexer(df['baseline_primary'])
+        return positions
+
+    @property
+    def baseline(self):
+        # The baseline values of every primary, aligned with `values`
+        return self.values[self.baseline_index]
+
+    @property
+    def baseline_primary_ids(self):
+        return self.primary_ids[self.baseline_index]
+
+    def get_time_mask(self, time_periods=None):
+        if time_periods is None:
+            return np.ones(len(self.time_periods), dtype=bool)
+        return np.isin(self.time_periods, list(time_periods))
+
+    def deltas(self, percent=False):
+        """
+        Compute the deltas of every primary against its baseline.
+
+        Args:
+            percent (bool, optional): Whether to return percent deltas. Percent deltas against a zero
+                baseline are NaN. Defaults to False.
+        Returns:
+            np.ndarray: The (primary_id, region, time_period, field) deltas.
+        """
+        baseline = self.baseline
+        delta = self.values - baseline
+        if not percent:
+            return delta
+        return np.divide(100.0 * delta, np.abs(baseline), out=np.full_like(delta, np.nan), where=baseline != 0)
+
+    def cumulative(self, time_periods=None):
+        """
+        Compute the totals of every primary and of its baseline over time periods.
+
+        Args:
+            time_periods (list, optional): The time periods to sum. Defaults to all of them.
+        Returns:
+            tuple: The (primary_id, region, field) totals of the primaries and of their baselines.
+        """
+        mask = self.get_time_mask(time_periods)
+        return self.values[:, :, mask].sum(axis=2), self.baseline[:, :, mask].sum(axis=2)
+
+    def get_id_frame(self, with_time_period=True):
+        # Ids of the flattened (primary_id, region[, time_period]) axes, in array order
+        axes = [self.primary_ids, self.regions] + ([self.time_periods] if with_time_period else [])
+        names = [self.key_primary, self.key_region] + ([self.key_time_period] if with_time_period else [])
+        index = pd.MultiIndex.from_product(axes, names=names)
+        return index.to_frame(index=False)
+
+    def to_frame(self, values, time_periods=None, dropna=True):
+        """
+        Convert a (primary_id, region, time_period, field) array to a wide frame.
+
+        Args:
+            values (np.ndarray): The array, e.g. `values` or `deltas()`.
+            time_periods (list, optional): The time periods to keep. Defaults to all of them.
+            dropna (bool, optional): Whether to drop the rows missing from the output frame. Defaults to True.
+        Returns:
+            pd.DataFrame: The primary ID, region and time period fields followed by the fields.
+        """
+        mask = self.get_time_mask(time_periods)
+        df_ids = self.get_id_frame()
+        keep = np.tile(mask, len(self.primary_ids) * len(self.regions))
+        if dropna:
+            keep &= ~np.isnan(self.values).all(axis=3).reshape(-1)
+
+        data = values.reshape(-1, len(self.fields))[keep]
+        df = pd.concat([df_ids[keep].reset_index(drop=True), pd.DataFrame(data, columns=self.fields)], axis=1)
+        if len(self.regions) == 1 and self.regions[0] is None:
+            df = df.drop(columns=[self.key_region])
+        return df
+
+    def summary(self, time_periods=None):
+        """
+        Build the cumulative impact table: one row per primary, region and field, with the totals of the
+        primary and of its baseline over the time periods and their absolute and percent deltas.
+
+        Args:
+            time_periods (list, optional): The time periods to sum. Defaults to all of them.
+        Returns:
+            pd.DataFrame: The impact table.
+        """
+        total, baseline_total = self.cumulative(time_periods)
+        delta = total - baseline_total
+        delta_percent = np.divide(100.0 * delta, np.abs(baseline_total), out=np.full_like(delta, np.nan),
+                                  where=baseline_total != 0)
+
+        df_ids = self.get_id_frame(with_time_period=False)
+        n_fields = len(self.fields)
+        df = pd.DataFrame({
+            self.key_primary: np.repeat(df_ids[self.key_primary].to_numpy(), n_fields),
+            'baseline_primary_id': np.repeat(np.repeat(self.baseline_primary_ids, len(self.regions)), n_fields),
+            self.key_region: np.repeat(df_ids[self.key_region].to_numpy(), n_fields),
+            'field': np.tile(self.fields, len(df_ids)),
+            'total': total.reshape(-1),
+            'baseline_total': baseline_total.reshape(-1),
+            'delta': delta.reshape(-1),
+            'delta_percent': delta_percent.reshape(-1),
+        })
+        df = df[~np.isnan(df['total'].to_numpy())].reset_index(drop=True)
+        if len(self.regions) == 1 and self.regions[0] is None:
+            df = df.drop(columns=[self.key_region])
+        return df
+
+    def export(self, output_dir, time_periods=None, file_format='csv', float32=True):
+        """
+        Export the cumulative impact table and the wide tables of absolute and percent deltas.
+
+        Args:
+            output_dir (str): The output directory.
+            time_periods (list, optional): The time periods to keep and sum. Defaults to all of them.
+            file_format (str, optional): 'csv' or 'parquet'. Defaults to 'csv'.
+            float32 (bool, optional): Whether to store the values as float32 to halve the size of the
+                tables. Defaults to True.
+        Returns:
+            dict: The paths of the tables, keyed by table name.
+        """
+        if file_format not in ('csv', 'parquet'):
+            raise ValueError(f"Unknown export format {file_format!r}, expected 'csv' or 'parquet'.")
+        os.makedirs(output_dir, exist_ok=True)
+
+        with tracer.stage('impacts_export', n_primaries=len(self.primary_ids), n_fields=len(self.fields)):
+            tables = {
+                'impacts_cumulative': self.summary(time_periods),
+                'impacts_delta': self.to_frame(self.deltas(), time_periods),
+                'impacts_delta_percent': self.to_frame(self.deltas(percent=True), time_periods),
+            }
+            paths = {}
+            for name, df in tables.items():
+                if float32:
+                    float_cols = df.columns[(df.dtypes == np.float64).to_numpy()]
+                    df = df.astype({col: np.float32 for col in float_cols})
+                path = os.path.join(output_dir, f"{name}.{file_format}")
+                if file_format == 'parquet':
+                    df.to_parquet(path, index=False)
+                else:
+                    df.to_csv(path, index=None, encoding='UTF-8')
+                paths[name] = path
+
+        tracer.info(f"Strategy impacts exported to {output_dir}", event='impacts_exported', output_dir=output_dir)
+        return paths
@@ -0,0 +1,365 @@
+import bisect
+import hashlib
+import json
+import os
+import re
+import shutil
+import uuid
+from collections import defaultdict
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+from TraceUtils import tracer
+
+# Bump when the layout of the output store changes
+OUTPUT_STORE_VERSION = 1
+ID_FIELDS = ['primary_id', 'region', 'time_period']
+
+
+class ColumnIndex:
+    """
+    Reusable index of the columns of a SISEPUEDE output frame.
+
+    Replaces scans like `[c for c in df_out.columns if 'prod_ippu_cement_tonne' in c]` with lookups:
+
+    - prefix: the column names are kept sorted, so the columns that start with a prefix are a
+      contiguous range found by binary search.
+    - contains: the names are split into their `_`-separated tokens; the columns that contain the
+      inner tokens of a substring (e.g. 'ippu' and 'cement' for 'prod_ippu_cement_tonne') are
+      intersected and only those candidates are checked. Substrings without inner tokens fall back to
+      a scan of the names.
+    - subsector: the columns with the subsector code as a token, e.g. 'ippu'.
+
+    Results keep the order of the columns in the frame and are cached per query.
+    """
+
+    def __init__(self, columns):
+        """
+        Args:
+            columns (list): The column names.
+        """
+        self.columns = [str(col) for col in columns]
+        self.positions = {col: i for i, col in enumerate(self.columns)}
+        self.sorted_columns = sorted(self.columns)
+        self.tokens = defaultdict(set)
+        for col in self.columns:
+            for token in col.split('_'):
+                self.tokens[token].add(col)
+        self._cache = {}
+
+    def __len__(self):
+        return len(self.columns)
+
+    def sort(self, columns):
+        # Order columns as in the frame
+        return sorted(columns, key=self.positions.__getitem__)
+
+    def cached(self, key, build):
+        if key not in self._cache:
+            self._cache[key] = build()
+        return self._cache[key]
+
+    def prefix(self, prefix):
+        """
+        Retrieve the columns that start with a prefix.
+
+        Args:
+            prefix (str): The prefix, e.g. 'emission_co2e_subsector_total'.
+        Returns:
+            list: The matching columns.
+        """
+        def build():
+            start = bisect.bisect_left(self.sorted_columns, prefix)
+            end = start
+            while end < len(self.sorted_columns) and self.sorted_columns[end].startswith(prefix):
+                end += 1
+            return self.sort(self.sorted_columns[start:end])
+        return self.cached(('prefix', prefix), build)
+
+    def contains(self, substring):
+        """
+        Retrieve the columns that contain a substring.
+
+        Args:
+            substring (str): The substring, e.g. 'prod_ippu_cement_tonne'.
+        Returns:
+            list: The matching columns.
+        """
+        def build():
+            # Inner tokens must match whole tokens; the first and last ones may be parts of a token
+            inner = substring.strip('_').split('_')[1:-1]
+            if inner:
+                candidates = set.intersection(*[self.tokens.get(token, set()) for token in inner])
+            else:
+                candidates = self.columns
+            return self.sort([col for col in candidates if substring in col])
+        return self.cached(('contains', substring), build)
+
+    def subsector(self, subsector):
+        """
+        Retrieve the columns of a subsector.
+
+        Args:
+            subsector (str): The subsector code, e.g. 'agrc'.
+        Returns:
+            list: The columns with the subsector code as one of their tokens.
+        """
+        return self.cached(('subsector', subsector), lambda: self.sort(self.tokens.get(subsector.lower(), ())))
+
+    def regex(self, pattern):
+        """
+        Retrieve the columns that match a regular expression.
+
+        Args:
+            pattern (str): The pattern, searched anywhere in the name.
+        Returns:
+            list: The matching columns.
+        """
+        compiled = re.compile(pattern)
+        return self.cached(('regex', pattern), lambda: [col for col in self.columns if compiled.search(col)])
+
+    def select(self, columns=None, prefix=None, contains=None, subsector=None, regex=None):
+        """
+        Select the columns that match all the given criteria.
+
+        Args:
+            columns (list, optional): Explicit columns; unknown ones are ignored.
+            prefix (str or list, optional): One or several prefixes; a column matches if it starts with any of them.
+            contains (str or list, optional): One or several substrings; a column matches if it contains any of them.
+            subsector (str or list, optional): One or several subsector codes.
+            regex (str, optional): A regular expression.
+        Returns:
+            list: The selected columns, in the order of the frame. All the columns if no criteria is given.
+        """
+        selected = None
+
+        def narrow(selected, matches):
+            matches = set(matches)
+            return matches if selected is None else selected & matches
+
+        def as_list(value):
+            return [value] if isinstance(value, str) else list(value)
+
+        if columns is not None:
+            selected = narrow(selected, [col for col in as_list(columns) if col in self.positions])
+        if prefix is not None:
+            selected = narrow(selected, [col for value in as_list(prefix) for col in self.prefix(value)])
+        if contains is not None:
+            selected = narrow(selected, [col for value in as_list(contains) for col in self.contains(value)])
+        if subsector is not None:
+            selected = narrow(selected, [col for value in as_list(subsector) for col in self.subsector(value)])
+        if regex is not None:
+            selected = narrow(selected, self.regex(regex))
+
+        return list(self.columns) if selected is None else self.sort(selected)
+
+
+class OutputStore:
+    """
+    Partitioned columnar store of SISEPUEDE output frames.
+
+    The frame is written as Parquet files partitioned by primary ID
+    (`<store>/primary_id=<id>/part-<n>.parquet`) with a `schema.json` listing the columns and the
+    partitions, so queries read only the files of the requested primary IDs and only the requested
+    column chunks of those files. The column index is built from the schema without reading any data.
+
+    Example:
+        store = OutputStore.from_csv('data/sisepuede_outputs_iran_preiea.csv')
+        df = store.read(primary_ids=[0], prefix='emission_co2e_subsector_total')
+    """
+
+    def __init__(self, store_dir):
+        """
+        Args:
+            store_dir (str): The store directory.
+        Raises:
+            ImportError: If pyarrow is not installed.
+        """
+        if pq is None:
+            raise ImportError("pyarrow is required by the output store.")
+        self.store_dir = store_dir
+        self._schema = None
+        self._index = None
+
+    @staticmethod
+    def get_default_store_dir(csv_file):
+        """
+        Build the default store directory of an output CSV, keyed on its content hash so that a
+        modified CSV is never served from a stale store.
+
+        Args:
+            csv_file (str): The output CSV.
+        Returns:
+            str: The store directory, in a `.output_store` directory next to the CSV.
+        """
+        with open(csv_file, 'rb') as file:
+            digest = hashlib.sha256(file.read()).hexdigest()[:16]
+        name = os.path.splitext(os.path.basename(csv_file))[0]
+        return os.path.join(os.path.dirname(os.path.abspath(csv_file)), '.output_store', f"{name}__{digest}")
+
+    @classmethod
+    def from_csv(cls, csv_file, store_dir=None, partition_field='primary_id', chunksize=None):
+        """
+        Open the store of an output CSV, converting the CSV the first time.
+
+        Args:
+            csv_file (str): The output CSV.
+            store_dir (str, optional): The store directory. Defaults to `get_default_store_dir`.
+            partition_field (str, optional): The partition field. Defaults to 'primary_id'.
+            chunksize (int, optional): Convert the CSV this many rows at a time to bound the memory used.
+                Defaults to reading it at once.
+        Returns:
+            OutputStore: The store.
+        """
+        store_dir = store_dir or cls.get_default_store_dir(csv_file)
+        store = cls(store_dir)
+        if store.exists():
+            return store
+
+        with tracer.stage('write_output_store', csv_file=csv_file):
+            frames = pd.read_csv(csv_file, chunksize=chunksize) if chunksize else [pd.read_csv(csv_file)]
+            store.write(frames, partition_field=partition_field, source=os.path.basename(csv_file))
+        return store
+
+    def get_schema_path(self, store_dir=None):
+        return os.path.join(store_dir or self.store_dir, 'schema.json')
+
+    def exists(self):
+        return os.path.exists(self.get_schema_path())
+
+    def write(self, frames, partition_field='primary_id', source=None):
+        """
+        Write output frames to the store, replacing its content. The files are written to a temporary
+        directory that replaces the store once complete.
+
+        Args:
+            frames (pd.DataFrame or iterable): The output frame, or an iterable of frames with the same
+                columns, e.g. the chunks of a CSV.
+            partition_field (str, optional): The partition field. Defaults to 'primary_id'.
+            source (str, optional): The name of the source, kept in the schema.
+        Returns:
+            dict: The schema of the store.
+        """
+        if isinstance(frames, pd.DataFrame):
+            frames = [frames]
+
+        tmp_dir = f"{self.store_dir.rstrip(os.sep)}.{uuid.uuid4().hex[:8]}.tmp"
+        os.makedirs(tmp_dir)
+        partitions = defaultdict(list)
+        columns = None
+        try:
+            for n_chunk, df in enumerate(frames):
+                if columns is None:
+                    columns = [str(col) for col in df.columns]
+                    if partition_field not in columns:
+                        raise ValueError(f"Partition field {partition_field} not in the output frame.")
+                table = pa.Table.from_pandas(df, preserve_index=False)
+                keys = df[partition_field].to_numpy()
+                # Rows of every partition, without sorting the chunk
+                for key, rows in pd.Series(range(len(df))).groupby(keys, sort=True):
+                    partition = f"{partition_field}={key}"
+                    os.makedirs(os.path.join(tmp_dir, partition), exist_ok=True)
+                    file_name = os.path.join(partition, f"part-{n_chunk}.parquet")
+                    pq.write_table(table.take(pa.array(rows.to_numpy())), os.path.join(tmp_dir, file_name))
+                    partitions[str(key)].append(file_name)
+                tracer.count('output_chunks_written')
+
+            schema = {
+                'version': OUTPUT_STORE_VERSION,
+                'source': source,
+                'partition_field': partition_field,
+                'columns': columns or [],
+                'partitions': dict(partitions),
+            }
+            with open(self.get_schema_path(tmp_dir), 'w') as file:
+                json.dump(schema, file)
+
+            if os.path.exists(self.store_dir):
+                shutil.rmtree(self.store_dir)
+            os.makedirs(os.path.dirname(os.path.abspath(self.store_dir)), exist_ok=True)
+            os.replace(tmp_dir, self.store_dir)
+        finally:
+            if os.path.exists(tmp_dir):
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+
+        self._schema = schema
+        self._index = None
+        tracer.info(f"Output store written to {self.store_dir}: {len(partitions)} partitions, {len(schema['columns'])} columns",
+                    event='output_store_written', store_dir=self.store_dir, n_partitions=len(partitions))
+        return schema
+
+    @property
+    def schema(self):
+        if self._schema is None:
+            with open(self.get_schema_path(), 'r') as file:
+                schema = json.load(file)
+            if schema.get('version') != OUTPUT_STORE_VERSION:
+                raise ValueError(f"Unsupported output store version {schema.get('version')} in {self.store_dir}.")
+            self._schema = schema
+        return self._schema
+
+    @property
+    def index(self):
+        if self._index is None:
+            self._index = ColumnIndex(self.schema['columns'])
+        return self._index
+
+    @property
+    def columns(self):
+        return list(self.schema['columns'])
+
+    @property
+    def primary_ids(self):
+        return list(self.schema['partitions'])
+
+    def get_partition_files(self, primary_ids=None):
+        """
+        Retrieve the files of some partitions.
+
+        Args:
+            primary_ids (list, optional): The partition keys. Defaults to all the partitions.
+        Returns:
+            list: The paths of the Parquet files.
+        """
+        partitions = self.schema['partitions']
+        keys = partitions.keys() if primary_ids is None else [str(key) for key in primary_ids]
+        missing = [key for key in keys if key not in partitions]
+        if missing:
+            tracer.warning(f"Primary IDs not found in the output store: {missing}", event='output_ids_not_found', primary_ids=missing)
+        return [
+            os.path.join(self.store_dir, file_name)
+            for key in keys if key in partitions
+            for file_name in partitions[key]
+        ]
+
+    def read(self, columns=None, primary_ids=None, include_ids=True, **select):
+        """
+        Read some columns of some primary IDs.
+
+        Args:
+            columns (list, optional): Explicit columns to read.
+            primary_ids (list, optional): The primary IDs to read. Defaults to all of them.
+            include_ids (bool, optional): Whether to add the id fields (primary_id, region, time_period)
+                to the columns. Defaults to True.
+            **select: Column criteria passed to `ColumnIndex.select`, e.g. prefix='emission_co2e_'.
+        Returns:
+            pd.DataFrame: The requested data.
+        """
+        selected = self.index.select(columns=columns, **select) if (columns is not None or select) else self.columns
+        if include_ids:
+            id_fields = [col for col in ID_FIELDS if col in self.index.positions and col not in selected]
+            selected = id_fields + selected
+
+        files = self.get_partition_files(primary_ids)
+        with tracer.stage('read_output_store', n_files=len(files), n_columns=len(selected)):
+            tables = [pq.read_table(file, columns=selected) for file in files]
+        if not tables:
+            return pd.DataFrame(columns=selected)
+        return pa.concat_tables(tables).to_pandas()
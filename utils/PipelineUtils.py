@@ -0,0 +1,363 @@
+import argparse
+import contextlib
+import json
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+from GeneralUtils import GeneralUtils, InputSchema
+from TraceUtils import tracer
+from TransformationUtils import ExcelYAMLHandler, StrategyCSVHandler
+
+
+UTILS_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_DIR = os.path.dirname(UTILS_DIR)
+STAGES = ['config', 'align', 'yaml', 'strategies']
+
+
+class RegionPipeline:
+    """
+    Preparation pipeline of a single region, the same flow as the `<region>_manager_wb` notebooks:
+
+    1. config: read `config_files/<region>_config.yaml` with `GeneralUtils.get_yaml_values`.
+    2. align: align the region's input data with the SISEPUEDE example input frame.
+    3. yaml: generate the strategy transformation YAMLs with `ExcelYAMLHandler.process_yaml_files`.
+    4. strategies: add or update the strategies listed in the config with `StrategyCSVHandler`.
+
+    The pipeline runs inside the region directory, since the handlers resolve `transformations`
+    relative to the working directory, and writes everything it prints to `pipeline.log` there.
+    """
+
+    def __init__(
+        self,
+        region_dir,
+        df_example=None,
+        skip_align=False,
+        write_aligned=False,
+        overwrite_mult_param_transformations=True,
+        force=False,
+        deduplicate=False,
+        strategy_mapping_file=None,
+    ):
+        """
+        Args:
+            region_dir (str): The region directory, e.g. `croatia`.
+            df_example (pd.DataFrame, optional): The SISEPUEDE example input frame. If None, it is built
+                from sisepuede when the align stage runs.
+            skip_align (bool, optional): Whether to skip the align stage. Defaults to False.
+            write_aligned (bool, optional): Whether to write the aligned inputs to
+                `data/<input file>_aligned.csv`. Defaults to False.
+            overwrite_mult_param_transformations (bool, optional): Passed to `process_yaml_files`.
+                Defaults to True, as in the notebooks.
+            force (bool, optional): Whether to regenerate every strategy YAML, see `process_yaml_files`.
+                Defaults to False.
+            deduplicate (bool, optional): Whether strategies with the same parameters share a transformation
+                YAML, see `ExcelYAMLHandler.get_strategy_groups`. Defaults to False.
+            strategy_mapping_file (str, optional): The strategy mapping file. Defaults to
+                `utils/strategy_mapping.yaml`.
+        """
+        self.region_dir = os.path.abspath(region_dir)
+        self.region = os.path.basename(self.region_dir)
+        self.df_example = df_example
+        self.skip_align = skip_align
+        self.write_aligned = write_aligned
+        self.overwrite_mult_param_transformations = overwrite_mult_param_transformations
+        self.force = force
+        self.deduplicate = deduplicate
+        self.strategy_mapping_file = strategy_mapping_file or os.path.join(UTILS_DIR, 'strategy_mapping.yaml')
+        self.log_file = os.path.join(self.region_dir, 'pipeline.log')
+
+        self.config = None
+        self.df_inputs = None
+        self.transformation_per_strategy_dict = None
+
+    def run_config(self):
+        """
+        Read the region's config file.
+
+        Returns:
+            str: The country name.
+        """
+        config_file = os.path.join('config_files', f"{self.region}_config.yaml")
+        self.config = GeneralUtils().get_yaml_values(config_file)
+        if self.config is None:
+            raise FileNotFoundError(f"Config file {config_file} could not be loaded.")
+        return self.config['country_name']
+
+    def run_align(self):
+        """
+        Align the region's input data with the example input frame, as in the notebooks: rename
+        `period` to `time_period`, add the missing columns, drop `iso_code3` and set the region.
+
+        Returns:
+            str: The number of missing and extra columns of the original inputs.
+        """
+        if self.skip_align:
+            return 'skipped'
+
+        df_example = self.df_example
+        if df_example is None:
+            df_example = InputSchema.from_examples().df_example
+
+        input_file = os.path.join('data', self.config['ssp_input_file_name'])
+        df_inputs = pd.read_csv(input_file)
+        df_inputs = df_inputs.rename(columns={'period': 'time_period'})
+
+        df_inputs, schema_diff = InputSchema(df_example).align(df_inputs, drop_extra=False, cast_dtypes=False)
+        df_inputs = df_inputs.drop(columns='iso_code3', errors='ignore')
+        df_inputs['region'] = self.config['country_name']
+        self.df_inputs = df_inputs
+
+        if self.write_aligned:
+            aligned_file = f"{os.path.splitext(input_file)[0]}_aligned.csv"
+            df_inputs.to_csv(aligned_file, index=False)
+            tracer.info(f"Aligned inputs saved to {aligned_file}", event='aligned_inputs_saved', path=aligned_file)
+
+        return f"{len(schema_diff['missing'])} missing, {len(schema_diff['extra'])} extra"
+
+    def run_yaml(self):
+        """
+        Generate the strategy transformation YAMLs from the region's crosswalk.
+
+        Returns:
+            str: The number of YAML files written, skipped and removed.
+        """
+        cw_file_path = os.path.join('data', self.config['ssp_transformation_cw'])
+        excel_yaml_handler = ExcelYAMLHandler(excel_file=cw_file_path, yaml_directory='transformations', deduplicate=self.deduplicate)
+        summary = excel_yaml_handler.process_yaml_files(
+            overwrite_mult_param_transformations=self.overwrite_mult_param_transformations,
+            force=self.force,
+        )
+        if summary is None:
+            raise RuntimeError(f"Strategy YAML files could not be generated from {cw_file_path}.")
+
+        self.transformation_per_strategy_dict = excel_yaml_handler.get_transformations_per_strategy_dict()
+        return f"{summary['written']} written, {summary['skipped']} skipped, {summary['removed']} removed"
+
+    def run_strategies(self):
+        """
+        Add or update the strategies listed in the config, in one batch each.
+
+        Returns:
+            str: The number of strategies added and updated.
+        """
+        strategies = self.config.get('strategies') or []
+        if not strategies:
+            return 'skipped'
+
+        csv_handler = StrategyCSVHandler(
+            os.path.join('transformations', 'strategy_definitions.csv'),
+            'transformations',
+            self.strategy_mapping_file,
+            self.transformation_per_strategy_dict,
+        )
+
+        new_specs = [spec for spec in strategies if not spec.get('update_flag')]
+        update_specs = [spec for spec in strategies if spec.get('update_flag')]
+        if new_specs and csv_handler.add_strategies(new_specs) is None:
+            raise RuntimeError("No strategies were added, see the log for details.")
+        if update_specs and csv_handler.update_strategies(update_specs) is None:
+            raise RuntimeError("No strategies were updated, see the log for details.")
+        return f"{len(new_specs)} added, {len(update_specs)} updated"
+
+    def run(self):
+        """
+        Run all the stages in the region directory, stopping at the first one that fails.
+
+        Returns:
+            dict: The result, with the keys 'region', 'status' ('ok' or 'failed'), 'failed_stage',
+                'error', 'timings' (seconds per stage) and 'details' (a short summary per stage).
+        """
+        result = {
+            'region': self.region,
+            'status': 'ok',
+            'failed_stage': None,
+            'error': None,
+            'timings': {},
+            'details': {},
+        }
+
+        cwd = os.getcwd()
+        with open(self.log_file, 'w') as log, contextlib.redirect_stdout(log):
+            try:
+                os.chdir(self.region_dir)
+                for stage in STAGES:
+                    tracer.info(f"=== {stage}", event='pipeline_stage', region=self.region, pipeline_stage=stage)
+                    t0 = time.perf_counter()
+                    try:
+                        result['details'][stage] = getattr(self, f"run_{stage}")()
+                    except Exception as e:
+                        result['status'] = 'failed'
+                        result['failed_stage'] = stage
+                        result['error'] = f"{type(e).__name__}: {e}"
+                        traceback.print_exc(file=log)
+                        break
+                    finally:
+                        result['timings'][stage] = time.perf_counter() - t0
+            finally:
+                os.chdir(cwd)
+
+        return result
+
+
+def run_region(region_dir, **options):
+    """
+    Run the pipeline of a region; the entry point of the worker processes.
+
+    Args:
+        region_dir (str): The region directory.
+        **options: Additional arguments passed to RegionPipeline.
+    Returns:
+        dict: The result, see `RegionPipeline.run`.
+    """
+    return RegionPipeline(region_dir, **options).run()
+
+
+def discover_regions(project_dir=PROJECT_DIR):
+    """
+    Find the region directories of the project, i.e. the directories `<region>` with a
+    `config_files/<region>_config.yaml` file. Directories without a config, e.g. `iran`, are skipped.
+
+    Args:
+        project_dir (str, optional): The project directory. Defaults to the parent of `utils`.
+    Returns:
+        list: The region directories, sorted by name.
+    """
+    regions = []
+    for entry in sorted(os.scandir(project_dir), key=lambda entry: entry.name):
+        if not entry.is_dir() or entry.name.startswith('.') or entry.path == UTILS_DIR:
+            continue
+        if os.path.isfile(os.path.join(entry.path, 'config_files', f"{entry.name}_config.yaml")):
+            regions.append(entry.path)
+    return regions
+
+
+def run_pipeline(region_dirs, max_workers=None, example_file=None, skip_align=False, **options):
+    """
+    Run the preparation pipeline of several regions in a process pool.
+
+    Args:
+        region_dirs (list): The region directories.
+        max_workers (int, optional): The number of worker processes. Defaults to the number of
+            regions, up to the number of CPUs.
+        example_file (str, optional): A CSV file with the SISEPUEDE example input frame. If None, the
+            frame is built from sisepuede once and shared with the workers.
+        skip_align (bool, optional): Whether to skip the align stage. Defaults to False.
+        **options: Additional arguments passed to RegionPipeline.
+    Returns:
+        pd.DataFrame: The summary, one row per region with its status, the failed stage and error,
+            and the time of each stage in seconds.
+    """
+    if not region_dirs:
+        tracer.info("No regions to prepare.", event='no_regions')
+        return pd.DataFrame()
+
+    df_example = None
+    if not skip_align:
+        if example_file is not None:
+            df_example = pd.read_csv(example_file)
+        else:
+            df_example = InputSchema.from_examples().df_example
+
+    if max_workers is None:
+        max_workers = min(len(region_dirs), os.cpu_count() or 1)
+
+    results = []
+    t0 = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(run_region, region_dir, df_example=df_example, skip_align=skip_align, **options): region_dir
+            for region_dir in region_dirs
+        }
+        for future in as_completed(futures):
+            region_dir = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                # The worker process itself failed, e.g. it was killed
+                result = {
+                    'region': os.path.basename(region_dir),
+                    'status': 'failed',
+                    'failed_stage': None,
+                    'error': f"{type(e).__name__}: {e}",
+                    'timings': {},
+                    'details': {},
+                }
+            tracer.info(f"{result['region']}: {result['status']}", event='region_done',
+                        region=result['region'], status=result['status'], error=result['error'])
+            results.append(result)
+    elapsed = time.perf_counter() - t0
+
+    summary = pd.DataFrame([
+        {
+            'region': result['region'],
+            'status': result['status'],
+            'failed_stage': result['failed_stage'],
+            'error': result['error'],
+            **{f"{stage}_s": result['timings'].get(stage) for stage in STAGES},
+            'total_s': sum(result['timings'].values()),
+        }
+        for result in results
+    ]).sort_values('region').reset_index(drop=True)
+
+    tracer.info(f"\nPrepared {len(summary)} regions with {max_workers} workers in {elapsed:.2f} seconds:",
+                event='regions_summary', n_regions=len(summary), max_workers=max_workers, elapsed_s=elapsed)
+    tracer.info(summary.drop(columns='error').to_string(index=False, float_format=lambda x: f"{x:.2f}"), event='regions_table')
+
+    failed = summary[summary['status'] != 'ok']
+    if not failed.empty:
+        tracer.error(f"\n{len(failed)} regions failed (see pipeline.log in each region directory):", event='regions_failed', n_failed=len(failed))
+        for _, row in failed.iterrows():
+            tracer.error(f"  {row['region']} [{row['failed_stage']}]: {row['error']}", event='region_failed',
+                         region=row['region'], failed_stage=row['failed_stage'])
+
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Prepare the transformations and strategies of every region in parallel."
+    )
+    parser.add_argument('regions', nargs='*', help="Region directories or names. Defaults to all the regions of the project.")
+    parser.add_argument('--max-workers', type=int, default=None, help="Number of worker processes.")
+    parser.add_argument('--example-file', default=None, help="CSV file with the SISEPUEDE example input frame.")
+    parser.add_argument('--skip-align', action='store_true', help="Skip the input alignment stage.")
+    parser.add_argument('--write-aligned', action='store_true', help="Write the aligned inputs to the region's data directory.")
+    parser.add_argument('--no-overwrite-mult-param-transformations', action='store_true', help="Skip the templates without magnitude instead of writing them with their default values.")
+    parser.add_argument('--force', action='store_true', help="Regenerate every strategy YAML file.")
+    parser.add_argument('--deduplicate', action='store_true', help="Write a single YAML for the strategies that share the same parameters.")
+    parser.add_argument('--summary-file', default=None, help="JSON file where the summary is saved.")
+    args = parser.parse_args(argv)
+
+    if args.regions:
+        region_dirs = [
+            region if os.path.isdir(region) else os.path.join(PROJECT_DIR, region)
+            for region in args.regions
+        ]
+    else:
+        region_dirs = discover_regions()
+
+    summary = run_pipeline(
+        region_dirs,
+        max_workers=args.max_workers,
+        example_file=args.example_file,
+        skip_align=args.skip_align,
+        write_aligned=args.write_aligned,
+        overwrite_mult_param_transformations=not args.no_overwrite_mult_param_transformations,
+        force=args.force,
+        deduplicate=args.deduplicate,
+    )
+
+    if args.summary_file is not None:
+        with open(args.summary_file, 'w') as file:
+            json.dump(summary.to_dict(orient='records'), file, indent=2)
+
+    return 0 if not summary.empty and (summary['status'] == 'ok').all() else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
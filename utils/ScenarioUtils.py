@@ -0,0 +1,526 @@
+import contextlib
+import hashlib
+import json
+import os
+import tempfile
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+from CacheUtils import ResultCache
+from OutputUtils import OutputStore
+from TraceUtils import tracer
+from TransformationUtils import TransformationDirectoryIndex, get_file_hash
+
+
+class SisepuedeSessionFactory:
+    """
+    Builds a SISEPUEDE session in a worker process, the same way as the `<region>_manager_wb`
+    notebooks: transformers from the region's aligned input frame, transformations from the
+    transformations directory, strategies, and a SISEPUEDE session with a csv database.
+
+    The factory only holds the input frame, paths and options, so it can be sent to the worker
+    processes; every worker gets its own `id_str`, and with it its own csv output directory, and
+    exports its strategies to its own directory, so the workers never write to the same files.
+    """
+
+    def __init__(self, dir_transformations, df_inputs, regions, id_str='sisepuede_run', export_dir=None, **sisepuede_kwargs):
+        """
+        Args:
+            dir_transformations (str): The transformations directory.
+            df_inputs (pd.DataFrame or str): The region's aligned input frame, e.g. the notebooks'
+                `df_inputs_raw_complete`, or the CSV or Parquet file it was saved to.
+            regions (list): The regions of the session.
+            id_str (str, optional): The prefix of the session IDs; the shard number is appended.
+                Defaults to 'sisepuede_run'.
+            export_dir (str, optional): The directory the strategies of each shard are exported to,
+                in `shard_<n>`. Defaults to a new temporary directory in every worker.
+            **sisepuede_kwargs: Additional arguments passed to `sisepuede.SISEPUEDE`.
+        """
+        self.dir_transformations = dir_transformations
+        self.df_inputs = df_inputs
+        self.regions = regions
+        self.id_str = id_str
+        self.export_dir = export_dir
+        self.sisepuede_kwargs = {
+            'db_type': 'csv',
+            'initialize_as_dummy': False,
+            'try_exogenous_xl_types_in_variable_specification': True,
+            **sisepuede_kwargs,
+        }
+
+    def get_inputs(self):
+        """
+        Get the input frame of the sessions.
+
+        Returns:
+            pd.DataFrame: The input frame.
+        """
+        if isinstance(self.df_inputs, pd.DataFrame):
+            return self.df_inputs
+        if str(self.df_inputs).endswith('.parquet'):
+            return pd.read_parquet(self.df_inputs)
+        return pd.read_csv(self.df_inputs)
+
+    def get_export_path(self, shard_id):
+        """
+        Get the directory the strategies of a shard are exported to, creating it if needed.
+
+        Args:
+            shard_id (int): The shard number.
+        Returns:
+            str: The export directory of the shard.
+        """
+        if self.export_dir is None:
+            return tempfile.mkdtemp(prefix=f"{self.id_str}_shard{shard_id}_")
+        export_path = os.path.join(self.export_dir, f"shard_{shard_id}")
+        os.makedirs(export_path, exist_ok=True)
+        return export_path
+
+    def __call__(self, shard_id):
+        """
+        Build the session of a shard.
+
+        Args:
+            shard_id (int): The shard number.
+        Returns:
+            sisepuede.SISEPUEDE: The session.
+        """
+        import sisepuede as si
+        import sisepuede.transformers as trf
+
+        transformers = trf.transformers.Transformers({}, df_input=self.get_inputs())
+        transformations = trf.Transformations(self.dir_transformations, transformers=transformers)
+        strategies = trf.Strategies(transformations, export_path=self.get_export_path(shard_id), prebuild=True)
+        return si.SISEPUEDE(
+            "calibrated",
+            id_str=f"{self.id_str}_shard{shard_id}",
+            regions=self.regions,
+            strategies=strategies,
+            **self.sisepuede_kwargs,
+        )
+
+
+def split_shards(strategies, n_shards):
+    """
+    Split the strategies into shards, dealing them out in turn so that every shard gets a similar mix.
+
+    Args:
+        strategies (list): The strategy IDs.
+        n_shards (int): The number of shards.
+    Returns:
+        list: The non-empty shards, each a list of strategy IDs.
+    """
+    n_shards = max(1, min(n_shards, len(strategies)))
+    return [list(strategies[i::n_shards]) for i in range(n_shards)]
+
+
+def run_shard(session_factory, shard_id, strategies, shard_dir, designs=(0,), futures=(0,), save_inputs=True):
+    """
+    Run the scenarios of a shard of strategies in its own session; the entry point of the worker processes.
+
+    The outputs (and inputs) of the shard are written to `outputs.parquet` (and `inputs.parquet`) in the
+    shard directory, together with its ATTRIBUTE_PRIMARY table and a `shard.log` with everything the
+    session printed.
+
+    Args:
+        session_factory (callable): A function building the session of a shard from its number, e.g.
+            a SisepuedeSessionFactory. It must be picklable.
+        shard_id (int): The shard number.
+        strategies (list): The strategy IDs of the shard.
+        shard_dir (str): The directory of the shard.
+        designs (list, optional): The design IDs. Defaults to [0].
+        futures (list, optional): The future IDs. Defaults to [0].
+        save_inputs (bool, optional): Whether to save and export the inputs. Defaults to True.
+    Returns:
+        dict: The result, with the keys 'shard', 'strategies', 'status', 'error', 'pid', 'n_primaries',
+            'timings' (seconds of the setup, project and write steps) and 'files'.
+    """
+    os.makedirs(shard_dir, exist_ok=True)
+    result = {
+        'shard': shard_id,
+        'strategies': list(strategies),
+        'status': 'ok',
+        'error': None,
+        'pid': os.getpid(),
+        'n_primaries': 0,
+        'timings': {},
+        'files': {},
+    }
+
+    with open(os.path.join(shard_dir, 'shard.log'), 'w') as log, contextlib.redirect_stdout(log):
+        step = 'setup'
+        t0 = time.perf_counter()
+        try:
+            ssp = session_factory(shard_id)
+            result['timings']['setup'] = time.perf_counter() - t0
+
+            step = 'project'
+            t0 = time.perf_counter()
+            dict_scens = {
+                ssp.key_design: list(designs),
+                ssp.key_future: list(futures),
+                ssp.key_strategy: list(strategies),
+            }
+            ssp.project_scenarios(dict_scens, save_inputs=save_inputs)
+            result['timings']['project'] = time.perf_counter() - t0
+
+            step = 'write'
+            t0 = time.perf_counter()
+            df_out = ssp.read_output(None)
+            primary_ids = sorted(df_out[ssp.key_primary].unique())
+            result['n_primaries'] = len(primary_ids)
+            result['files']['outputs'] = os.path.join(shard_dir, 'outputs.parquet')
+            df_out.to_parquet(result['files']['outputs'], index=False)
+            del df_out
+
+            if save_inputs:
+                df_in = ssp.read_input(None)
+                if df_in is not None:
+                    result['files']['inputs'] = os.path.join(shard_dir, 'inputs.parquet')
+                    df_in.to_parquet(result['files']['inputs'], index=False)
+
+            result['files']['attribute_primary'] = os.path.join(shard_dir, 'ATTRIBUTE_PRIMARY.csv')
+            ssp.odpt_primary.get_indexing_dataframe(primary_ids).to_csv(result['files']['attribute_primary'], index=None, encoding="UTF-8")
+            result['timings']['write'] = time.perf_counter() - t0
+        except Exception as e:
+            result['timings'][step] = time.perf_counter() - t0
+            result['status'] = 'failed'
+            result['error'] = f"{step}: {type(e).__name__}: {e}"
+            traceback.print_exc(file=log)
+
+    return result
+
+
+def merge_shards(results, output_dir, key_primary='primary_id'):
+    """
+    Merge the outputs and inputs of the shards into one store each, partitioned by primary ID, and
+    their ATTRIBUTE_PRIMARY tables into one CSV. Shards are read one at a time.
+
+    Args:
+        results (list): The results of the shards that succeeded, see `run_shard`.
+        output_dir (str): The directory of the merged database.
+        key_primary (str, optional): The primary key field. Defaults to 'primary_id'.
+    Returns:
+        dict: The paths of the merged 'outputs' and 'inputs' stores and of the 'attribute_primary' table.
+    """
+    merged = {}
+    results = sorted(results, key=lambda result: result['shard'])
+
+    def iter_frames(kind):
+        columns = None
+        seen = set()
+        for result in results:
+            if kind not in result['files']:
+                continue
+            df = pd.read_parquet(result['files'][kind])
+            duplicated = seen.intersection(df[key_primary].unique())
+            if duplicated:
+                tracer.warning(f"Primary IDs {sorted(duplicated)} of shard {result['shard']} were already merged from another shard.",
+                               event='shard_duplicated_primaries', shard=result['shard'], primary_ids=sorted(duplicated))
+            seen.update(df[key_primary].unique())
+            # Every shard must have the same columns to be read back together
+            if columns is None:
+                columns = list(df.columns)
+            yield df.reindex(columns=columns)
+
+    for kind in ('outputs', 'inputs'):
+        if any(kind in result['files'] for result in results):
+            merged[kind] = os.path.join(output_dir, kind)
+            OutputStore(merged[kind]).write(iter_frames(kind), partition_field=key_primary, source='shards')
+
+    tables = [pd.read_csv(result['files']['attribute_primary']) for result in results if 'attribute_primary' in result['files']]
+    if tables:
+        merged['attribute_primary'] = os.path.join(output_dir, 'ATTRIBUTE_PRIMARY.csv')
+        df_primary = pd.concat(tables, ignore_index=True).drop_duplicates(key_primary).sort_values(key_primary)
+        df_primary.to_csv(merged['attribute_primary'], index=None, encoding="UTF-8")
+
+    return merged
+
+
+def run_sharded_scenarios(
+    session_factory,
+    strategies,
+    output_dir,
+    n_shards=None,
+    max_workers=None,
+    designs=(0,),
+    futures=(0,),
+    save_inputs=True,
+    key_primary='primary_id',
+):
+    """
+    Run the scenarios of several strategies in parallel, one shard of strategies per worker process,
+    and merge the results into one database keyed by primary ID.
+
+    Strategies are independent given the same inputs, so instead of a single
+    `ssp.project_scenarios(dict_scens)` over all of them, every shard runs in its own session and csv
+    output directory (`<output_dir>/shard_<n>`), and the outputs are merged into
+    `<output_dir>/outputs` (and `<output_dir>/inputs`), see `OutputUtils.OutputStore`.
+
+    Args:
+        session_factory (callable): A picklable function building the session of a shard from its
+            number, e.g. a SisepuedeSessionFactory.
+        strategies (list): The strategy IDs to run, e.g. [0, 6003, 6004, 6005].
+        output_dir (str): The output directory.
+        n_shards (int, optional): The number of shards. Defaults to the number of workers.
+        max_workers (int, optional): The number of worker processes. Defaults to the number of
+            strategies, up to the number of CPUs.
+        designs (list, optional): The design IDs. Defaults to [0].
+        futures (list, optional): The future IDs. Defaults to [0].
+        save_inputs (bool, optional): Whether to save and merge the inputs. Defaults to True.
+        key_primary (str, optional): The primary key field. Defaults to 'primary_id'.
+    Returns:
+        tuple: The summary (pd.DataFrame, one row per shard with its strategies, status, error, pid,
+            number of primaries and the seconds of each step) and a dictionary with the 'wall_s' time,
+            the 'worker_s' total time of the workers, the 'parallelism' (worker time over wall time, the
+            average number of busy workers) and the paths of the 'merged' database.
+    """
+    if not strategies:
+        tracer.info("No strategies to run.", event='no_strategies')
+        return pd.DataFrame(), {}
+
+    if max_workers is None:
+        max_workers = min(len(strategies), os.cpu_count() or 1)
+    shards = split_shards(strategies, n_shards or max_workers)
+    os.makedirs(output_dir, exist_ok=True)
+
+    results = []
+    t0 = time.perf_counter()
+    with tracer.stage('run_shards', n_shards=len(shards), max_workers=max_workers):
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futures_shards = {
+                executor.submit(
+                    run_shard, session_factory, shard_id, shard, os.path.join(output_dir, f"shard_{shard_id}"),
+                    designs=designs, futures=futures, save_inputs=save_inputs,
+                ): (shard_id, shard)
+                for shard_id, shard in enumerate(shards)
+            }
+            for future in as_completed(futures_shards):
+                shard_id, shard = futures_shards[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    # The worker process itself failed, e.g. it was killed
+                    result = {
+                        'shard': shard_id,
+                        'strategies': shard,
+                        'status': 'failed',
+                        'error': f"{type(e).__name__}: {e}",
+                        'pid': None,
+                        'n_primaries': 0,
+                        'timings': {},
+                        'files': {},
+                    }
+                tracer.info(f"Shard {shard_id} {shard}: {result['status']}", event='shard_done',
+                            shard=shard_id, status=result['status'], error=result['error'])
+                results.append(result)
+    wall_s = time.perf_counter() - t0
+
+    with tracer.stage('merge_shards'):
+        merged = merge_shards([result for result in results if result['status'] == 'ok'], output_dir, key_primary=key_primary)
+
+    summary = pd.DataFrame([
+        {
+            'shard': result['shard'],
+            'strategies': ' '.join(str(strategy) for strategy in result['strategies']),
+            'status': result['status'],
+            'error': result['error'],
+            'pid': result['pid'],
+            'n_primaries': result['n_primaries'],
+            **{f"{step}_s": result['timings'].get(step) for step in ('setup', 'project', 'write')},
+            'total_s': sum(result['timings'].values()),
+        }
+        for result in results
+    ]).sort_values('shard').reset_index(drop=True)
+
+    worker_s = float(summary['total_s'].sum())
+    stats = {
+        'wall_s': wall_s,
+        'worker_s': worker_s,
+        'parallelism': worker_s / wall_s if wall_s > 0 else None,
+        'merged': merged,
+    }
+
+    tracer.info(f"\nRan {len(strategies)} strategies in {len(shards)} shards with {max_workers} workers in {wall_s:.2f} seconds "
+                f"({worker_s:.2f} seconds of worker time, parallelism {stats['parallelism']:.2f}):",
+                event='shards_summary', wall_s=wall_s, worker_s=worker_s, parallelism=stats['parallelism'])
+    tracer.info(summary.drop(columns='error').to_string(index=False, float_format=lambda x: f"{x:.2f}"), event='shards_table')
+
+    failed = summary[summary['status'] != 'ok']
+    if not failed.empty:
+        tracer.error(f"{len(failed)} shards failed (see shard.log in each shard directory):", event='shards_failed', n_failed=len(failed))
+        for _, row in failed.iterrows():
+            tracer.error(f"  shard {row['shard']} [{row['strategies']}]: {row['error']}", event='shard_failed', shard=row['shard'])
+
+    return summary, stats
+
+
+def get_frame_hash(df):
+    """
+    Fingerprint a frame from its column names, dtypes and values, hashed row by row in one pass.
+
+    Args:
+        df (pd.DataFrame): The frame, e.g. the aligned input frame.
+    Returns:
+        str: The SHA-256 hex digest.
+    """
+    digest = hashlib.sha256()
+    digest.update(json.dumps([[str(col), str(dtype)] for col, dtype in df.dtypes.items()]).encode('utf-8'))
+    digest.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def get_config_hash(config=None):
+    """
+    Fingerprint the model configuration: the given settings and the installed sisepuede version.
+
+    Args:
+        config (dict, optional): JSON-serializable settings that change the results, e.g. the region
+            config or the SISEPUEDE session arguments. File paths in the values are not read.
+    Returns:
+        str: The SHA-256 hex digest.
+    """
+    try:
+        from importlib.metadata import version
+        sisepuede_version = version('sisepuede')
+    except Exception:
+        sisepuede_version = None
+    payload = {'config': config or {}, 'sisepuede': sisepuede_version}
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+def get_strategy_hashes(strategy_definitions_file, dir_transformations, strategies=None):
+    """
+    Fingerprint strategies from their transformation specification and the content of the YAML
+    files of their transformations, so that editing a strategy or one of its YAMLs changes its hash.
+    Transformations without a YAML file (e.g. TX:BASE) are fingerprinted by their code, and
+    `config_general.yaml` is part of every fingerprint.
+
+    Args:
+        strategy_definitions_file (str): The strategy definitions CSV.
+        dir_transformations (str): The transformations directory.
+        strategies (list, optional): The strategy IDs. Defaults to all the strategies.
+    Returns:
+        dict: A dictionary mapping each strategy ID to its SHA-256 hex digest.
+    """
+    df_strategies = pd.read_csv(strategy_definitions_file)
+    if strategies is not None:
+        df_strategies = df_strategies[df_strategies['strategy_id'].isin(strategies)]
+
+    code_files = TransformationDirectoryIndex(dir_transformations).get_code_files()
+    file_hashes = {}
+
+    def get_yaml_hash(yaml_file):
+        if yaml_file not in file_hashes:
+            file_hashes[yaml_file] = get_file_hash(os.path.join(dir_transformations, yaml_file))
+        return file_hashes[yaml_file]
+
+    general_file = os.path.join(dir_transformations, 'config_general.yaml')
+    general_hash = get_file_hash(general_file) if os.path.exists(general_file) else None
+
+    strategy_hashes = {}
+    for strategy_id, specification in zip(df_strategies['strategy_id'], df_strategies['transformation_specification']):
+        codes = [] if pd.isna(specification) else str(specification).split('|')
+        payload = {
+            'general': general_hash,
+            'transformations': [[code, get_yaml_hash(code_files[code]) if code in code_files else None] for code in codes],
+        }
+        strategy_hashes[int(strategy_id)] = hashlib.sha256(json.dumps(payload).encode('utf-8')).hexdigest()
+    return strategy_hashes
+
+
+def run_cached_scenarios(
+    ssp,
+    strategies,
+    cache,
+    df_inputs,
+    dir_transformations,
+    strategy_definitions_file=None,
+    config=None,
+    designs=(0,),
+    futures=(0,),
+    save_inputs=True,
+):
+    """
+    Run the scenarios of several strategies, serving the strategies whose inputs didn't change from a
+    result cache and only sending the others to the model.
+
+    The outputs of a strategy are cached under the fingerprint of the input frame, of the strategy
+    (see `get_strategy_hashes`), of the model configuration (see `get_config_hash`) and of the designs
+    and futures.
+
+    Args:
+        ssp (sisepuede.SISEPUEDE): The SISEPUEDE session.
+        strategies (list): The strategy IDs to run, e.g. [0, 6003, 6004, 6005].
+        cache (ResultCache or str): The result cache, or its directory.
+        df_inputs (pd.DataFrame): The aligned input frame of the session, e.g. `df_inputs_raw_complete`.
+        dir_transformations (str): The transformations directory.
+        strategy_definitions_file (str, optional): The strategy definitions CSV. Defaults to
+            `strategy_definitions.csv` in the transformations directory.
+        config (dict, optional): Settings that change the results, see `get_config_hash`.
+        designs (list, optional): The design IDs. Defaults to [0].
+        futures (list, optional): The future IDs. Defaults to [0].
+        save_inputs (bool, optional): Passed to `project_scenarios`. Defaults to True.
+    Returns:
+        tuple: The outputs of all the strategies (pd.DataFrame) and a dictionary with the 'hits' and
+            'misses' strategy IDs.
+    """
+    if isinstance(cache, str):
+        cache = ResultCache(cache)
+    strategy_definitions_file = strategy_definitions_file or os.path.join(dir_transformations, 'strategy_definitions.csv')
+
+    with tracer.stage('fingerprint_scenarios'):
+        base_payload = {
+            'inputs': get_frame_hash(df_inputs),
+            'config': get_config_hash(config),
+            'designs': sorted(designs),
+            'futures': sorted(futures),
+        }
+        strategy_hashes = get_strategy_hashes(strategy_definitions_file, dir_transformations, strategies)
+        keys = {}
+        for strategy in strategies:
+            payload = {**base_payload, 'strategy': strategy_hashes.get(int(strategy))}
+            keys[strategy] = hashlib.sha256(json.dumps(payload, sort_keys=True).encode('utf-8')).hexdigest()
+
+    frames = {}
+    for strategy in strategies:
+        df = cache.get(keys[strategy])
+        if df is not None:
+            frames[strategy] = df
+    hits = [strategy for strategy in strategies if strategy in frames]
+    misses = [strategy for strategy in strategies if strategy not in frames]
+    tracer.count('scenario_cache_hits', len(hits))
+    tracer.count('scenario_cache_misses', len(misses))
+    tracer.info(f"Scenario cache: {len(hits)} hits {hits}, {len(misses)} misses {misses}",
+                event='scenario_cache', hits=hits, misses=misses)
+
+    if misses:
+        with tracer.stage('project_scenarios', strategies=misses):
+            dict_scens = {
+                ssp.key_design: list(designs),
+                ssp.key_future: list(futures),
+                ssp.key_strategy: misses,
+            }
+            ssp.project_scenarios(dict_scens, save_inputs=save_inputs)
+
+        # The session database also holds earlier runs, so keep the primaries of this run only
+        df_out = ssp.read_output(None)
+        df_primary = ssp.odpt_primary.get_indexing_dataframe(sorted(df_out[ssp.key_primary].unique()))
+        df_primary = df_primary[
+            df_primary[ssp.key_strategy].isin(misses)
+            & df_primary[ssp.key_design].isin(designs)
+            & df_primary[ssp.key_future].isin(futures)
+        ]
+        for strategy, primaries in df_primary.groupby(ssp.key_strategy)[ssp.key_primary]:
+            df_strategy = df_out[df_out[ssp.key_primary].isin(primaries)].reset_index(drop=True)
+            cache.put(keys[strategy], df_strategy, meta={'strategy_id': int(strategy)})
+            frames[strategy] = df_strategy
+        not_run = [strategy for strategy in misses if strategy not in frames]
+        if not_run:
+            tracer.warning(f"No outputs found for strategies {not_run}.", event='scenario_no_outputs', strategies=not_run)
+
+    df_out = pd.concat([frames[strategy] for strategy in strategies if strategy in frames], ignore_index=True) if frames else pd.DataFrame()
+    return df_out, {'hits': hits, 'misses': misses}
@@ -0,0 +1,401 @@
+import hashlib
+import json
+import os
+import pickle
+import re
+import uuid
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from TraceUtils import tracer
+
+
+class DatasetStore:
+    """
+    Content-addressed store for versioned regional input datasets.
+
+    Every column of a dataset version is stored as a chunk identified by the hash of its content,
+    so columns that are identical between versions (most of them, for successive
+    `updated_<region>_input_data_<timestamp>.csv` snapshots) are stored only once. The chunks that
+    a version adds to the store are packed into a single pack file at aligned offsets: loading a
+    version memory-maps the few packs it references and takes each column as a view, without
+    parsing or copying. Columns that can't be stored as a plain array (e.g. text with missing
+    values) are pickled.
+
+    Each version is described by a small JSON record listing its columns, their hashes and where
+    their chunks are, which is enough to tell which variables changed between two versions without
+    loading either.
+
+    Layout of the store directory:
+        packs/<id>.pack        column chunks
+        versions/<name>.json   version records
+    """
+
+    # Offsets of the chunks in a pack are multiples of this, so that views are aligned
+    ALIGNMENT = 64
+
+    def __init__(self, store_dir):
+        """
+        Args:
+            store_dir (str): The directory of the store; it is created if it doesn't exist.
+        """
+        self.store_dir = store_dir
+        self.packs_dir = os.path.join(store_dir, 'packs')
+        self.versions_dir = os.path.join(store_dir, 'versions')
+        os.makedirs(self.packs_dir, exist_ok=True)
+        os.makedirs(self.versions_dir, exist_ok=True)
+        # Hash -> chunk location, built from the version records on first use
+        self._chunks = None
+
+    def get_chunks(self):
+        """
+        Get the locations of all the chunks in the store, keyed by content hash.
+
+        Returns:
+            dict: A dictionary mapping a hash to its chunk location (pack, offset, nbytes, kind, array dtype).
+        """
+        if self._chunks is None:
+            self._chunks = {}
+            for name in self.get_version_names():
+                record = self.get_version(name)
+                entries = record['columns'] + ([record['index']] if record['index'] is not None else [])
+                for entry in entries:
+                    self._chunks.setdefault(entry['hash'], self.get_chunk_location(entry))
+        return self._chunks
+
+    def get_chunk_location(self, entry):
+        """
+        Extract the location of a chunk from a column entry.
+
+        Args:
+            entry (dict): A column entry of a version record.
+        Returns:
+            dict: The chunk location.
+        """
+        return {key: entry[key] for key in ('pack', 'offset', 'nbytes', 'kind', 'array_dtype')}
+
+    def get_column_chunk(self, series):
+        """
+        Convert a column to the bytes that are stored, and compute its content hash.
+
+        Args:
+            series (pd.Series): The column.
+        Returns:
+            tuple: The content hash, the storage kind ('array' or 'pickle'), the array dtype (or None)
+                and the bytes to store.
+        """
+        values = None
+        if pd.api.types.is_numeric_dtype(series.dtype) or pd.api.types.is_bool_dtype(series.dtype):
+            try:
+                values = series.to_numpy(dtype=getattr(series.dtype, 'numpy_dtype', None))
+            except (TypeError, ValueError):
+                values = None
+            if values is not None and values.dtype.kind not in 'biuf':
+                values = None
+        if values is None and not series.isna().any():
+            values = series.to_numpy(dtype=str)
+
+        if values is not None:
+            data = np.ascontiguousarray(values).tobytes()
+            digest = hashlib.sha256(f"array:{values.dtype.str}:".encode('utf-8') + data).hexdigest()
+            return digest, 'array', values.dtype.str, data
+
+        data = pickle.dumps(series.tolist(), protocol=pickle.HIGHEST_PROTOCOL)
+        digest = hashlib.sha256(b'pickle:' + data).hexdigest()
+        return digest, 'pickle', None, data
+
+    def get_pack_path(self, pack):
+        """
+        Build the path of a pack file.
+
+        Args:
+            pack (str): The pack id.
+        Returns:
+            str: The pack path.
+        """
+        return os.path.join(self.packs_dir, f"{pack}.pack")
+
+    def get_version_path(self, name):
+        """
+        Build the path of a version record.
+
+        Args:
+            name (str): The version name.
+        Returns:
+            str: The record path.
+        """
+        return os.path.join(self.versions_dir, f"{name}.json")
+
+    def get_version_names(self):
+        """
+        Get the names of the stored versions.
+
+        Returns:
+            list: The version names.
+        """
+        return sorted(
+            file_name[:-len('.json')] for file_name in os.listdir(self.versions_dir) if file_name.endswith('.json')
+        )
+
+    def parse_timestamp(self, name):
+        """
+        Extract the timestamp embedded in a dataset name, e.g. `20250117_1831` or `20250102104421`.
+
+        Args:
+            name (str): The dataset name.
+        Returns:
+            str: The timestamp in ISO format, or None if the name has no timestamp.
+        """
+        match = re.search(r'(\d{8})_?(\d{4,6})', name)
+        if match is None:
+            return None
+        date, clock = match.groups()
+        try:
+            return datetime.strptime(date + clock.ljust(6, '0'), '%Y%m%d%H%M%S').isoformat()
+        except ValueError:
+            return None
+
+    def add_frame(self, df, name, timestamp=None, source=None):
+        """
+        Add a DataFrame as a new dataset version. Only the columns whose content is not in the store
+        yet are written.
+
+        Args:
+            df (pd.DataFrame): The dataset.
+            name (str): The version name.
+            timestamp (str, optional): The version timestamp. Defaults to the timestamp embedded in the name.
+            source (str, optional): The file the dataset was read from.
+        Returns:
+            dict: The version record.
+        Raises:
+            ValueError: If the dataset has duplicate column names.
+        """
+        if df.columns.has_duplicates:
+            raise ValueError(f"Dataset {name} has duplicate columns and can't be stored.")
+
+        chunks = self.get_chunks()
+        pack = uuid.uuid4().hex
+        pack_path = self.get_pack_path(pack)
+        tmp_path = f"{pack_path}.{os.getpid()}.tmp"
+        new_chunks = {}
+
+        def add_chunk(series):
+            digest, kind, array_dtype, data = self.get_column_chunk(series)
+            if digest not in chunks and digest not in new_chunks:
+                offset = file.tell()
+                file.write(data)
+                file.write(b'\0' * (-len(data) % self.ALIGNMENT))
+                new_chunks[digest] = {
+                    'pack': pack, 'offset': offset, 'nbytes': len(data), 'kind': kind, 'array_dtype': array_dtype,
+                }
+            location = new_chunks.get(digest) or chunks[digest]
+            return {'hash': digest, 'dtype': str(series.dtype), **location}
+
+        with open(tmp_path, 'wb') as file:
+            columns = [{'name': col, **add_chunk(df[col])} for col in df.columns]
+            index = None
+            if not df.index.equals(pd.RangeIndex(len(df))):
+                index = {'name': df.index.name, **add_chunk(df.index.to_series())}
+
+        if new_chunks:
+            os.replace(tmp_path, pack_path)
+        else:
+            os.remove(tmp_path)
+        chunks.update(new_chunks)
+
+        record = {
+            'name': name,
+            'timestamp': timestamp if timestamp is not None else self.parse_timestamp(name),
+            'source': source,
+            'n_rows': len(df),
+            'index': index,
+            'columns': columns,
+        }
+        tmp_path = f"{self.get_version_path(name)}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as file:
+            json.dump(record, file)
+        os.replace(tmp_path, self.get_version_path(name))
+
+        n_chunks = len(columns) + (index is not None)
+        tracer.info(f"Stored version {name}: {n_chunks} columns, {len(new_chunks)} new, {n_chunks - len(new_chunks)} shared.",
+                    event='store_version', name=name, n_columns=n_chunks, n_new=len(new_chunks))
+        return record
+
+    def add_csv(self, csv_file, name=None, **read_csv_kwargs):
+        """
+        Add a CSV file as a new dataset version.
+
+        Args:
+            csv_file (str): The path to the CSV file.
+            name (str, optional): The version name. Defaults to the file name without extension.
+            **read_csv_kwargs: Additional arguments passed to pd.read_csv.
+        Returns:
+            dict: The version record.
+        """
+        if name is None:
+            name = os.path.splitext(os.path.basename(csv_file))[0]
+        df = pd.read_csv(csv_file, **read_csv_kwargs)
+        return self.add_frame(df, name, source=os.path.abspath(csv_file))
+
+    def list_versions(self):
+        """
+        List the stored dataset versions.
+
+        Returns:
+            pd.DataFrame: One row per version with its name, timestamp, source, number of rows and columns,
+                sorted by timestamp.
+        """
+        records = []
+        for name in self.get_version_names():
+            record = self.get_version(name)
+            records.append({
+                'name': record['name'],
+                'timestamp': record['timestamp'],
+                'source': record['source'],
+                'n_rows': record['n_rows'],
+                'n_columns': len(record['columns']),
+            })
+
+        df = pd.DataFrame(records, columns=['name', 'timestamp', 'source', 'n_rows', 'n_columns'])
+        return df.sort_values(['timestamp', 'name'], na_position='first').reset_index(drop=True)
+
+    def get_version(self, version):
+        """
+        Load a version record by name, by timestamp, or 'latest'.
+
+        Args:
+            version (str): The version name, its timestamp (ISO format or as embedded in file names),
+                or 'latest' for the version with the most recent timestamp.
+        Returns:
+            dict: The version record.
+        Raises:
+            KeyError: If no version matches.
+        """
+        path = self.get_version_path(version)
+        if os.path.exists(path):
+            with open(path, 'r') as file:
+                return json.load(file)
+
+        versions = self.list_versions()
+        if version == 'latest':
+            matches = versions.dropna(subset=['timestamp']).tail(1)
+        else:
+            timestamp = self.parse_timestamp(version) or version
+            matches = versions[versions['timestamp'] == timestamp]
+
+        if len(matches) != 1:
+            raise KeyError(f"No unique dataset version matches {version}.")
+        return self.get_version(matches['name'].iloc[0])
+
+    def read_entries(self, entries, mmap=True):
+        """
+        Read the chunks of column entries, opening each pack only once.
+
+        Args:
+            entries (list): Column entries of a version record.
+            mmap (bool, optional): Whether to memory-map the packs. If False, the packs are read into memory.
+        Returns:
+            list: The column values, as arrays (views of the packs) or lists for pickled chunks.
+        """
+        buffers = {}
+        values = []
+        for entry in entries:
+            buffer = buffers.get(entry['pack'])
+            if buffer is None:
+                path = self.get_pack_path(entry['pack'])
+                buffer = np.memmap(path, dtype=np.uint8, mode='r') if mmap else np.fromfile(path, dtype=np.uint8)
+                buffers[entry['pack']] = np.asarray(buffer)
+
+            data = buffers[entry['pack']][entry['offset']:entry['offset'] + entry['nbytes']]
+            if entry['kind'] == 'array':
+                # View of the pack, no copy
+                values.append(data.view(np.dtype(entry['array_dtype'])))
+            else:
+                values.append(pickle.loads(data.tobytes()))
+        return values
+
+    def to_column(self, entry, values):
+        """
+        Convert stored column values back to the original dtype.
+
+        Args:
+            entry (dict): The column entry of a version record.
+            values (np.ndarray or list): The stored values.
+        Returns:
+            np.ndarray or pd.Series: The column, as the stored array when it can be used as is.
+        """
+        if entry['kind'] == 'array' and np.dtype(entry['array_dtype']).kind != 'U':
+            return values
+
+        dtype = object if entry['dtype'] == 'object' else entry['dtype']
+        try:
+            return pd.Series(values, dtype=dtype)
+        except (TypeError, ValueError):
+            return pd.Series(values, dtype=object)
+
+    def load_array(self, version, column, mmap=True):
+        """
+        Load a single column of a version as an array, memory-mapped when possible.
+
+        Args:
+            version (str): The version, see `get_version`.
+            column (str): The column name.
+            mmap (bool, optional): Whether to memory-map the pack. Defaults to True.
+        Returns:
+            np.ndarray: The column values.
+        Raises:
+            KeyError: If the column is not in the version.
+        """
+        record = self.get_version(version)
+        for entry in record['columns']:
+            if entry['name'] == column:
+                return np.asarray(self.read_entries([entry], mmap=mmap)[0])
+        raise KeyError(f"Column {column} not found in version {record['name']}.")
+
+    def load(self, version, columns=None, mmap=True):
+        """
+        Load a dataset version as a DataFrame. Numeric columns are views of the memory-mapped packs.
+
+        Args:
+            version (str): The version, see `get_version`.
+            columns (list, optional): The columns to load. Defaults to all the columns.
+            mmap (bool, optional): Whether to memory-map the packs. Defaults to True.
+        Returns:
+            pd.DataFrame: The dataset.
+        """
+        record = self.get_version(version)
+        entries = record['columns']
+        if columns is not None:
+            wanted = set(columns)
+            entries = [entry for entry in entries if entry['name'] in wanted]
+
+        values = self.read_entries(entries, mmap=mmap)
+        data = {entry['name']: self.to_column(entry, value) for entry, value in zip(entries, values)}
+        df = pd.DataFrame(data, copy=False)
+
+        if record['index'] is not None:
+            index_values = self.read_entries([record['index']], mmap=False)[0]
+            df.index = pd.Index(self.to_column(record['index'], index_values), name=record['index']['name'])
+        return df
+
+    def diff(self, version_a, version_b):
+        """
+        Compare two versions from their records only, without loading any column.
+
+        Args:
+            version_a (str): The first version, see `get_version`.
+            version_b (str): The second version, see `get_version`.
+        Returns:
+            dict: A dictionary with the keys 'changed', 'added' (in b but not in a) and 'removed'
+                (in a but not in b), each a list of column names.
+        """
+        hashes_a = {entry['name']: entry['hash'] for entry in self.get_version(version_a)['columns']}
+        hashes_b = {entry['name']: entry['hash'] for entry in self.get_version(version_b)['columns']}
+
+        return {
+            'changed': [col for col, digest in hashes_b.items() if col in hashes_a and hashes_a[col] != digest],
+            'added': [col for col in hashes_b if col not in hashes_a],
+            'removed': [col for col in hashes_a if col not in hashes_b],
+        }
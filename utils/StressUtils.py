@@ -0,0 +1,376 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+from TraceUtils import tracer
+from ValidationUtils import InputValidator
+
+PERTURBATION_TYPES = ('multiplicative', 'additive', 'trend')
+
+
+class StressedInputGenerator:
+    """
+    Vectorized generator of stressed futures of an aligned regional input frame.
+
+    A future is the input frame with a set of perturbations applied to the columns that start with
+    given prefixes:
+
+    - multiplicative: the values are multiplied by a factor drawn from [low, high].
+    - additive: a shift drawn from [low, high] is added to the values.
+    - trend: the values are multiplied by `1 + d * ramp`, where d is drawn from [low, high] and the
+      ramp grows linearly from 0 at `start_period` to 1 at the last time period.
+
+    By default one value is drawn per future and perturbation and shared by all its columns; set
+    `per_column` to draw one per column. After the perturbations, the values are clipped to the bounds
+    of the validator and the sum-to-one fraction groups are renormalized.
+
+    Futures are generated as a (futures x time periods x columns) tensor in chunks of `chunk_size` and
+    streamed to a Parquet file (one row group per chunk, long format with a `future_id` column) or to a
+    `.npy` tensor, so the memory used doesn't depend on the number of futures. Future 0 is the
+    unperturbed frame, and the draws of every future only depend on the seed and the future ID.
+
+    Example:
+        spec = [
+            {'prefix': 'elasticity_', 'type': 'multiplicative', 'low': 0.8, 'high': 1.2},
+            {'prefix': 'frac_lvst_', 'type': 'trend', 'low': -0.1, 'high': 0.1, 'start_period': 6},
+        ]
+        generator = StressedInputGenerator(df_inputs, spec, seed=0)
+        draws = generator.generate(1000, 'data/croatia_input_data_stressed.parquet')
+    """
+
+    def __init__(
+        self,
+        df_inputs,
+        spec,
+        validator=None,
+        chunk_size=64,
+        seed=None,
+        time_period_field='time_period',
+        region_field='region',
+        dtype=np.float64,
+    ):
+        """
+        Args:
+            df_inputs (pd.DataFrame): The aligned input frame, one row per time period.
+            spec (list): The perturbations. Each one is a dictionary with the keys 'prefix', 'type'
+                ('multiplicative', 'additive' or 'trend'), 'low' and 'high', and optionally 'name',
+                'per_column' (bool) and, for trends, 'start_period' (defaults to the first time period).
+            validator (InputValidator, optional): The bounds and fraction groups enforced on the futures.
+                Defaults to `InputValidator.default()`.
+            chunk_size (int, optional): The number of futures per chunk. Defaults to 64.
+            seed (int, optional): The random seed. Defaults to None.
+            time_period_field (str, optional): The time period field. Defaults to 'time_period'.
+            region_field (str, optional): The region field. Defaults to 'region'.
+            dtype (np.dtype, optional): The dtype of the futures. Defaults to float64.
+        """
+        self.df_inputs = df_inputs.reset_index(drop=True)
+        self.spec = [self.normalize_perturbation(perturbation, i) for i, perturbation in enumerate(spec)]
+        self.validator = validator if validator is not None else InputValidator.default()
+        self.chunk_size = chunk_size
+        self.seed = 0 if seed is None else seed
+        self.time_period_field = time_period_field
+        self.region_field = region_field
+        self.dtype = dtype
+        self._compiled = None
+
+    def normalize_perturbation(self, perturbation, i):
+        """
+        Check a perturbation of the spec and fill in its defaults.
+
+        Args:
+            perturbation (dict): The perturbation.
+            i (int): The position of the perturbation in the spec.
+        Returns:
+            dict: The perturbation with all its keys.
+        Raises:
+            ValueError: If the type is unknown or the bounds are missing.
+        """
+        if perturbation.get('type') not in PERTURBATION_TYPES:
+            raise ValueError(f"Unknown perturbation type {perturbation.get('type')!r}, expected one of {PERTURBATION_TYPES}.")
+        if 'low' not in perturbation or 'high' not in perturbation:
+            raise ValueError(f"Perturbation {perturbation.get('prefix')!r} needs 'low' and 'high' bounds.")
+        return {
+            'name': perturbation.get('name', f"{perturbation['type']}_{perturbation['prefix']}{i}"),
+            'prefix': perturbation['prefix'],
+            'type': perturbation['type'],
+            'low': float(perturbation['low']),
+            'high': float(perturbation['high']),
+            'per_column': bool(perturbation.get('per_column', False)),
+            'start_period': perturbation.get('start_period'),
+        }
+
+    def compile(self):
+        """
+        Compile the spec for the input frame: the base array, the column indices of every
+        perturbation, the trend ramps, the bounds and the fraction groups.
+
+        Returns:
+            dict: The compiled spec.
+        """
+        if self._compiled is not None:
+            return self._compiled
+
+        df = self.df_inputs
+        id_fields = [col for col in (self.region_field, self.time_period_field) if col in df.columns]
+        value_cols = [
+            col for col in df.columns
+            if col not in id_fields and pd.api.types.is_numeric_dtype(df[col])
+        ]
+        other_cols = [col for col in df.columns if col not in id_fields and col not in value_cols]
+        if other_cols:
+            tracer.warning(f"Non-numeric columns are not included in the futures: {other_cols}",
+                           event='stress_non_numeric', columns=other_cols)
+        value_cols_array = np.array(value_cols, dtype=object)
+        base = df[value_cols].to_numpy(dtype=self.dtype)
+
+        if self.time_period_field in df.columns:
+            time_periods = df[self.time_period_field].to_numpy(dtype=float)
+        else:
+            time_periods = np.arange(len(df), dtype=float)
+
+        perturbations = []
+        for perturbation in self.spec:
+            idx = np.flatnonzero([col.startswith(perturbation['prefix']) for col in value_cols])
+            if len(idx) == 0:
+                tracer.warning(f"No columns match the perturbation prefix {perturbation['prefix']}",
+                               event='stress_no_columns', prefix=perturbation['prefix'])
+                continue
+            ramp = None
+            if perturbation['type'] == 'trend':
+                start = time_periods.min() if perturbation['start_period'] is None else float(perturbation['start_period'])
+                span = max(time_periods.max() - start, 1.0)
+                ramp = np.clip((time_periods - start) / span, 0.0, 1.0).astype(self.dtype)
+            perturbations.append({**perturbation, 'idx': idx, 'ramp': ramp})
+
+        rules = self.validator.compile(df[value_cols])
+        self._compiled = {
+            'id_frame': df[id_fields].copy(),
+            'value_cols': value_cols,
+            'base': base,
+            'perturbations': perturbations,
+            # The validator's numeric columns are the value columns, in the same order
+            'bounded': rules['bounded'],
+            'lower': rules['lower'].astype(self.dtype),
+            'upper': rules['upper'].astype(self.dtype),
+            'groups': [
+                np.flatnonzero([col.startswith(group) for col in value_cols_array])
+                for group in rules['groups']
+            ],
+        }
+        return self._compiled
+
+    def draw(self, future_ids):
+        """
+        Draw the perturbation values of some futures. The values of a future only depend on the seed
+        and its ID, so they don't change with the chunk size.
+
+        Args:
+            future_ids (np.ndarray): The future IDs.
+        Returns:
+            list: One array per compiled perturbation, with shape (futures,) or (futures, columns).
+        """
+        compiled = self.compile()
+        draws = [[] for _ in compiled['perturbations']]
+        for future_id in future_ids:
+            rng = np.random.default_rng([self.seed, int(future_id)])
+            for values, perturbation in zip(draws, compiled['perturbations']):
+                size = len(perturbation['idx']) if perturbation['per_column'] else None
+                values.append(rng.uniform(perturbation['low'], perturbation['high'], size))
+        return [np.asarray(values, dtype=self.dtype) for values in draws]
+
+    def build_chunk(self, future_ids):
+        """
+        Build the futures of a chunk.
+
+        Args:
+            future_ids (np.ndarray): The future IDs; future 0 is the unperturbed frame.
+        Returns:
+            tuple: The (futures x time periods x columns) tensor and the draws, see `draw`.
+        """
+        compiled = self.compile()
+        tensor = np.repeat(compiled['base'][None, :, :], len(future_ids), axis=0)
+        draws = self.draw(future_ids)
+        # Future 0 keeps the inputs as they are; it can only be the first future of a chunk
+        n_base = int(len(future_ids) > 0 and future_ids[0] == 0)
+        perturbed = tensor[n_base:]
+
+        for perturbation, values in zip(compiled['perturbations'], draws):
+            idx = perturbation['idx']
+            # (futures x 1 x columns) or (futures x 1 x 1)
+            values = values[n_base:].reshape(len(perturbed), 1, -1)
+            if perturbation['type'] == 'multiplicative':
+                perturbed[:, :, idx] *= values
+            elif perturbation['type'] == 'additive':
+                perturbed[:, :, idx] += values
+            else:
+                perturbed[:, :, idx] *= 1.0 + values * perturbation['ramp'][None, :, None]
+
+        if len(compiled['bounded']) > 0:
+            bounded = compiled['bounded']
+            perturbed[:, :, bounded] = np.clip(perturbed[:, :, bounded], compiled['lower'], compiled['upper'])
+
+        for idx in compiled['groups']:
+            group_values = perturbed[:, :, idx]
+            totals = group_values.sum(axis=2, keepdims=True)
+            perturbed[:, :, idx] = np.divide(group_values, totals, out=group_values, where=totals > 0)
+
+        return tensor, draws
+
+    def get_chunk_frame(self, tensor, future_ids):
+        """
+        Flatten a chunk tensor into a long frame with one row per future and time period.
+
+        Args:
+            tensor (np.ndarray): The (futures x time periods x columns) tensor.
+            future_ids (np.ndarray): The future IDs.
+        Returns:
+            pd.DataFrame: The frame, with the columns 'future_id', the id fields and the value columns.
+        """
+        compiled = self.compile()
+        n_futures, n_periods, n_cols = tensor.shape
+        df = pd.DataFrame(tensor.reshape(n_futures * n_periods, n_cols), columns=compiled['value_cols'], copy=False)
+        id_frame = compiled['id_frame']
+        ids = pd.DataFrame({col: np.tile(id_frame[col].to_numpy(), n_futures) for col in id_frame.columns})
+        ids.insert(0, 'future_id', np.repeat(np.asarray(future_ids, dtype=np.int64), n_periods))
+        return pd.concat([ids, df], axis=1)
+
+    def get_chunk_table(self, tensor, future_ids):
+        """
+        Flatten a chunk tensor into an Arrow table with the layout of `get_chunk_frame`, without going
+        through pandas.
+
+        Args:
+            tensor (np.ndarray): The (futures x time periods x columns) tensor.
+            future_ids (np.ndarray): The future IDs.
+        Returns:
+            pa.Table: The table.
+        """
+        compiled = self.compile()
+        n_futures, n_periods, n_cols = tensor.shape
+        # One contiguous row per column, so every Arrow column wraps its values without a copy
+        columns = np.ascontiguousarray(tensor.transpose(2, 0, 1)).reshape(n_cols, n_futures * n_periods)
+        id_frame = compiled['id_frame']
+        arrays = [pa.array(np.repeat(np.asarray(future_ids, dtype=np.int64), n_periods))]
+        arrays += [pa.array(np.tile(id_frame[col].to_numpy(), n_futures)) for col in id_frame.columns]
+        arrays += [pa.array(values) for values in columns]
+        names = ['future_id'] + list(id_frame.columns) + compiled['value_cols']
+        return pa.Table.from_arrays(arrays, names=names)
+
+    def get_draws_frame(self, draws, future_ids):
+        # One column per perturbation; per-column draws are summarized by their mean
+        compiled = self.compile()
+        data = {'future_id': np.asarray(future_ids, dtype=np.int64)}
+        for perturbation, values in zip(compiled['perturbations'], draws):
+            data[perturbation['name']] = values.mean(axis=1) if values.ndim == 2 else values
+        df = pd.DataFrame(data)
+        # Nothing is applied to future 0
+        df.loc[df['future_id'] == 0, df.columns[1:]] = np.nan
+        return df
+
+    def generate(self, n_futures, output_file, file_format=None):
+        """
+        Generate futures 0 to `n_futures` and stream them to a file, one chunk at a time.
+
+        Args:
+            n_futures (int): The number of stressed futures; future 0 (the unperturbed frame) is added.
+            output_file (str): The output file.
+            file_format (str, optional): 'parquet' or 'npy'. Defaults to the extension of the output file.
+                A `.npy` file holds the (futures x time periods x columns) tensor and is written with a
+                `<file>.json` sidecar listing its future IDs, time periods and columns.
+        Returns:
+            pd.DataFrame: The draws of every future, one column per perturbation.
+        Raises:
+            ImportError: If the format is Parquet and pyarrow is not installed.
+            ValueError: If the format is unknown.
+        """
+        file_format = file_format or os.path.splitext(output_file)[1].lstrip('.').lower()
+        if file_format not in ('parquet', 'npy'):
+            raise ValueError(f"Unknown output format {file_format!r}, expected 'parquet' or 'npy'.")
+        if file_format == 'parquet' and pq is None:
+            raise ImportError("pyarrow is required to write Parquet files, use a .npy output instead.")
+
+        compiled = self.compile()
+        future_ids = np.arange(n_futures + 1)
+        n_periods, n_cols = compiled['base'].shape
+        draws_frames = []
+        tmp_file = f"{output_file}.tmp"
+
+        with tracer.stage('generate_stressed_inputs', n_futures=n_futures, file_format=file_format):
+            writer = None
+            tensor_file = None
+            if file_format == 'npy':
+                tensor_file = np.lib.format.open_memmap(tmp_file, mode='w+', dtype=self.dtype, shape=(len(future_ids), n_periods, n_cols))
+            try:
+                for start in range(0, len(future_ids), self.chunk_size):
+                    chunk_ids = future_ids[start:start + self.chunk_size]
+                    tensor, draws = self.build_chunk(chunk_ids)
+                    if tensor_file is not None:
+                        tensor_file[start:start + len(chunk_ids)] = tensor
+                    else:
+                        table = self.get_chunk_table(tensor, chunk_ids)
+                        if writer is None:
+                            writer = pq.ParquetWriter(tmp_file, table.schema)
+                        writer.write_table(table)
+                    draws_frames.append(self.get_draws_frame(draws, chunk_ids))
+                    tracer.count('futures_written', len(chunk_ids))
+            finally:
+                if writer is not None:
+                    writer.close()
+                if tensor_file is not None:
+                    tensor_file.flush()
+                    del tensor_file
+            os.replace(tmp_file, output_file)
+
+        if file_format == 'npy':
+            id_frame = compiled['id_frame']
+            metadata = {
+                'future_ids': future_ids.tolist(),
+                'time_periods': id_frame[self.time_period_field].tolist() if self.time_period_field in id_frame else list(range(n_periods)),
+                # The id fields in the order of the Parquet layout, so both formats read back the same columns
+                'id_fields': {col: id_frame[col].tolist() for col in id_frame.columns},
+                'columns': compiled['value_cols'],
+            }
+            with open(f"{output_file}.json", 'w') as file:
+                json.dump(metadata, file)
+
+        tracer.info(f"Stressed futures written: {n_futures} (+ base) to {output_file}",
+                    event='stressed_inputs_written', n_futures=n_futures, output_file=output_file)
+        return pd.concat(draws_frames, ignore_index=True)
+
+
+def read_future(file_path, future_id):
+    """
+    Read a single future from a file written by `StressedInputGenerator.generate`.
+
+    Args:
+        file_path (str): The Parquet or `.npy` file.
+        future_id (int): The future ID.
+    Returns:
+        pd.DataFrame: The input frame of the future, one row per time period, with the id fields (e.g.
+            region and time period) and the value columns in the same order for both formats.
+    """
+    if file_path.endswith('.npy'):
+        with open(f"{file_path}.json", 'r') as file:
+            metadata = json.load(file)
+        tensor = np.load(file_path, mmap_mode='r')
+        position = metadata['future_ids'].index(int(future_id))
+        df = pd.DataFrame(np.array(tensor[position]), columns=metadata['columns'])
+        # Files written before the id fields were recorded only have the time periods
+        id_fields = metadata.get('id_fields', {'time_period': metadata['time_periods']})
+        for i, (col, values) in enumerate(id_fields.items()):
+            df.insert(i, col, values)
+        return df
+
+    if pq is None:
+        raise ImportError("pyarrow is required to read Parquet files.")
+    table = pq.read_table(file_path, filters=[('future_id', '=', int(future_id))])
+    return table.to_pandas().drop(columns='future_id').reset_index(drop=True)
@@ -0,0 +1,669 @@
+import os
+
+import numpy as np
+import pandas as pd
+import yaml
+
+from TraceUtils import tracer
+from TransformationUtils import YAML_DUMPER, StrategyIDRegistry
+
+# Bump when the layout of the sweep record changes
+SWEEP_RECORD_VERSION = 2
+STRATEGY_MAPPING_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'strategy_mapping.yaml')
+# Largest number of samples a grid may expand to, the size of the SWEEP range of the strategy mapping
+MAX_GRID_SAMPLES = 100000
+STRATEGY_DEFINITIONS_FILE = 'strategy_definitions.csv'
+
+
+def load_strategy_registry(strategy_mapping_file=STRATEGY_MAPPING_FILE, strategy_ids=()):
+    """
+    Build a strategy ID registry from the strategy mapping.
+
+    Args:
+        strategy_mapping_file (str, optional): The strategy mapping file. Defaults to `utils/strategy_mapping.yaml`.
+        strategy_ids (list, optional): The strategy IDs already in use.
+    Returns:
+        StrategyIDRegistry: The registry.
+    """
+    with open(strategy_mapping_file, 'r') as file:
+        mapping = yaml.safe_load(file)['strategy_groups']
+    return StrategyIDRegistry(mapping, strategy_ids)
+
+
+# Registries of the strategy CSV files, shared by all the sweeps of the session
+_csv_registries = {}
+
+
+def get_csv_registry(csv_file, strategy_mapping_file=STRATEGY_MAPPING_FILE):
+    """
+    Get the strategy ID registry of a strategy CSV file for the session.
+
+    The registry is shared by every sweep built on the same CSV file, so their strategy IDs never
+    collide, and the IDs of the CSV's 'strategy_id' column are reserved each time it is requested.
+
+    Args:
+        csv_file (str): The strategy CSV file, e.g. `transformations/strategy_definitions.csv`. A missing
+            file has no used ID.
+        strategy_mapping_file (str, optional): The strategy mapping file. Defaults to `utils/strategy_mapping.yaml`.
+    Returns:
+        StrategyIDRegistry: The registry.
+    """
+    key = (os.path.abspath(csv_file), os.path.abspath(strategy_mapping_file))
+    if key not in _csv_registries:
+        _csv_registries[key] = load_strategy_registry(strategy_mapping_file)
+    id_registry = _csv_registries[key]
+    if os.path.exists(csv_file):
+        strategy_ids = pd.to_numeric(pd.read_csv(csv_file, usecols=['strategy_id'])['strategy_id'], errors='coerce')
+        for strategy_id in strategy_ids.dropna().astype(int):
+            id_registry.reserve(strategy_id)
+    return id_registry
+
+
+class VirtualTransformation:
+    """
+    A strategy transformation of a sweep that only exists in memory.
+
+    It holds the transformation's position in the sweep matrix; the YAML content is built from the
+    template when it is requested and is not kept.
+    """
+
+    def __init__(self, sweep, sample, transformation):
+        """
+        Args:
+            sweep (MagnitudeSweep): The sweep the transformation belongs to.
+            sample (int): The row of the sweep matrix.
+            transformation (int): The column of the sweep matrix.
+        """
+        self.sweep = sweep
+        self.sample = sample
+        self.transformation = transformation
+
+    def __repr__(self):
+        return f"VirtualTransformation({self.transformation_code!r}, magnitude={self.magnitude!r})"
+
+    @property
+    def transformation_code(self):
+        return self.sweep.get_transformation_code(self.sample, self.transformation)
+
+    @property
+    def scalar_val(self):
+        return float(self.sweep.scalars[self.sample, self.transformation])
+
+    @property
+    def magnitude(self):
+        return float(self.sweep.magnitudes[self.sample, self.transformation])
+
+    def get_yaml_content(self):
+        """
+        Build the YAML content of the transformation: the template with the scaled magnitude and the
+        identifiers of the sweep level.
+
+        Returns:
+            dict: The YAML content.
+        """
+        row = self.sweep.transformations.iloc[self.transformation]
+        yaml_path = os.path.join(self.sweep.yaml_directory, row['transformation_yaml_name'])
+        yaml_content = self.sweep.template_cache.get(yaml_path)
+        yaml_content['parameters']['magnitude'] = self.magnitude
+        yaml_content['identifiers']['transformation_code'] = self.transformation_code
+        yaml_content['identifiers']['transformation_name'] = f"Scaled Default Max Parameters by {self.scalar_val} - {row['subsector']}: {row['transformation_name']}"
+        return yaml_content
+
+    def get_yaml_name(self):
+        """
+        Build the file name the transformation is written to when it is materialized.
+
+        Returns:
+            str: The YAML file name, e.g. `transformation_agrc_dec_exports_sweep_a_3.yaml`.
+        """
+        yaml_name = self.sweep.transformations.iloc[self.transformation]['transformation_yaml_name']
+        level = self.sweep.get_level(self.sample, self.transformation)
+        return f"{os.path.splitext(yaml_name)[0]}_{self.sweep.name}_{level}.yaml"
+
+
+class VirtualStrategy:
+    """
+    A strategy of a sweep, i.e. one row of the sweep matrix, that only exists in memory.
+    """
+
+    def __init__(self, sweep, sample):
+        """
+        Args:
+            sweep (MagnitudeSweep): The sweep the strategy belongs to.
+            sample (int): The row of the sweep matrix.
+        """
+        self.sweep = sweep
+        self.sample = sample
+
+    def __repr__(self):
+        return f"VirtualStrategy({self.strategy_code!r}, strategy_id={self.strategy_id})"
+
+    @property
+    def strategy_id(self):
+        return int(self.sweep.strategy_ids[self.sample])
+
+    @property
+    def strategy_code(self):
+        return f"{self.sweep.strategy_group.upper()}:{self.sweep.name.upper()}_{self.sample}"
+
+    @property
+    def transformation_codes(self):
+        return [
+            self.sweep.get_transformation_code(self.sample, j)
+            for j in range(self.sweep.n_transformations)
+        ]
+
+    @property
+    def transformation_specification(self):
+        return '|'.join(self.transformation_codes)
+
+    def get_transformations(self):
+        """
+        Yield the transformations of the strategy, built one at a time.
+
+        Yields:
+            VirtualTransformation: The transformations of the strategy.
+        """
+        for j in range(self.sweep.n_transformations):
+            yield VirtualTransformation(self.sweep, self.sample, j)
+
+    def to_row(self):
+        """
+        Build the row of the strategy in the `strategy_definitions.csv` format.
+
+        Returns:
+            dict: The strategy row.
+        """
+        return {
+            'strategy_id': self.strategy_id,
+            'strategy_code': self.strategy_code,
+            'strategy': f"{self.sweep.name}_{self.sample}",
+            'description': self.sweep.get_description(self.sample),
+            'transformation_specification': self.transformation_specification,
+        }
+
+
+class MagnitudeSweep:
+    """
+    Sweep of the crosswalk scalars that `ExcelYAMLHandler.process_yaml_files` multiplies into
+    `parameters.magnitude`, without writing a YAML file or a strategy row per sample.
+
+    The sweep is a NumPy matrix of scalars with one row per sample (strategy) and one column per
+    transformation; the magnitudes are the scalars times the default magnitudes of the templates.
+    Strategies and transformations are handed out as `VirtualStrategy` and `VirtualTransformation`
+    objects that build their content on demand, and the sweep is saved as a small YAML record of its
+    definition from which the matrix is rebuilt.
+
+    Strategy IDs are allocated from the range of the strategy group in the strategy mapping (SWEEP:
+    100000-199999) through a `StrategyIDRegistry`. By default the registry is the session registry of
+    the `strategy_definitions.csv` of the templates directory (see `get_csv_registry`), so the IDs used
+    in the CSV and by the other sweeps of the session are skipped. Materialized strategies are added to
+    the CSV with `StrategyCSVHandler.add_strategy_rows`.
+
+    Samples that use the same scalar for a transformation share its code, `<code>_<NAME>_<level>`,
+    where the level is the index of the scalar among the distinct scalars of the transformation.
+
+    Example:
+        sweep = MagnitudeSweep.from_crosswalk(handler, name='sweep_a', strategy='strategy_NZ')
+        sweep.latin_hypercube(1000, bounds=(0.5, 1.5), seed=0)
+        strategies = sweep.get_strategy_definitions()
+        sweep.save('transformations/sweep_a.yaml')
+    """
+
+    def __init__(
+        self,
+        transformations,
+        base_magnitudes,
+        yaml_directory,
+        template_cache,
+        name='sweep',
+        strategy_group='SWEEP',
+        id_registry=None,
+    ):
+        """
+        Args:
+            transformations (pd.DataFrame): The crosswalk rows of the swept transformations, with the
+                columns 'transformation_code', 'transformation_yaml_name', 'transformation_name' and 'subsector'.
+            base_magnitudes (array-like): The default magnitude of each transformation's template.
+            yaml_directory (str): The directory of the YAML templates.
+            template_cache (YAMLTemplateCache): The cache of the parsed templates.
+            name (str, optional): The name of the sweep, used in the codes. Defaults to 'sweep'.
+            strategy_group (str, optional): The strategy group of the sweep strategies, a group of the
+                strategy mapping. Defaults to 'SWEEP'.
+            id_registry (StrategyIDRegistry, optional): The registry the strategy IDs are allocated from,
+                e.g. `StrategyCSVHandler.id_registry`. Defaults to the session registry of the
+                `strategy_definitions.csv` of `yaml_directory`.
+        """
+        self.transformations = transformations.reset_index(drop=True)
+        self.base_magnitudes = np.asarray(base_magnitudes, dtype=float)
+        self.yaml_directory = yaml_directory
+        self.template_cache = template_cache
+        self.name = name
+        self.strategy_group = strategy_group
+        if id_registry is None:
+            id_registry = get_csv_registry(os.path.join(yaml_directory, STRATEGY_DEFINITIONS_FILE))
+        self.id_registry = id_registry
+        # Raises ValueError if the group is not in the strategy mapping
+        self.id_registry.get_range(strategy_group)
+        self.strategy_ids = np.empty(0, dtype=int)
+        self.definition = None
+        self.scalars = np.empty((0, len(self.transformations)))
+        self._magnitudes = None
+        self._levels = None
+
+    @classmethod
+    def from_crosswalk(cls, handler, transformation_codes=None, strategy=None, **kwargs):
+        """
+        Build a sweep over the transformations of a crosswalk whose templates have a magnitude.
+
+        Args:
+            handler (ExcelYAMLHandler): The handler of the crosswalk.
+            transformation_codes (list, optional): The transformation codes to sweep. Defaults to all
+                the transformations with a magnitude.
+            strategy (str, optional): A strategy column; only the transformations used by the strategy
+                are swept.
+            **kwargs: Additional arguments passed to MagnitudeSweep.
+        Returns:
+            MagnitudeSweep: The sweep, without samples.
+        Raises:
+            ValueError: If no transformation can be swept.
+        """
+        data = handler.data
+        if data is None:
+            raise ValueError(f"No crosswalk data loaded from {handler.excel_file}.")
+        data = data[data['transformation_code'].notna()]
+        if strategy is not None:
+            data = data[data[strategy].notna()]
+        if transformation_codes is not None:
+            data = data[data['transformation_code'].isin(transformation_codes)]
+
+        rows = []
+        base_magnitudes = []
+        for idx, row in data.drop_duplicates('transformation_code').iterrows():
+            yaml_path = os.path.join(handler.yaml_directory, row['transformation_yaml_name'])
+            if not os.path.exists(yaml_path):
+                tracer.warning(f"YAML file {row['transformation_yaml_name']} not found in directory {handler.yaml_directory}.",
+                               event='yaml_not_found', yaml_name=row['transformation_yaml_name'])
+                continue
+            parameters = handler.template_cache.get(yaml_path, copy_content=False).get('parameters') or {}
+            if 'magnitude' not in parameters:
+                tracer.debug(f"YAML file {row['transformation_yaml_name']} is not swept because it does not have magnitude attribute",
+                             event='sweep_no_magnitude', yaml_name=row['transformation_yaml_name'])
+                continue
+            rows.append(idx)
+            base_magnitudes.append(float(parameters['magnitude']))
+
+        if not rows:
+            raise ValueError("No transformation with a magnitude parameter to sweep.")
+
+        columns = ['transformation_code', 'transformation_yaml_name', 'transformation_name', 'subsector']
+        return cls(data.loc[rows, columns], base_magnitudes, handler.yaml_directory, handler.template_cache, **kwargs)
+
+    @property
+    def n_samples(self):
+        return self.scalars.shape[0]
+
+    @property
+    def n_transformations(self):
+        return self.scalars.shape[1]
+
+    @property
+    def transformation_codes(self):
+        return self.transformations['transformation_code'].tolist()
+
+    @property
+    def magnitudes(self):
+        if self._magnitudes is None:
+            self._magnitudes = self.scalars * self.base_magnitudes
+        return self._magnitudes
+
+    def set_scalars(self, scalars, definition):
+        """
+        Set the sweep matrix.
+
+        Args:
+            scalars (np.ndarray): The scalars, one row per sample and one column per transformation.
+            definition (dict): The definition of the sweep, saved in the record.
+        Returns:
+            MagnitudeSweep: The sweep.
+        """
+        scalars = np.asarray(scalars, dtype=float)
+        if scalars.ndim != 2 or scalars.shape[1] != len(self.transformations):
+            raise ValueError(f"Expected a matrix with {len(self.transformations)} columns, got shape {scalars.shape}.")
+        self.allocate_strategy_ids(len(scalars))
+        self.scalars = scalars
+        self.definition = definition
+        self._magnitudes = None
+        self._levels = None
+        tracer.debug(f"Sweep {self.name}: {self.n_samples} samples of {self.n_transformations} transformations",
+                     event='sweep_built', name=self.name, method=definition['method'],
+                     n_samples=self.n_samples, n_transformations=self.n_transformations)
+        return self
+
+    def allocate_strategy_ids(self, n_samples):
+        """
+        Allocate strategy IDs from the registry until there is one per sample. IDs allocated for a
+        previous, larger matrix are kept for the first samples.
+
+        Args:
+            n_samples (int): The number of samples.
+        Raises:
+            ValueError: If the ID range of the strategy group is exhausted.
+        """
+        strategy_ids = list(self.strategy_ids)
+        while len(strategy_ids) < n_samples:
+            strategy_ids.append(self.id_registry.allocate(self.strategy_group))
+        self.strategy_ids = np.array(strategy_ids, dtype=int)
+
+    def get_levels_list(self, levels):
+        # One list of levels per transformation, from a shared list or a dictionary keyed by code
+        if isinstance(levels, dict):
+            missing = [code for code in self.transformation_codes if code not in levels]
+            if missing:
+                raise ValueError(f"No levels given for the transformations {missing}.")
+            return [list(map(float, levels[code])) for code in self.transformation_codes]
+        return [list(map(float, levels))] * len(self.transformations)
+
+    def grid(self, levels, max_samples=MAX_GRID_SAMPLES):
+        """
+        Sweep the full factorial grid of the given scalar levels.
+
+        Args:
+            levels (list or dict): The scalar levels shared by every transformation, or a dictionary
+                mapping each transformation code to its levels.
+            max_samples (int, optional): The largest number of samples the grid may have. Defaults to
+                `MAX_GRID_SAMPLES`.
+        Returns:
+            MagnitudeSweep: The sweep.
+        Raises:
+            ValueError: If the grid has more than `max_samples` samples.
+        """
+        levels_list = self.get_levels_list(levels)
+        # Check the size before building anything, the grid grows exponentially with the transformations
+        n_samples = 1
+        for values in levels_list:
+            n_samples *= len(values)
+        if n_samples > max_samples:
+            raise ValueError(f"The grid of {len(levels_list)} transformations has {n_samples} samples, more than "
+                             f"max_samples={max_samples}; use fewer levels or transformations, or latin_hypercube.")
+        mesh = np.meshgrid(*[np.asarray(values) for values in levels_list], indexing='ij')
+        scalars = np.stack([axis.ravel() for axis in mesh], axis=1)
+        return self.set_scalars(scalars, {'method': 'grid', 'levels': levels if isinstance(levels, dict) else list(map(float, levels))})
+
+    def get_bounds_array(self, bounds):
+        # (n_transformations x 2) array of bounds, from a shared pair or a dictionary keyed by code
+        if isinstance(bounds, dict):
+            missing = [code for code in self.transformation_codes if code not in bounds]
+            if missing:
+                raise ValueError(f"No bounds given for the transformations {missing}.")
+            return np.array([bounds[code] for code in self.transformation_codes], dtype=float)
+        return np.tile(np.asarray(bounds, dtype=float), (len(self.transformations), 1))
+
+    def latin_hypercube(self, n_samples, bounds=(0.0, 1.0), seed=None):
+        """
+        Sweep a Latin hypercube sample of the scalars: each transformation's range is split into
+        `n_samples` strata and every stratum is sampled exactly once.
+
+        Args:
+            n_samples (int): The number of samples.
+            bounds (tuple or dict, optional): The (min, max) scalar shared by every transformation, or a
+                dictionary mapping each transformation code to its bounds. Defaults to (0.0, 1.0).
+            seed (int, optional): The random seed. Without a seed, the scalars are saved with the record.
+        Returns:
+            MagnitudeSweep: The sweep.
+        """
+        rng = np.random.default_rng(seed)
+        n_transformations = len(self.transformations)
+        strata = rng.permuted(np.tile(np.arange(n_samples), (n_transformations, 1)), axis=1).T
+        unit = (strata + rng.random((n_samples, n_transformations))) / n_samples
+        bounds_array = self.get_bounds_array(bounds)
+        scalars = bounds_array[:, 0] + unit * (bounds_array[:, 1] - bounds_array[:, 0])
+        definition = {
+            'method': 'latin_hypercube',
+            'n_samples': int(n_samples),
+            'bounds': bounds if isinstance(bounds, dict) else [float(val) for val in bounds],
+            'seed': seed,
+        }
+        return self.set_scalars(scalars, definition)
+
+    def from_matrix(self, scalars):
+        """
+        Sweep an explicit matrix of scalars, e.g. from another sampler.
+
+        Args:
+            scalars (array-like): The scalars, one row per sample and one column per transformation.
+        Returns:
+            MagnitudeSweep: The sweep.
+        """
+        return self.set_scalars(scalars, {'method': 'matrix'})
+
+    def get_levels(self):
+        """
+        Index the distinct scalars of each transformation.
+
+        Returns:
+            list: One tuple (values, inverse) per transformation, where `values[inverse]` gives back the
+                scalars of the transformation's column.
+        """
+        if self._levels is None:
+            self._levels = [np.unique(self.scalars[:, j], return_inverse=True) for j in range(self.n_transformations)]
+        return self._levels
+
+    def get_level(self, sample, transformation):
+        return int(self.get_levels()[transformation][1][sample])
+
+    def get_transformation_code(self, sample, transformation):
+        code = self.transformations.at[transformation, 'transformation_code']
+        return f"{code}_{self.name.upper()}_{self.get_level(sample, transformation)}"
+
+    def get_description(self, sample):
+        return f"Sweep {self.name} ({self.definition['method']}) sample {sample}"
+
+    def __len__(self):
+        return self.n_samples
+
+    def __getitem__(self, sample):
+        if not -self.n_samples <= sample < self.n_samples:
+            raise IndexError(f"Sample {sample} out of range for a sweep of {self.n_samples} samples.")
+        return VirtualStrategy(self, sample % self.n_samples)
+
+    def __iter__(self):
+        for sample in range(self.n_samples):
+            yield VirtualStrategy(self, sample)
+
+    def get_transformation(self, transformation_code):
+        """
+        Retrieve a virtual transformation by its code.
+
+        Args:
+            transformation_code (str): The code, `<code>_<NAME>_<level>`.
+        Returns:
+            VirtualTransformation: The transformation.
+        Raises:
+            KeyError: If the code is not part of the sweep.
+        """
+        code, _, level = transformation_code.rpartition('_')
+        prefix = f"_{self.name.upper()}"
+        if code.endswith(prefix) and level.isdigit():
+            matches = np.flatnonzero(self.transformations['transformation_code'].to_numpy() == code[:-len(prefix)])
+            if len(matches) > 0:
+                j = int(matches[0])
+                samples = np.flatnonzero(self.get_levels()[j][1] == int(level))
+                if len(samples) > 0:
+                    return VirtualTransformation(self, int(samples[0]), j)
+        raise KeyError(transformation_code)
+
+    def get_transformation_table(self):
+        """
+        Build the table of the distinct transformations of the sweep.
+
+        Returns:
+            pd.DataFrame: One row per transformation code and level, with its scalar and magnitude.
+        """
+        frames = []
+        for j, (values, _) in enumerate(self.get_levels()):
+            code = self.transformations.at[j, 'transformation_code']
+            frames.append(pd.DataFrame({
+                'transformation_code': [f"{code}_{self.name.upper()}_{level}" for level in range(len(values))],
+                'base_transformation_code': code,
+                'scalar_val': values,
+                'magnitude': values * self.base_magnitudes[j],
+            }))
+        return pd.concat(frames, ignore_index=True)
+
+    def get_strategy_definitions(self):
+        """
+        Build the strategy rows of the sweep in the `strategy_definitions.csv` format, without writing them.
+
+        Returns:
+            pd.DataFrame: One row per sample.
+        """
+        # Codes of every (sample, transformation) cell, built per transformation from its levels
+        code_columns = [
+            np.array([f"{code}_{self.name.upper()}_{level}" for level in range(len(values))], dtype=object)[inverse]
+            for code, (values, inverse) in zip(self.transformation_codes, self.get_levels())
+        ]
+        samples = np.arange(self.n_samples)
+        return pd.DataFrame({
+            'strategy_id': self.strategy_ids[samples],
+            'strategy_code': [f"{self.strategy_group.upper()}:{self.name.upper()}_{sample}" for sample in samples],
+            'strategy': [f"{self.name}_{sample}" for sample in samples],
+            'description': [self.get_description(sample) for sample in samples],
+            'transformation_specification': ['|'.join(row) for row in zip(*code_columns)],
+        })
+
+    def materialize(self, samples, yaml_directory=None):
+        """
+        Write the YAML files of some samples, e.g. the ones selected for a full run.
+
+        Args:
+            samples (list): The samples to write.
+            yaml_directory (str, optional): The output directory. Defaults to the templates directory.
+        Returns:
+            pd.DataFrame: The strategy rows of the samples, see `get_strategy_definitions`, to be added to
+                the CSV with `StrategyCSVHandler.add_strategy_rows`.
+        """
+        yaml_directory = yaml_directory or self.yaml_directory
+        written = set()
+        with tracer.stage('materialize_sweep', n_samples=len(samples)):
+            for sample in samples:
+                for transformation in self[sample].get_transformations():
+                    yaml_name = transformation.get_yaml_name()
+                    if yaml_name in written:
+                        continue
+                    with open(os.path.join(yaml_directory, yaml_name), 'w') as file:
+                        file.write(yaml.dump(transformation.get_yaml_content(), Dumper=YAML_DUMPER))
+                    written.add(yaml_name)
+                    tracer.count('yaml_written')
+        return self.get_strategy_definitions().iloc[list(samples)]
+
+    def get_record(self):
+        """
+        Build the record of the sweep: its definition and the transformations it was built from.
+
+        Returns:
+            dict: The record.
+        """
+        if self.definition is None:
+            raise ValueError(f"Sweep {self.name} has no samples.")
+        return {
+            'version': SWEEP_RECORD_VERSION,
+            'name': self.name,
+            'strategy_group': self.strategy_group,
+            'strategy_ids': self.get_strategy_ids_record(),
+            'definition': dict(self.definition),
+            'transformations': [
+                {
+                    'transformation_code': row['transformation_code'],
+                    'transformation_yaml_name': row['transformation_yaml_name'],
+                    'base_magnitude': float(base_magnitude),
+                    'template_hash': self.template_cache.get_hash(os.path.join(self.yaml_directory, row['transformation_yaml_name'])),
+                }
+                for (_, row), base_magnitude in zip(self.transformations.iterrows(), self.base_magnitudes)
+            ],
+        }
+
+    def get_strategy_ids_record(self):
+        # Contiguous IDs are saved as a range, others as a list
+        strategy_ids = self.strategy_ids[:self.n_samples]
+        if len(strategy_ids) > 0 and np.array_equal(strategy_ids, np.arange(strategy_ids[0], strategy_ids[0] + len(strategy_ids))):
+            return {'start': int(strategy_ids[0]), 'stop': int(strategy_ids[-1]) + 1}
+        return [int(strategy_id) for strategy_id in strategy_ids]
+
+    def save(self, record_file):
+        """
+        Save the sweep record. Grid and seeded Latin hypercube sweeps are rebuilt from their definition;
+        the scalars of matrix sweeps and of Latin hypercube sweeps without a seed are saved next to the
+        record as `<record>.npy`.
+
+        Args:
+            record_file (str): The YAML file of the record.
+        """
+        record = self.get_record()
+        definition = record['definition']
+        if definition['method'] == 'matrix' or (definition['method'] == 'latin_hypercube' and definition.get('seed') is None):
+            matrix_file = f"{os.path.splitext(record_file)[0]}.npy"
+            np.save(matrix_file, self.scalars)
+            record['definition']['matrix_file'] = os.path.basename(matrix_file)
+        with open(record_file, 'w') as file:
+            yaml.safe_dump(record, file, sort_keys=False)
+
+    @classmethod
+    def load(cls, record_file, handler, id_registry=None):
+        """
+        Rebuild a sweep from its record, with the strategy IDs it was saved with.
+
+        Args:
+            record_file (str): The YAML file of the record.
+            handler (ExcelYAMLHandler): The handler of the crosswalk the sweep was built from.
+            id_registry (StrategyIDRegistry, optional): The registry where the strategy IDs of the sweep
+                are reserved. Defaults to the session registry of the `strategy_definitions.csv` of the
+                templates directory.
+        Returns:
+            MagnitudeSweep: The sweep.
+        Raises:
+            ValueError: If the record version is not supported.
+        """
+        with open(record_file, 'r') as file:
+            record = yaml.safe_load(file)
+        if record.get('version') != SWEEP_RECORD_VERSION:
+            raise ValueError(f"Unsupported sweep record version {record.get('version')} in {record_file}.")
+
+        codes = [entry['transformation_code'] for entry in record['transformations']]
+        sweep = cls.from_crosswalk(
+            handler,
+            transformation_codes=codes,
+            name=record['name'],
+            strategy_group=record['strategy_group'],
+            id_registry=id_registry,
+        )
+        # Keep the column order of the record
+        order = [sweep.transformation_codes.index(code) for code in codes if code in sweep.transformation_codes]
+        if len(order) != len(codes):
+            missing = sorted(set(codes) - set(sweep.transformation_codes))
+            raise ValueError(f"Transformations {missing} of sweep {record['name']} are no longer in the crosswalk.")
+        sweep.transformations = sweep.transformations.iloc[order].reset_index(drop=True)
+        sweep.base_magnitudes = sweep.base_magnitudes[order]
+
+        for entry in record['transformations']:
+            yaml_path = os.path.join(sweep.yaml_directory, entry['transformation_yaml_name'])
+            if sweep.template_cache.get_hash(yaml_path) != entry['template_hash']:
+                tracer.warning(f"YAML file {entry['transformation_yaml_name']} changed since sweep {record['name']} was saved.",
+                               event='sweep_template_changed', yaml_name=entry['transformation_yaml_name'])
+
+        strategy_ids = record['strategy_ids']
+        if isinstance(strategy_ids, dict):
+            strategy_ids = range(strategy_ids['start'], strategy_ids['stop'])
+        for strategy_id in strategy_ids:
+            sweep.id_registry.reserve(strategy_id)
+        sweep.strategy_ids = np.array(strategy_ids, dtype=int)
+
+        definition = record['definition']
+        if 'matrix_file' in definition:
+            matrix_file = os.path.join(os.path.dirname(record_file), definition['matrix_file'])
+            sweep.set_scalars(np.load(matrix_file), definition)
+        elif definition['method'] == 'grid':
+            sweep.grid(definition['levels'])
+        else:
+            sweep.latin_hypercube(definition['n_samples'], definition['bounds'], definition['seed'])
+        return sweep
@@ -0,0 +1,311 @@
+import contextlib
+import cProfile
+import functools
+import json
+import logging
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import Counter
+from datetime import datetime
+
+
+LOGGER_NAME = 'ssp_utils'
+# Keys set by the tracer on every event, which the fields of an event can't override
+RESERVED_FIELDS = ('time', 'event', 'level', 'run_id', 'stage', 'message')
+
+
+class StdoutHandler(logging.StreamHandler):
+    """
+    Logging handler that writes to the current `sys.stdout`, so that messages show up exactly where
+    `print` output would, including in notebooks and under `contextlib.redirect_stdout`.
+    """
+
+    def __init__(self):
+        super().__init__(sys.stdout)
+
+    @property
+    def stream(self):
+        return sys.stdout
+
+    @stream.setter
+    def stream(self, value):
+        pass
+
+
+class Tracer:
+    """
+    Structured instrumentation for the utils classes.
+
+    Every message is sent to the standard logging module (logger `ssp_utils`) and, as a structured
+    event, to the configured JSON-lines files. On top of messages, the tracer keeps:
+
+    - Stage timers: `with tracer.stage('name'):` times a block; nested stages are reported with
+      their full path, e.g. `process_yaml_files/write`.
+    - Counters: `tracer.count('yaml_written')`, e.g. YAMLs read, parsed, written, skipped and failed.
+    - Captures: `with tracer.capture('name', jsonl_file=..., profile=True, trace_memory=True):`
+      collects the counters and stage times of a single call, optionally with cProfile and
+      tracemalloc, and emits them as a `run_end` event.
+
+    By default messages at INFO level and above are written to stdout without decoration, so the
+    output of the notebooks is unchanged. Stage and counter events are at DEBUG level.
+    """
+
+    def __init__(self, logger_name=LOGGER_NAME, jsonl_file=None):
+        """
+        Args:
+            logger_name (str, optional): The name of the logger. Defaults to 'ssp_utils'.
+            jsonl_file (str, optional): A JSON-lines file where every event is appended.
+        """
+        self.logger = logging.getLogger(logger_name)
+        if not self.logger.handlers:
+            handler = StdoutHandler()
+            handler.setFormatter(logging.Formatter('%(message)s'))
+            handler.setLevel(logging.INFO)
+            self.logger.addHandler(handler)
+            self.logger.setLevel(logging.DEBUG)
+            self.logger.propagate = False
+
+        self.jsonl_file = jsonl_file
+        self.counters = Counter()
+        self._lock = threading.Lock()
+        self._runs = []
+        self._local = threading.local()
+
+    def configure(self, jsonl_file=None, level=None):
+        """
+        Configure the tracer.
+
+        Args:
+            jsonl_file (str, optional): A JSON-lines file where every event is appended. None keeps the
+                current file.
+            level (int or str, optional): The level of the messages written to stdout, e.g. 'DEBUG' to
+                also see stage timings.
+        """
+        if jsonl_file is not None:
+            self.jsonl_file = jsonl_file
+        if level is not None:
+            for handler in self.logger.handlers:
+                if isinstance(handler, StdoutHandler):
+                    handler.setLevel(level)
+
+    def get_stage_path(self):
+        return '/'.join(getattr(self._local, 'stages', []))
+
+    def write_jsonl(self, record, runs):
+        files = [self.jsonl_file] + [run['jsonl_file'] for run in runs]
+        files = [file for file in dict.fromkeys(files) if file is not None]
+        if not files:
+            return
+
+        line = json.dumps(record, default=str) + '\n'
+        with self._lock:
+            for file in files:
+                with open(file, 'a') as jsonl:
+                    jsonl.write(line)
+
+    def emit(self, event, message=None, level=logging.DEBUG, **fields):
+        """
+        Emit a structured event.
+
+        Args:
+            event (str): The event name, e.g. 'yaml_not_found'.
+            message (str, optional): The human-readable message. Defaults to the event name and fields.
+            level (int, optional): The logging level. Defaults to DEBUG.
+            **fields: The fields of the event; they can't be named like the keys of `RESERVED_FIELDS`.
+        Raises:
+            ValueError: If a field is named like a reserved key.
+        """
+        reserved = [field for field in RESERVED_FIELDS if field in fields]
+        if reserved:
+            raise ValueError(f"Fields {reserved} of event {event} are reserved by the tracer.")
+        if level >= logging.ERROR:
+            self.count('errors')
+
+        # Captures may start or end in other threads while the event is written
+        with self._lock:
+            runs = list(self._runs)
+        record = {
+            'time': datetime.now().isoformat(timespec='microseconds'),
+            'event': event,
+            'level': logging.getLevelName(level),
+            'run_id': runs[-1]['id'] if runs else None,
+            'stage': self.get_stage_path() or None,
+            **fields,
+        }
+        if message is not None:
+            record['message'] = message
+        self.write_jsonl(record, runs)
+
+        if self.logger.isEnabledFor(level):
+            if message is None:
+                message = f"{event} {json.dumps(fields, default=str)}"
+            self.logger.log(level, message, extra={'event': event, 'fields': fields})
+
+    def debug(self, message, event='message', **fields):
+        self.emit(event, message, logging.DEBUG, **fields)
+
+    def info(self, message, event='message', **fields):
+        self.emit(event, message, logging.INFO, **fields)
+
+    def warning(self, message, event='warning', **fields):
+        self.emit(event, message, logging.WARNING, **fields)
+
+    def error(self, message, event='error', **fields):
+        self.emit(event, message, logging.ERROR, **fields)
+
+    def count(self, name, n=1):
+        """
+        Increment a counter, globally and in the active captures.
+
+        Args:
+            name (str): The counter name, e.g. 'yaml_written'.
+            n (int, optional): The increment. Defaults to 1.
+        """
+        with self._lock:
+            self.counters[name] += n
+            for run in self._runs:
+                run['counters'][name] += n
+
+    @contextlib.contextmanager
+    def stage(self, name, **fields):
+        """
+        Time a block of code as a stage and emit a 'stage' event when it ends.
+
+        Args:
+            name (str): The stage name.
+            **fields: Additional fields of the event.
+        """
+        stages = getattr(self._local, 'stages', None)
+        if stages is None:
+            stages = self._local.stages = []
+        stages.append(name)
+        path = self.get_stage_path()
+        status = 'ok'
+        t0 = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            status = 'failed'
+            raise
+        finally:
+            duration = time.perf_counter() - t0
+            with self._lock:
+                for run in self._runs:
+                    run['stages'][path] = run['stages'].get(path, 0.0) + duration
+            self.emit('stage', f"Stage {path} {status} in {duration:.3f} s", logging.DEBUG,
+                      name=path, status=status, duration_s=duration, **fields)
+            stages.pop()
+
+    def traced(self, name=None):
+        """
+        Decorator that runs a function as a stage.
+
+        Args:
+            name (str, optional): The stage name. Defaults to the function's qualified name.
+        """
+        def decorator(func):
+            stage_name = name or func.__qualname__
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.stage(stage_name):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    @contextlib.contextmanager
+    def capture(self, name='run', jsonl_file=None, profile=False, trace_memory=False, profile_file=None, top=20):
+        """
+        Capture the counters and stage times of a block of code, e.g. a single call to
+        `process_yaml_files`, optionally with cProfile and tracemalloc.
+
+        Args:
+            name (str, optional): The name of the capture. Defaults to 'run'.
+            jsonl_file (str, optional): A JSON-lines file where the events of the capture are appended.
+            profile (bool, optional): Whether to profile the block with cProfile. Defaults to False.
+            trace_memory (bool, optional): Whether to measure the peak memory with tracemalloc. Defaults to False.
+            profile_file (str, optional): A file where the cProfile stats are dumped, to be opened with pstats.
+            top (int, optional): The number of functions by cumulative time included in the summary.
+                Defaults to 20.
+        Yields:
+            dict: The capture; its 'summary' (duration, counters, stages, peak memory and profile) is set
+                when the block ends.
+        """
+        run = {
+            'id': uuid.uuid4().hex[:12],
+            'name': name,
+            'jsonl_file': jsonl_file,
+            'counters': Counter(),
+            'stages': {},
+            'summary': None,
+        }
+        with self._lock:
+            self._runs.append(run)
+        self.emit('run_start', level=logging.DEBUG, name=name)
+
+        profiler = cProfile.Profile() if profile else None
+        started_tracemalloc = trace_memory and not tracemalloc.is_tracing()
+        if started_tracemalloc:
+            tracemalloc.start()
+        elif trace_memory:
+            tracemalloc.reset_peak()
+        if profiler is not None:
+            profiler.enable()
+
+        t0 = time.perf_counter()
+        try:
+            yield run
+        finally:
+            duration = time.perf_counter() - t0
+            if profiler is not None:
+                profiler.disable()
+            peak_mb = None
+            if trace_memory:
+                peak_mb = tracemalloc.get_traced_memory()[1] / 1e6
+                if started_tracemalloc:
+                    tracemalloc.stop()
+
+            run['summary'] = {
+                'duration_s': duration,
+                'counters': dict(run['counters']),
+                'stages': dict(run['stages']),
+                'peak_memory_mb': peak_mb,
+                'profile': self.get_profile_summary(profiler, top) if profiler is not None else None,
+            }
+            if profiler is not None and profile_file is not None:
+                profiler.dump_stats(profile_file)
+
+            self.emit('run_end', f"Run {name} finished in {duration:.3f} s", logging.DEBUG, name=name, **run['summary'])
+            with self._lock:
+                self._runs.remove(run)
+
+    def get_profile_summary(self, profiler, top=20):
+        """
+        Summarize cProfile stats as the functions with the highest cumulative time.
+
+        Args:
+            profiler (cProfile.Profile): The profiler.
+            top (int, optional): The number of functions. Defaults to 20.
+        Returns:
+            list: One dictionary per function with its name, number of calls, own time and cumulative time.
+        """
+        stats = pstats.Stats(profiler).stats
+        rows = [
+            {
+                'function': f"{file_name}:{line}({function})",
+                'ncalls': n_calls,
+                'tottime_s': tottime,
+                'cumtime_s': cumtime,
+            }
+            for (file_name, line, function), (_, n_calls, tottime, cumtime, _) in stats.items()
+        ]
+        rows.sort(key=lambda row: row['cumtime_s'], reverse=True)
+        return rows[:top]
+
+
+# Tracer shared by all the utils classes
+tracer = Tracer()
@@ -1,13 +1,344 @@
+import copy
+import hashlib
+import json
 import os
+from concurrent.futures import ThreadPoolExecutor
+
 import pandas as pd
 import yaml
 
+from CacheUtils import FileLock, workbook_cache
+from TraceUtils import tracer
+
+# The libyaml loader builds exactly the same objects as yaml.SafeLoader, so use it when available.
+YAML_LOADER = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+# The libyaml emitter wraps long double-quoted scalars differently from the pure-Python one,
+# so strategy YAMLs keep being written with yaml.Dumper to stay byte-for-byte stable.
+YAML_DUMPER = yaml.Dumper
+# Bump when the strategy YAML generation logic changes so that existing manifests are invalidated.
+MANIFEST_VERSION = 1
+# Marks the file names of the strategy YAMLs shared by several strategies, see `ExcelYAMLHandler.get_shared_suffix`
+SHARED_YAML_MARKER = '_shared_'
+
+
+def get_file_hash(file_path):
+    """
+    Compute the SHA-256 hash of a file's content.
+
+    Args:
+        file_path (str): The path to the file.
+    Returns:
+        str: The hex digest of the file content.
+    """
+    with open(file_path, 'rb') as file:
+        return hashlib.sha256(file.read()).hexdigest()
+
+
+class YAMLTemplateCache:
+    """
+    In-memory cache of parsed transformation YAML templates.
+
+    Each template is parsed once and served as a deep copy, so callers can modify the
+    returned content freely. An entry is revalidated when the file's mtime or size changes,
+    and only re-parsed if the content hash changed as well.
+    """
+
+    def __init__(self):
+        self._entries = {}
+
+    def get(self, yaml_path, copy_content=True):
+        """
+        Return a deep copy of the parsed content of a YAML template.
+
+        Args:
+            yaml_path (str): The path to the YAML file.
+            copy_content (bool, optional): Whether to return a deep copy. Set to False only to read the
+                content without modifying it. Defaults to True.
+        Returns:
+            dict: The parsed YAML content.
+        """
+        stat = os.stat(yaml_path)
+        stat_key = (stat.st_mtime_ns, stat.st_size)
+        entry = self._entries.get(yaml_path)
+
+        if entry is None or entry['stat'] != stat_key:
+            with open(yaml_path, 'rb') as file:
+                raw = file.read()
+            tracer.count('yaml_read')
+            digest = hashlib.sha256(raw).hexdigest()
+
+            # Only parse again if the content actually changed
+            if entry is None or entry['hash'] != digest:
+                entry = {'hash': digest, 'content': yaml.load(raw, Loader=YAML_LOADER)}
+                tracer.count('yaml_parsed')
+            entry['stat'] = stat_key
+            self._entries[yaml_path] = entry
+
+        return copy.deepcopy(entry['content']) if copy_content else entry['content']
+
+    def get_hash(self, yaml_path):
+        """
+        Return the content hash of a YAML template, parsing it if it is not cached yet.
+
+        Args:
+            yaml_path (str): The path to the YAML file.
+        Returns:
+            str: The SHA-256 hex digest of the template content.
+        """
+        self.get(yaml_path)
+        return self._entries[yaml_path]['hash']
+
+    def clear(self):
+        """
+        Remove all cached templates.
+        """
+        self._entries.clear()
+
+
+class TransformationDirectoryIndex:
+    """
+    Index of the transformation codes of the YAML files in a transformations directory.
+
+    The index maps a strategy suffix to its YAML files and each YAML file to its
+    transformation code. Every lookup lists the directory once and checks the mtime and
+    size of the files it reads; only YAML files that are new or changed since they were
+    indexed are parsed again, so files rewritten in place are picked up by the next lookup.
+    YAML files without a transformation code (e.g. `config_general.yaml`) are ignored.
+    """
+
+    def __init__(self, yaml_dir_path):
+        self.yaml_dir_path = yaml_dir_path
+        # File name -> (stat key, transformation code)
+        self._codes = {}
+        # Suffix -> list of matching YAML file names, valid for the current directory listing
+        self._suffix_files = {}
+        self._file_names = None
+        # File name -> position in the current directory listing
+        self._positions = {}
+
+    def refresh(self):
+        """
+        List the directory and drop the entries of files that were removed.
+
+        Returns:
+            list: The YAML file names, in directory listing order.
+        """
+        with os.scandir(self.yaml_dir_path) as entries:
+            file_names = [entry.name for entry in entries if entry.name.endswith('.yaml') and entry.is_file()]
+
+        if file_names != self._file_names:
+            self._file_names = file_names
+            self._positions = {file_name: position for position, file_name in enumerate(file_names)}
+            self._suffix_files = {}
+            self._codes = {file_name: value for file_name, value in self._codes.items() if file_name in self._positions}
+        return self._file_names
+
+    def get_file_names(self, yaml_file_suffix):
+        # YAML files ending with the suffix, cached until the directory listing changes
+        file_names = self._suffix_files.get(yaml_file_suffix)
+        if file_names is None:
+            file_names = [file for file in self._file_names if file.endswith(f'{yaml_file_suffix}.yaml')]
+            self._suffix_files[yaml_file_suffix] = file_names
+        return file_names
+
+    def get_file_names_matching(self, marker):
+        # YAML files whose name contains the marker, cached with the suffix lists
+        key = ('marker', marker)
+        file_names = self._suffix_files.get(key)
+        if file_names is None:
+            file_names = [file for file in self._file_names if marker in file]
+            self._suffix_files[key] = file_names
+        return file_names
+
+    def get_code(self, yaml_file):
+        # Transformation code of a listed YAML file, parsed again only if its mtime or size changed
+        yaml_path = os.path.join(self.yaml_dir_path, yaml_file)
+        stat = os.stat(yaml_path)
+        stat_key = (stat.st_mtime_ns, stat.st_size)
+        value = self._codes.get(yaml_file)
+        if value is None or value[0] != stat_key:
+            with open(yaml_path, 'rb') as file:
+                yaml_content = yaml.load(file, Loader=YAML_LOADER)
+            tracer.count('yaml_read')
+            tracer.count('yaml_parsed')
+            identifiers = yaml_content.get('identifiers') if isinstance(yaml_content, dict) else None
+            transformation_code = identifiers.get('transformation_code') if isinstance(identifiers, dict) else None
+            value = self._codes[yaml_file] = (stat_key, transformation_code)
+        return value[1]
+
+    def get_transformation_codes(self, yaml_file_suffix=''):
+        """
+        Retrieve the transformation codes of the YAML files that end with the given suffix.
+
+        Args:
+            yaml_file_suffix (str, optional): The suffix of the YAML files to search for. Defaults to
+                all the YAML files.
+        Returns:
+            list: The transformation codes, in directory listing order.
+        """
+        self.refresh()
+        transformation_codes = []
+        for yaml_file in self.get_file_names(yaml_file_suffix):
+            transformation_code = self.get_code(yaml_file)
+            if transformation_code is not None:
+                transformation_codes.append(transformation_code)
+        return transformation_codes
+
+    def get_strategy_transformation_codes(self, yaml_file_suffix, strategy_codes):
+        """
+        Retrieve the transformation codes of a strategy: the codes of its own YAML files, the ones that
+        end with its suffix, and of the shared YAML files (`*_shared_*.yaml`, see
+        `ExcelYAMLHandler.get_shared_suffix`) whose code is one of the strategy's codes. Only these
+        files are read, never the whole directory.
+
+        Args:
+            yaml_file_suffix (str): The suffix of the strategy's own YAML files.
+            strategy_codes (set): The transformation codes used by the strategy.
+        Returns:
+            list: The transformation codes of the strategy, in directory listing order.
+        """
+        self.refresh()
+        yaml_files = set(self.get_file_names(yaml_file_suffix))
+
+        # Reverse map of the shared YAML files, from their code to their file name
+        shared_code_files = {}
+        for yaml_file in self.get_file_names_matching(SHARED_YAML_MARKER):
+            transformation_code = self.get_code(yaml_file)
+            if transformation_code is not None:
+                shared_code_files[transformation_code] = yaml_file
+        yaml_files.update(shared_code_files[code] for code in strategy_codes if code in shared_code_files)
+
+        transformation_codes = []
+        for yaml_file in sorted(yaml_files, key=self._positions.get):
+            transformation_code = self.get_code(yaml_file)
+            if transformation_code in strategy_codes:
+                transformation_codes.append(transformation_code)
+        return transformation_codes
+
+    def get_code_files(self):
+        """
+        Map the transformation code of every YAML file in the directory to its file name.
+
+        Returns:
+            dict: A dictionary mapping each transformation code to its YAML file name.
+        """
+        self.get_transformation_codes()
+        return {
+            value[1]: yaml_file for yaml_file, value in self._codes.items()
+            if value[1] is not None and yaml_file in self._positions
+        }
+
+
+class StrategyIDRegistry:
+    """
+    Registry of the strategy IDs in use, indexed by the ID ranges of the strategy groups.
+
+    Strategy groups that share a range in the strategy mapping (e.g. AGRC, LNDU and LSMM all use
+    1000-1999) share the occupied IDs of that range, so an ID can't be handed out twice across
+    groups. Each range keeps a pointer to its lowest candidate free ID, which makes finding the
+    next free ID, including gaps, amortized O(1).
+    """
+
+    def __init__(self, mapping, strategy_ids=()):
+        self.group_ranges = {}
+        for strategy_group, id_range in mapping.items():
+            min_id, max_id = map(int, str(id_range).split('-'))
+            self.group_ranges[strategy_group] = (min_id, max_id)
+
+        # Occupied IDs and lowest candidate free ID of each distinct range
+        self._occupied = {id_range: set() for id_range in set(self.group_ranges.values())}
+        self._next_free = {id_range: id_range[0] for id_range in self._occupied}
+
+        for strategy_id in strategy_ids:
+            self.reserve(strategy_id)
+
+    def get_range(self, strategy_group):
+        """
+        Retrieve the ID range of a strategy group.
+
+        Args:
+            strategy_group (str): The strategy group.
+        Returns:
+            tuple: The minimum and maximum IDs of the range.
+        Raises:
+            ValueError: If the strategy group is unknown.
+        """
+        if strategy_group not in self.group_ranges:
+            raise ValueError(f"Unknown strategy group: {strategy_group}")
+        return self.group_ranges[strategy_group]
+
+    def reserve(self, strategy_id):
+        """
+        Mark a strategy ID as occupied in every range that contains it.
+
+        Args:
+            strategy_id (int): The strategy ID.
+        """
+        strategy_id = int(strategy_id)
+        for (min_id, max_id), occupied in self._occupied.items():
+            if min_id <= strategy_id <= max_id:
+                occupied.add(strategy_id)
+
+    def is_reserved(self, strategy_id):
+        """
+        Check whether a strategy ID is occupied.
+
+        Args:
+            strategy_id (int): The strategy ID.
+        Returns:
+            bool: True if the ID is occupied in any range.
+        """
+        return any(int(strategy_id) in occupied for occupied in self._occupied.values())
+
+    def next_id(self, strategy_group):
+        """
+        Retrieve the lowest free ID in the range of a strategy group, without reserving it.
+
+        Args:
+            strategy_group (str): The strategy group.
+        Returns:
+            int: The next free strategy ID.
+        Raises:
+            ValueError: If the strategy group is unknown or its ID range is exhausted.
+        """
+        id_range = self.get_range(strategy_group)
+        occupied = self._occupied[id_range]
+
+        # Every ID below the pointer is occupied, so the pointer only moves forward
+        candidate = self._next_free[id_range]
+        while candidate in occupied:
+            candidate += 1
+        self._next_free[id_range] = candidate
+
+        if candidate > id_range[1]:
+            raise ValueError(f"Exceeded ID range for {strategy_group}")
+        return candidate
+
+    def allocate(self, strategy_group):
+        """
+        Reserve and return the lowest free ID in the range of a strategy group.
+
+        Args:
+            strategy_group (str): The strategy group.
+        Returns:
+            int: The allocated strategy ID.
+        Raises:
+            ValueError: If the strategy group is unknown or its ID range is exhausted.
+        """
+        strategy_id = self.next_id(strategy_group)
+        self._occupied[self.get_range(strategy_group)].add(strategy_id)
+        return strategy_id
+
 
 class ExcelYAMLHandler:
-    def __init__(self, excel_file, yaml_directory, sheet_name='yaml'):
+    def __init__(self, excel_file, yaml_directory, sheet_name='yaml', manifest_file=None, use_workbook_cache=True, deduplicate=False):
         self.excel_file = excel_file
         self.sheet_name = sheet_name
         self.yaml_directory = yaml_directory
+        self.use_workbook_cache = use_workbook_cache
+        self.deduplicate = deduplicate
+        self.manifest_file = manifest_file if manifest_file is not None else self.get_default_manifest_file()
+        self.template_cache = YAMLTemplateCache()
         self.data = self.load_excel_data()
     
     def load_excel_data(self):
@@ -16,7 +347,9 @@ class ExcelYAMLHandler:
 
         This method attempts to read an Excel file specified by the instance's
         `excel_file` attribute and load the data from the sheet specified by the
-        `sheet_name` attribute into a pandas DataFrame.
+        `sheet_name` attribute into a pandas DataFrame. Unless `use_workbook_cache`
+        is False, the sheet is served from the shared workbook sidecar cache, so the
+        workbook is only parsed again after it changes.
 
         Returns:
             pd.DataFrame: A DataFrame containing the data from the specified Excel sheet.
@@ -28,12 +361,102 @@ class ExcelYAMLHandler:
         """
         # Load the Excel sheet into a DataFrame
         try:
-            df = pd.read_excel(self.excel_file, sheet_name=self.sheet_name)
+            with tracer.stage('load_excel_data', excel_file=str(self.excel_file), sheet_name=self.sheet_name):
+                if self.use_workbook_cache:
+                    df = workbook_cache.read_excel(self.excel_file, sheet_name=self.sheet_name)
+                else:
+                    df = pd.read_excel(self.excel_file, sheet_name=self.sheet_name)
             return df
         except Exception as e:
-            print(f"Error loading Excel file: {e}")
+            tracer.error(f"Error loading Excel file: {e}", event='excel_load_failed',
+                         excel_file=str(self.excel_file), sheet_name=self.sheet_name, error=repr(e))
             return None
     
+    def get_default_manifest_file(self):
+        """
+        Build the default path of the strategy YAML manifest.
+
+        The manifest is stored next to the YAML directory, e.g. `transformations_manifest.json`
+        for a `transformations` directory, so it is never picked up as a transformation file.
+
+        Returns:
+            str: The path to the manifest file.
+        """
+        yaml_directory = os.path.normpath(os.path.abspath(self.yaml_directory))
+        return os.path.join(os.path.dirname(yaml_directory), f"{os.path.basename(yaml_directory)}_manifest.json")
+
+    def load_manifest(self):
+        """
+        Load the strategy YAML manifest.
+
+        The manifest maps each generated YAML file name to the hash of the inputs it was built from
+        and the hash of the file that was written. A missing, unreadable or outdated manifest is
+        treated as empty, which makes every strategy YAML be regenerated.
+
+        Returns:
+            dict: The manifest entries keyed by generated YAML file name.
+        """
+        try:
+            with open(self.manifest_file, 'r') as file:
+                manifest = json.load(file)
+        except FileNotFoundError:
+            return {}
+        except Exception as e:
+            tracer.error(f"Error loading manifest file: {e}", event='manifest_load_failed',
+                         manifest_file=self.manifest_file, error=repr(e))
+            return {}
+
+        if manifest.get('version') != MANIFEST_VERSION:
+            return {}
+        return manifest.get('outputs', {})
+
+    def save_manifest(self, outputs):
+        """
+        Atomically write the strategy YAML manifest.
+
+        Args:
+            outputs (dict): The manifest entries keyed by generated YAML file name.
+
+        Returns:
+            None
+        """
+        manifest = {'version': MANIFEST_VERSION, 'outputs': outputs}
+        tmp_file = f"{self.manifest_file}.tmp"
+        try:
+            with open(tmp_file, 'w') as file:
+                json.dump(manifest, file, indent=2, sort_keys=True)
+            os.replace(tmp_file, self.manifest_file)
+        except Exception as e:
+            tracer.error(f"Error saving manifest file: {e}", event='manifest_save_failed',
+                         manifest_file=self.manifest_file, error=repr(e))
+
+    def get_input_hash(self, yaml_path, yaml_name, column, transformation_code, subsector, transformation_name, scalar_val):
+        """
+        Hash every input that a generated strategy YAML depends on.
+
+        Args:
+            yaml_path (str): The path to the YAML template.
+            yaml_name (str): The original name of the YAML file.
+            column (str): The strategy column, or the comma-separated strategy columns that share the YAML.
+            transformation_code (str): The transformation code of the crosswalk row.
+            subsector (str): The subsector of the crosswalk row.
+            transformation_name (str): The transformation name of the crosswalk row.
+            scalar_val (float): The scalar value of the strategy column(s).
+
+        Returns:
+            str: The SHA-256 hex digest of the inputs.
+        """
+        inputs = [
+            yaml_name,
+            column,
+            str(transformation_code),
+            str(subsector),
+            str(transformation_name),
+            str(scalar_val),
+            self.template_cache.get_hash(yaml_path),
+        ]
+        return hashlib.sha256(json.dumps(inputs).encode('utf-8')).hexdigest()
+
     def get_strategy_cols(self):
         """
         Retrieve column names that start with 'strategy'.
@@ -47,7 +470,182 @@ class ExcelYAMLHandler:
        
         # return only strategy cols
         return [col for col in col_names if col.startswith('strategy')]
+
+    def get_payload_key(self, yaml_path, column, scalar_val):
+        """
+        Build a key that identifies the parameters a strategy column gives to a transformation.
+        Strategy columns with the same key produce the same YAML apart from their identifiers.
+
+        Args:
+            yaml_path (str): The path to the YAML template.
+            column (str): The strategy column.
+            scalar_val (float): The scalar value of the strategy column.
+
+        Returns:
+            tuple: The payload key.
+        """
+        try:
+            if not os.path.exists(yaml_path):
+                return ('scalar', float(scalar_val))
+            yaml_content = self.template_cache.get(yaml_path, copy_content=False)
+            parameters = yaml_content.get('parameters') if isinstance(yaml_content, dict) else None
+            if isinstance(parameters, dict) and 'magnitude' in parameters:
+                return ('magnitude', float(scalar_val) * float(parameters['magnitude']))
+            # Templates without a magnitude are written with their default values
+            return ('default',)
+        except Exception:
+            # Leave the column on its own, errors are reported when its YAML is generated
+            return ('column', column)
+
+    def get_strategy_groups(self, row, strategy_cols):
+        """
+        Group the strategy columns used by a crosswalk row by the parameters they give to its transformation.
+
+        Every group is written as a single strategy YAML. A column with a unique payload keeps its own
+        YAML (`<template>_<column>.yaml`, code `<code>_<COLUMN>`); columns that share a payload are written
+        once under the names of their strategies, e.g. `<template>_shared_WAM_WEM.yaml` with code
+        `<code>_SHARED_WAM_WEM` (see `get_shared_suffix`). Without deduplication every column is its own group.
+
+        Args:
+            row (pd.Series): The crosswalk row.
+            strategy_cols (list): The strategy columns.
+
+        Returns:
+            list: One dictionary per group with its file 'suffix', its 'columns' and its 'scalar_val'.
+        """
+        yaml_path = os.path.join(self.yaml_directory, row['transformation_yaml_name'])
+        columns = [column for column in strategy_cols if not pd.isna(row[column])]
+
+        grouped = {}
+        for column in columns:
+            key = self.get_payload_key(yaml_path, column, row[column]) if self.deduplicate else ('column', column)
+            grouped.setdefault(key, []).append(column)
+
+        groups = []
+        for key, group_columns in grouped.items():
+            if len(group_columns) == 1:
+                suffix = group_columns[0]
+                scalar_val = row[suffix]
+            else:
+                suffix = self.get_shared_suffix(group_columns)
+                scalar_vals = list(dict.fromkeys(row[column] for column in group_columns))
+                scalar_val = scalar_vals[0] if len(scalar_vals) == 1 else ', '.join(str(val) for val in scalar_vals)
+            groups.append({'suffix': suffix, 'columns': group_columns, 'scalar_val': scalar_val})
+        return groups
     
+    def get_shared_suffix(self, columns, max_length=64):
+        """
+        Build the file suffix of a YAML shared by several strategy columns from the names of the strategies,
+        e.g. `shared_WAM_WEM` for 'strategy_WAM' and 'strategy_WEM'. Suffixes longer than `max_length`
+        name the first strategy and the number of others, e.g. `shared_NZ_and_11_others`.
+
+        Args:
+            columns (list): The strategy columns of the group, in crosswalk order.
+            max_length (int, optional): The maximum length of the suffix. Defaults to 64.
+
+        Returns:
+            str: The suffix.
+        """
+        names = [column[len('strategy_'):] if column.startswith('strategy_') else column for column in columns]
+        suffix = f"shared_{'_'.join(names)}"
+        if len(suffix) > max_length:
+            suffix = f"shared_{names[0]}_and_{len(names) - 1}_others"
+        return suffix
+
+    def build_strategy_yaml(self, yaml_content, yaml_name, column, transformation_code, subsector, transformation_name, scalar_val, columns=None):
+        """
+        Update the identifiers of the given YAML content for a strategy and build its new file path.
+
+        Args:
+            yaml_content (dict): The content to be saved in the YAML file.
+            yaml_name (str): The original name of the YAML file.
+            column (str): The column name (or shared suffix) to be included in the transformation code and new file name.
+            transformation_code (str): The transformation code to be included in the identifiers.
+            subsector (str): The subsector to be included in the transformation name.
+            transformation_name (str): The transformation name to be included in the identifiers.
+            scalar_val (float): The scalar value to be included in the transformation name.
+            columns (list, optional): The strategy columns sharing the YAML; more than one is listed in
+                the transformation name.
+
+        Returns:
+            tuple: The path of the new YAML file and the updated YAML content.
+        """
+        yaml_content['identifiers']['transformation_code'] = f'{transformation_code}_{column.upper()}'
+        yaml_content['identifiers']['transformation_name'] = f'Scaled Default Max Parameters by {scalar_val} - {subsector}: {transformation_name}' # TODO Change this format
+        if columns is not None and len(columns) > 1:
+            strategies = ', '.join(col[len('strategy_'):] if col.startswith('strategy_') else col for col in columns)
+            yaml_content['identifiers']['transformation_name'] += f' (shared by {strategies})'
+        new_yaml_path = os.path.join(self.yaml_directory, self.get_strategy_yaml_name(yaml_name, column))
+        return new_yaml_path, yaml_content
+
+    def get_strategy_yaml_name(self, yaml_name, column):
+        """
+        Build the file name of the YAML generated from a template for a strategy column.
+
+        Args:
+            yaml_name (str): The original name of the YAML file.
+            column (str): The strategy column, or the suffix of a YAML shared by several strategy columns.
+
+        Returns:
+            str: The name of the strategy YAML file.
+        """
+        return f"{os.path.splitext(yaml_name)[0]}_{column}.yaml"
+
+    def write_yaml_file(self, yaml_path, yaml_content):
+        """
+        Serialize the YAML content and write it to the given path.
+
+        Args:
+            yaml_path (str): The path of the YAML file to write.
+            yaml_content (dict): The content to be saved in the YAML file.
+
+        Returns:
+            None
+        """
+        serialized = yaml.dump(yaml_content, Dumper=YAML_DUMPER)
+        with open(yaml_path, 'w') as new_file:
+            new_file.write(serialized)
+
+    def write_yaml_files(self, yaml_jobs, max_workers=None):
+        """
+        Write a batch of strategy YAML files using a thread pool.
+
+        Args:
+            yaml_jobs (dict): A dictionary mapping each output path to a tuple of
+                (yaml_content, yaml_name, column). If the same path is produced more than once,
+                only the last content is written, as it would be when writing one file at a time.
+            max_workers (int, optional): The maximum number of writer threads. Defaults to the
+                ThreadPoolExecutor default.
+
+        Returns:
+            dict: A dictionary mapping each path written successfully to the hash of the written file.
+        """
+        if not yaml_jobs:
+            return {}
+
+        def write_and_hash(yaml_path, yaml_content):
+            self.write_yaml_file(yaml_path, yaml_content)
+            return get_file_hash(yaml_path)
+
+        with tracer.stage('write_yaml_files', n_files=len(yaml_jobs)):
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                futures = {
+                    executor.submit(write_and_hash, yaml_path, yaml_content): (yaml_path, yaml_name, column)
+                    for yaml_path, (yaml_content, yaml_name, column) in yaml_jobs.items()
+                }
+
+        written = {}
+        for future, (yaml_path, yaml_name, column) in futures.items():
+            try:
+                written[yaml_path] = future.result()
+                tracer.count('yaml_written')
+            except Exception as e:
+                tracer.count('yaml_failed')
+                tracer.error(f"Error processing file {yaml_name} for column {column}: {e}", event='yaml_write_failed',
+                             yaml_name=yaml_name, column=column, error=repr(e))
+
+        return written
+
     def save_yaml_file(self, yaml_content, yaml_name, column, transformation_code, subsector, transformation_name, scalar_val):
         """
         Save the given YAML content to a file with a modified name and updated identifiers.
@@ -64,21 +662,19 @@ class ExcelYAMLHandler:
         Returns:
             None
         """
-        yaml_content['identifiers']['transformation_code'] = f'{transformation_code}_{column.upper()}'
-        yaml_content['identifiers']['transformation_name'] = f'Scaled Default Max Parameters by {scalar_val} - {subsector}: {transformation_name}' # TODO Change this format
-        new_yaml_name = f"{os.path.splitext(yaml_name)[0]}_{column}.yaml"
-        new_yaml_path = os.path.join(self.yaml_directory, new_yaml_name)
-        with open(new_yaml_path, 'w') as new_file:
-            yaml.dump(yaml_content, new_file)
+        new_yaml_path, yaml_content = self.build_strategy_yaml(yaml_content, yaml_name, column, transformation_code, subsector, transformation_name, scalar_val)
+        self.write_yaml_file(new_yaml_path, yaml_content)
     
+    @tracer.traced('get_transformations_per_strategy_dict')
     def get_transformations_per_strategy_dict(self):
         """
         Generates a dictionary of transformation codes for each strategy.
 
-        This method retrieves strategy names and loads data from an Excel file.
-        For each strategy, it creates a subset of the data containing transformation
-        codes and the strategy column, removes rows with missing values, and formats
-        the transformation codes by appending the strategy name in uppercase.
+        This method retrieves strategy names and uses the crosswalk data already loaded in `self.data`.
+        For each row with a transformation code, the strategy columns are grouped as in
+        `process_yaml_files` and each strategy is given the code of the YAML generated for
+        its group: the transformation code with the strategy name in uppercase, or with the
+        shared suffix when several strategies share the same parameters.
         The result is a dictionary where each key is a strategy name and the value
         is a list of formatted transformation codes.
 
@@ -87,20 +683,21 @@ class ExcelYAMLHandler:
                   of formatted transformation codes.
         """
 
-        transformations_per_strategy = {}
         strategy_names =  self.get_strategy_cols()
-        df = self.load_excel_data()
-        for strategy in strategy_names:
-            subset_df = df[['transformation_code', strategy]]
-            subset_df = subset_df.dropna()
-            subset_transformation_codes = subset_df['transformation_code'].tolist()
-            subset_transformation_codes = [f"{code}_{strategy.upper()}" for code in subset_transformation_codes]
-            transformations_per_strategy[strategy] = subset_transformation_codes
+        transformations_per_strategy = {strategy: [] for strategy in strategy_names}
+        for _, row in self.data.iterrows():
+            code = row['transformation_code']
+            if pd.isna(code):
+                continue
+            for group in self.get_strategy_groups(row, strategy_names):
+                for strategy in group['columns']:
+                    transformations_per_strategy[strategy].append(f"{code}_{group['suffix'].upper()}")
         return transformations_per_strategy
 
 
     
-    def process_yaml_files(self, overwrite_mult_param_transformations=True):
+    @tracer.traced('process_yaml_files')
+    def process_yaml_files(self, overwrite_mult_param_transformations=True, max_workers=None, force=False):
         """
         Processes YAML files based on the data loaded into the instance.
         This method iterates over each row in the DataFrame stored in `self.data`, 
@@ -108,18 +705,36 @@ class ExcelYAMLHandler:
         based on the scalar values provided in the DataFrame. The updated YAML files 
         are then saved to the specified directory.
         The method performs the following steps:
-        1. Checks if data is loaded; if not, prints a message and returns.
-        2. Iterates over each row in the DataFrame.
-        3. Constructs the path to the YAML file using the 'transformation_yaml_name' column.
-        4. Checks if the YAML file exists; if not, prints a message and continues to the next row.
-        5. For each relevant column (excluding 'transformation_yaml_name' and 'transformation_code'):
-            a. Retrieves the scalar value from the DataFrame.
-            b. Skips processing if the scalar value is NaN.
-            c. Loads the YAML file.
-            d. Checks for the presence of 'parameters' and 'magnitude' attributes.
-            e. Updates the 'magnitude' attribute by multiplying it with the scalar value.
-            f. Saves the modified YAML file.
-        6. Handles exceptions and prints error messages if any issues occur during processing.
+        1. Checks if data is loaded; if not, reports a warning and returns.
+        2. Loads the manifest of previously generated strategy YAML files.
+        3. Iterates over each row in the DataFrame.
+        4. Constructs the path to the YAML file using the 'transformation_yaml_name' column.
+        5. Checks if the YAML file exists; if not, reports a warning and continues to the next row.
+        6. For each group of strategy columns with the same parameters (see `get_strategy_groups`):
+            a. Retrieves the scalar value from the DataFrame; columns with NaN are not grouped.
+            b. Builds a single YAML for the group, named after the column if it is alone in its group.
+            c. Skips processing if the hash of its inputs matches the manifest and the
+               generated file is unchanged on disk.
+            d. Gets a copy of the parsed YAML template from the template cache.
+            e. Checks for the presence of 'parameters' and 'magnitude' attributes.
+            f. Updates the 'magnitude' attribute by multiplying it with the scalar value.
+            g. Queues the modified YAML file.
+        7. Writes all the queued YAML files using a thread pool.
+        8. Removes previously generated YAML files that no longer belong to any strategy, and the
+           per-strategy YAML files replaced by a shared YAML.
+        9. Saves the updated manifest and reports a summary.
+        10. Handles exceptions and reports error messages if any issues occur during processing.
+        Messages, stage timings and the yaml_read/parsed/written/skipped/failed/removed counters are
+        sent through the shared tracer, see TraceUtils.
+        Args:
+            overwrite_mult_param_transformations (bool, optional): Whether to write templates without a
+                'magnitude' parameter with their default values. Defaults to True.
+            max_workers (int, optional): The maximum number of threads used to write the YAML files.
+                Defaults to the ThreadPoolExecutor default.
+            force (bool, optional): Whether to regenerate every strategy YAML file regardless of the
+                manifest. Defaults to False.
+        Returns:
+            dict: The number of strategy YAML files 'written', 'skipped' and 'removed'.
         Raises:
             Exception: If an error occurs while processing a YAML file.
         Note:
@@ -128,62 +743,162 @@ class ExcelYAMLHandler:
         """
         # Ensure that the data was loaded successfully
         if self.data is None:
-            print("No data available to process.")
+            tracer.warning("No data available to process.", event='no_data', excel_file=str(self.excel_file))
             return
-        
-        # Loop over each row in the DataFrame
-        for _, row in self.data.iterrows():
-            yaml_name = row['transformation_yaml_name']
-            transformation_code = row['transformation_code']
-            transformation_name = row['transformation_name']
-            subsector = row['subsector']
-            
-            yaml_path = os.path.join(self.yaml_directory, yaml_name)
 
-            if not os.path.exists(yaml_path):
-                print(f"YAML file {yaml_name} not found in directory {self.yaml_directory}.")
-                continue
-            
-            # Process each relevant column except 'transformation_yaml_name' and 'transformation_code'
-            for column in self.get_strategy_cols():
+        with tracer.stage('load_manifest'):
+            previous_manifest = self.load_manifest()
+        manifest = {} if force else previous_manifest
+        # Entries of the new manifest; files that are not regenerated keep their previous entry
+        new_manifest = {}
+        # Names of all the strategy YAML files the crosswalk refers to
+        expected_yaml_names = set()
+        # Strategy YAMLs to write, keyed by output path, and their manifest input hashes
+        yaml_jobs = {}
+        input_hashes = {}
+        # Per-strategy YAML names -> the shared YAML that replaces them
+        superseded = {}
+        n_skipped = 0
+        strategy_cols = self.get_strategy_cols()
+
+        with tracer.stage('plan'):
+            # Loop over each row in the DataFrame
+            for _, row in self.data.iterrows():
+                yaml_name = row['transformation_yaml_name']
+                transformation_code = row['transformation_code']
+                transformation_name = row['transformation_name']
+                subsector = row['subsector']
+
+                yaml_path = os.path.join(self.yaml_directory, yaml_name)
 
-                # This is the magnitude/scalar that we are going to multiply by the default max value in each yaml
-                scalar_val = row[column] 
+                # Strategy columns that give the same parameters to the transformation share a YAML
+                groups = self.get_strategy_groups(row, strategy_cols)
 
-                # Skip if the value is NaN which means the transformation is not used for the strategy
-                if pd.isna(scalar_val):
+                # Strategy YAMLs of this row are kept even if they can't be regenerated
+                for group in groups:
+                    shared_yaml_name = self.get_strategy_yaml_name(yaml_name, group['suffix'])
+                    expected_yaml_names.add(shared_yaml_name)
+                    # The per-strategy YAMLs of a shared group are replaced by the shared YAML
+                    if len(group['columns']) > 1:
+                        for group_column in group['columns']:
+                            superseded[self.get_strategy_yaml_name(yaml_name, group_column)] = shared_yaml_name
+
+                if not os.path.exists(yaml_path):
+                    tracer.warning(f"YAML file {yaml_name} not found in directory {self.yaml_directory}.",
+                                   event='yaml_not_found', yaml_name=yaml_name)
                     continue
 
-                try:
-                    # Load the original YAML file
-                    with open(yaml_path, 'r') as file:
-                        yaml_content = yaml.safe_load(file)
-                    
-                    # Checks for 'parameters' and 'magnitude'
-                    # TODO: This will eventually be different we will multiply all by scalar val
-                    if 'parameters' in yaml_content:
-                        parameters = yaml_content['parameters']
-                        if 'magnitude' not in parameters:
-                            if overwrite_mult_param_transformations:
-                                print(f"YAML file {yaml_name} for strategy {column} set to default because it does not have magnitude attribute")
-                                self.save_yaml_file(yaml_content, yaml_name, column, transformation_code, subsector, transformation_name, scalar_val)
-                                continue
+                # Process each group of strategy columns, columns with NaN values are not in any group
+                for group in groups:
+
+                    # This is the magnitude/scalar that we are going to multiply by the default max value in each yaml
+                    scalar_val = group['scalar_val']
+                    suffix = group['suffix']
+                    column = ', '.join(group['columns'])
+
+                    try:
+                        # Skip the strategy YAML if none of its inputs changed since it was generated
+                        new_yaml_name = self.get_strategy_yaml_name(yaml_name, suffix)
+                        new_yaml_path = os.path.join(self.yaml_directory, new_yaml_name)
+                        input_hash = self.get_input_hash(yaml_path, yaml_name, column, transformation_code, subsector, transformation_name, scalar_val)
+                        entry = manifest.get(new_yaml_name)
+                        if (
+                            entry is not None
+                            and entry['input_hash'] == input_hash
+                            and os.path.exists(new_yaml_path)
+                            and get_file_hash(new_yaml_path) == entry['output_hash']
+                        ):
+                            new_manifest[new_yaml_name] = entry
+                            n_skipped += 1
+                            tracer.count('yaml_skipped')
+                            continue
+
+                        # Get a fresh copy of the parsed template, it is only read from disk once
+                        yaml_content = self.template_cache.get(yaml_path)
+
+                        # Checks for 'parameters' and 'magnitude'
+                        # TODO: This will eventually be different we will multiply all by scalar val
+                        if 'parameters' in yaml_content:
+                            parameters = yaml_content['parameters']
+                            if 'magnitude' not in parameters:
+                                if overwrite_mult_param_transformations:
+                                    tracer.info(f"YAML file {yaml_name} for strategy {column} set to default because it does not have magnitude attribute",
+                                                event='yaml_default_magnitude', yaml_name=yaml_name, column=column)
+                                else:
+                                    tracer.warning(f"YAML file {yaml_name} for strategy {column} wasn't updated. Please check it manually.",
+                                                   event='yaml_not_updated', yaml_name=yaml_name, column=column)
+                                    continue
                             else:
-                                print(f"YAML file {yaml_name} for strategy {column} wasn't updated. Please check it manually.")
-                                continue
-                    else:
-                        print(f"YAML file {yaml_name} for strategy {column} set to default because it does not have parameters attribute")
-                        self.save_yaml_file(yaml_content, yaml_name, column, transformation_code, subsector, transformation_name, scalar_val)
-                        continue
-                    
-                    # Update the 'magnitude' field if applicable
-                    curr_magnitude = float(yaml_content['parameters']['magnitude'])
-                    yaml_content['parameters']['magnitude'] = float(scalar_val) * curr_magnitude
-                    
-                    # Save the modified YAML file
-                    self.save_yaml_file(yaml_content, yaml_name, column, transformation_code, subsector, transformation_name, scalar_val)
+                                # Update the 'magnitude' field if applicable, all the columns of the group have the same product
+                                curr_magnitude = float(parameters['magnitude'])
+                                parameters['magnitude'] = float(row[group['columns'][0]]) * curr_magnitude
+                        else:
+                            tracer.info(f"YAML file {yaml_name} for strategy {column} set to default because it does not have parameters attribute",
+                                        event='yaml_default_parameters', yaml_name=yaml_name, column=column)
+
+                        # Queue the modified YAML file
+                        new_yaml_path, yaml_content = self.build_strategy_yaml(yaml_content, yaml_name, suffix, transformation_code, subsector, transformation_name, scalar_val, columns=group['columns'])
+                        yaml_jobs.pop(new_yaml_path, None)
+                        yaml_jobs[new_yaml_path] = (yaml_content, yaml_name, column)
+                        input_hashes[new_yaml_path] = input_hash
+                    except Exception as e:
+                        tracer.count('yaml_failed')
+                        tracer.error(f"Error processing file {yaml_name} for column {column}: {e}", event='yaml_process_failed',
+                                     yaml_name=yaml_name, column=column, error=repr(e))
+
+        # Write all the strategy YAML files in parallel
+        written = self.write_yaml_files(yaml_jobs, max_workers=max_workers)
+        for new_yaml_path, output_hash in written.items():
+            new_manifest[os.path.basename(new_yaml_path)] = {
+                'input_hash': input_hashes[new_yaml_path],
+                'output_hash': output_hash,
+            }
+
+        # Keep the previous entries of the strategy YAMLs that were not regenerated
+        for new_yaml_name in expected_yaml_names:
+            if new_yaml_name not in new_manifest and new_yaml_name in manifest:
+                new_manifest[new_yaml_name] = manifest[new_yaml_name]
+
+        # Remove generated YAMLs of strategies that are no longer in the crosswalk
+        n_removed = 0
+        with tracer.stage('remove_orphans'):
+            for new_yaml_name in previous_manifest:
+                if new_yaml_name in expected_yaml_names:
+                    continue
+                orphan_path = os.path.join(self.yaml_directory, new_yaml_name)
+                try:
+                    if os.path.exists(orphan_path):
+                        os.remove(orphan_path)
+                        n_removed += 1
+                        tracer.count('yaml_removed')
+                except Exception as e:
+                    tracer.error(f"Error removing file {new_yaml_name}: {e}", event='yaml_remove_failed',
+                                 yaml_name=new_yaml_name, error=repr(e))
+                    new_manifest[new_yaml_name] = previous_manifest[new_yaml_name]
+
+            # Per-strategy YAMLs written before deduplication, e.g. committed ones that are in no manifest,
+            # are removed once the shared YAML that replaces them exists
+            for new_yaml_name, shared_yaml_name in superseded.items():
+                if new_yaml_name in expected_yaml_names or new_yaml_name in previous_manifest:
+                    continue
+                superseded_path = os.path.join(self.yaml_directory, new_yaml_name)
+                if not os.path.exists(superseded_path) or not os.path.exists(os.path.join(self.yaml_directory, shared_yaml_name)):
+                    continue
+                try:
+                    os.remove(superseded_path)
+                    n_removed += 1
+                    tracer.count('yaml_removed')
                 except Exception as e:
-                    print(f"Error processing file {yaml_name} for column {column}: {e}")
+                    tracer.error(f"Error removing file {new_yaml_name}: {e}", event='yaml_remove_failed',
+                                 yaml_name=new_yaml_name, error=repr(e))
+
+        with tracer.stage('save_manifest'):
+            self.save_manifest(new_manifest)
+
+        summary = {'written': len(written), 'skipped': n_skipped, 'removed': n_removed}
+        tracer.info(f"Strategy YAML files written: {summary['written']}, skipped (up to date): {summary['skipped']}, removed (orphaned): {summary['removed']}",
+                    event='yaml_summary', **summary)
+        return summary
 
 class StrategyCSVHandler:
     def __init__(self, csv_file, yaml_dir_path, yaml_mapping_file, transformation_per_strategy_dict):
@@ -193,6 +908,30 @@ class StrategyCSVHandler:
         self.yaml_mapping_file = yaml_mapping_file
         self.mapping = self.load_yaml_mapping()
         self.transformations_per_strategy_dict = transformation_per_strategy_dict
+        self.transformation_index = TransformationDirectoryIndex(yaml_dir_path)
+        self.id_registry = self.build_id_registry()
+    
+    def build_id_registry(self):
+        """
+        Build the strategy ID registry from the strategy IDs currently in `self.data`.
+
+        Returns:
+            StrategyIDRegistry: The registry of occupied strategy IDs, empty if the CSV file could not
+                be loaded.
+        """
+        if self.data is None:
+            return StrategyIDRegistry(self.mapping)
+        strategy_ids = pd.to_numeric(self.data['strategy_id'], errors='coerce').dropna().astype(int)
+        return StrategyIDRegistry(self.mapping, strategy_ids)
+
+    def lock_csv(self):
+        """
+        Get an advisory lock on the CSV file, so that several processes can update it safely.
+
+        Returns:
+            FileLock: The lock, to be used as a context manager.
+        """
+        return FileLock(f"{self.csv_file}.lock")
     
     def load_csv(self):
         """
@@ -212,11 +951,11 @@ class StrategyCSVHandler:
             df['strategy_id'] = df['strategy_id'].fillna(0).astype(int)
             return df
         except FileNotFoundError:
-            print(f"{self.csv_file} not found. Creating a new DataFrame.")
+            tracer.info(f"{self.csv_file} not found. Creating a new DataFrame.", event='csv_not_found', csv_file=str(self.csv_file))
             columns = ['strategy_id', 'strategy_code', 'strategy', 'description', 'transformation_specification']
             return pd.DataFrame(columns=columns)
         except Exception as e:
-            print(f"Error loading CSV file: {e}")
+            tracer.error(f"Error loading CSV file: {e}", event='csv_load_failed', csv_file=str(self.csv_file), error=repr(e))
             return None
 
         
@@ -239,19 +978,20 @@ class StrategyCSVHandler:
                 mapping = yaml.safe_load(file)
             return mapping['strategy_groups']
         except FileNotFoundError:
-            print(f"{self.yaml_mapping_file} not found.")
+            tracer.error(f"{self.yaml_mapping_file} not found.", event='mapping_not_found', yaml_mapping_file=str(self.yaml_mapping_file))
             return {}
         except Exception as e:
-            print(f"Error loading YAML file: {e}")
+            tracer.error(f"Error loading YAML file: {e}", event='mapping_load_failed', yaml_mapping_file=str(self.yaml_mapping_file), error=repr(e))
             return {}
     
     def get_strategy_id(self, strategy_group):
         """
         Retrieve the next available strategy ID for a given strategy group.
 
-        This method checks the existing strategy IDs for the specified strategy group
-        and returns the next available ID within the defined range. If the strategy group
-        is not recognized or the ID range is exceeded, a ValueError is raised.
+        This method looks up the lowest free ID within the range defined for the specified
+        strategy group in the strategy ID registry. IDs used by other groups sharing the same
+        range are never returned, and gaps in the range are reused. Unlike `add_strategy`, a
+        ValueError is raised if the strategy group is not recognized or the ID range is exhausted.
 
         Parameters:
         strategy_group (str): The strategy group for which to retrieve the next ID.
@@ -262,26 +1002,7 @@ class StrategyCSVHandler:
         Raises:
         ValueError: If the strategy group is unknown or the ID range is exceeded.
         """
-        if strategy_group not in self.mapping:
-            raise ValueError(f"Unknown strategy group: {strategy_group}")
-
-        id_range = self.mapping[strategy_group]
-        min_id, max_id = map(int, id_range.split('-'))
-        existing_ids = self.data.loc[self.data['strategy_code'].str.startswith(strategy_group), 'strategy_id']
-
-        # Ensure existing_ids is numeric
-        existing_ids = pd.to_numeric(existing_ids, errors='coerce').dropna().astype(int)
-
-        if existing_ids.empty:
-            return min_id
-
-        max_existing_id = existing_ids.max()
-        next_id = max_existing_id + 1
-
-        if next_id > max_id:
-            raise ValueError(f"Exceeded ID range for {strategy_group}")
-
-        return next_id
+        return self.id_registry.next_id(strategy_group)
     
     def get_strategy_code(self, strategy_group, strategy_name):
         """
@@ -298,34 +1019,19 @@ class StrategyCSVHandler:
     def get_transformation_specification(self, yaml_file_suffix):
         """
         Retrieves the transformation specification for a given strategy based on the provided YAML file suffix.
-        This method searches for YAML files in the specified directory that match the given suffix,
-        extracts transformation codes from these files, and filters them based on the strategy's
-        transformation dictionary. The resulting transformation codes are concatenated into a single
-        string separated by pipe symbols.
+        This method looks up the transformation codes of the strategy's own YAML files and of the YAML
+        files it shares with other strategies through the handler's directory index, which only parses
+        these files and only when they are new or modified, and filters them based on the strategy's
+        transformation dictionary. The resulting transformation codes are
+        concatenated into a single string separated by pipe symbols.
         Args:
-            yaml_file_suffix (str): The suffix of the YAML files to search for.
+            yaml_file_suffix (str): The strategy suffix, e.g. 'NZ' for the 'strategy_NZ' column.
         Returns:
             str: A string containing the filtered transformation codes separated by pipe symbols.
         """
-       
-        all_entries = os.listdir(self.yaml_dir_path)
-        strategy_transformation_yamls = [file for file in all_entries if file.endswith(f'{yaml_file_suffix}.yaml')]
-        transformation_codes = []
-        
-        for yaml_file in strategy_transformation_yamls:
-            yaml_path = os.path.join(self.yaml_dir_path, yaml_file)
-            # Open the yaml file
-            with open(yaml_path, 'r') as file:
-                yaml_content = yaml.safe_load(file)
-
-            transformation_code = yaml_content['identifiers']['transformation_code']
-            transformation_codes.append(transformation_code)
-        
-        # Filter the transformation_codes to only include the ones that are used in the strategy
-        transformation_codes_filtered = [
-            code for code in transformation_codes 
-            if code in self.transformations_per_strategy_dict.get(f'strategy_{yaml_file_suffix}', [])
-        ]
+        # Only the transformation codes that are used in the strategy are kept
+        strategy_codes = set(self.transformations_per_strategy_dict.get(f'strategy_{yaml_file_suffix}', []))
+        transformation_codes_filtered = self.transformation_index.get_strategy_transformation_codes(yaml_file_suffix, strategy_codes)
         # Join transformation codes with a pipe symbol, excluding the trailing one
         transformation_specification = '|'.join(transformation_codes_filtered)
         return transformation_specification
@@ -333,6 +1039,11 @@ class StrategyCSVHandler:
     def add_strategy(self, strategy_group, description, yaml_file_suffix, custom_id=None, update_flag=False):
         """
         Add or update a strategy in the dataset.
+
+        Invalid strategies are not raised as errors: the reason is logged through the tracer and
+        nothing is written, e.g. when update_flag is True and custom_id is missing or unknown, when
+        custom_id or the generated strategy_code already exists, when the strategy group is unknown
+        or its ID range is exhausted, or when the CSV file can't be loaded.
         Parameters:
         strategy_group (str): The group to which the strategy belongs.
         description (str): A description of the strategy.
@@ -340,71 +1051,247 @@ class StrategyCSVHandler:
         custom_id (int, optional): A custom ID for the strategy. Required if update_flag is True. Defaults to None.
         update_flag (bool, optional): Flag indicating whether to update an existing strategy. Defaults to False.
         Returns:
-        None
-        Raises:
-        ValueError: If update_flag is True and custom_id is not provided.
-        ValueError: If update_flag is True and custom_id does not exist in the dataset.
-        ValueError: If custom_id is provided and already exists in the dataset.
-        ValueError: If the generated strategy_code already exists in the dataset.
+        pd.DataFrame: The row that was added or updated, or None if the strategy was rejected.
         """
-        # Reload the data to ensure we have the latest version
-        self.data = self.load_csv()
+        strategy_spec = {
+            'strategy_group': strategy_group,
+            'description': description,
+            'yaml_file_suffix': yaml_file_suffix,
+            'custom_id': custom_id,
+        }
 
         # If update_flag is true then we update the current strategy
         if update_flag:
-            # Check if custom_id is provided
-            if custom_id is None:
-                print("Error: custom_id is required for updating a strategy.")
-                return
-            # Check if the custom_id exists
-            if custom_id not in self.data['strategy_id'].values:
-                print(f"Error: strategy_id {custom_id} does not exist. Please provide a valid ID.")
-                return
-            
-            # Get the index of the row to update
-            idx = self.data.index[self.data['strategy_id'] == custom_id].tolist()[0]
-
-            # Update the transformation_specification
-            self.data.at[idx, 'transformation_specification'] = self.get_transformation_specification(yaml_file_suffix)
+            return self.update_strategies([strategy_spec])
+        return self.add_strategies([strategy_spec])
+
+    def get_strategy_specs_frame(self, strategy_specs):
+        """
+        Normalize a list of strategy specifications into a DataFrame.
+
+        Args:
+            strategy_specs (list): The strategy specifications. Each one is either a dictionary with the
+                keys 'strategy_group', 'description', 'yaml_file_suffix' and optionally 'custom_id', or a
+                tuple (strategy_group, description, yaml_file_suffix[, custom_id]).
+        Returns:
+            pd.DataFrame: A DataFrame with the columns 'strategy_group', 'description', 'yaml_file_suffix',
+                'custom_id' and 'strategy_code'.
+        """
+        columns = ['strategy_group', 'description', 'yaml_file_suffix', 'custom_id']
+        records = []
+        for spec in strategy_specs:
+            if isinstance(spec, dict):
+                records.append({col: spec.get(col) for col in columns})
+            else:
+                records.append(dict(zip(columns, list(spec) + [None] * (len(columns) - len(spec)))))
+
+        specs_df = pd.DataFrame(records, columns=columns)
+        specs_df['custom_id'] = pd.to_numeric(specs_df['custom_id'], errors='coerce').astype('Int64')
+        specs_df['strategy_code'] = (
+            specs_df['strategy_group'].astype(str).str.upper()
+            + ':'
+            + specs_df['yaml_file_suffix'].astype(str).str.upper()
+        )
+        return specs_df
 
+    @tracer.traced('add_strategies')
+    def add_strategies(self, strategy_specs):
+        """
+        Add several strategies to the dataset with a single load and save of the CSV file.
+
+        All the strategies are validated before anything is written: if any custom ID or strategy code
+        collides with the dataset or with another strategy of the batch, the errors are logged through
+        the tracer and nothing is committed. The CSV file is locked while it is read, validated and written, so
+        parallel workers can allocate strategy IDs safely.
+
+        Args:
+            strategy_specs (list): The strategy specifications, see `get_strategy_specs_frame`.
+        Returns:
+            pd.DataFrame: The rows that were added, or None if the batch was not committed.
+        """
+        with self.lock_csv():
+            # Reload the data to ensure we have the latest version
+            self.data = self.load_csv()
+            self.id_registry = self.build_id_registry()
+            if self.data is None:
+                tracer.warning("No strategies were added.", event='strategies_not_added', n_errors=1)
+                return None
+            specs_df = self.get_strategy_specs_frame(strategy_specs)
+            if specs_df.empty:
+                tracer.info("No strategies to add.", event='no_strategies')
+                return None
+
+            errors = []
+
+            # Check the custom IDs against the dataset and against each other
+            custom_ids = specs_df['custom_id'].dropna()
+            for strategy_id in custom_ids[custom_ids.isin(self.data['strategy_id'])].unique():
+                errors.append(f"strategy_id {strategy_id} already exists. Please use a different ID or leave it to be auto-generated.")
+            for strategy_id in custom_ids[custom_ids.duplicated()].unique():
+                errors.append(f"strategy_id {strategy_id} is used by more than one new strategy.")
+
+            # Check the strategy codes against the dataset and against each other
+            codes = specs_df['strategy_code']
+            for strategy_code in codes[codes.isin(self.data['strategy_code'])].unique():
+                errors.append(f"strategy_code {strategy_code} already exists. Please use a different code or eliminate the existing one.")
+            for strategy_code in codes[codes.duplicated()].unique():
+                errors.append(f"strategy_code {strategy_code} is used by more than one new strategy.")
+
+            # Auto-generate the missing IDs from the registry, after reserving the custom ones
+            for strategy_id in custom_ids:
+                self.id_registry.reserve(strategy_id)
+            strategy_ids = specs_df['custom_id'].copy()
+            for idx in specs_df.index[specs_df['custom_id'].isna()]:
+                try:
+                    strategy_ids.at[idx] = self.id_registry.allocate(specs_df.at[idx, 'strategy_group'])
+                except ValueError as e:
+                    errors.append(str(e))
+
+            if errors:
+                for error in errors:
+                    tracer.error(f"Error: {error}", event='strategy_rejected')
+                tracer.warning("No strategies were added.", event='strategies_not_added', n_errors=len(errors))
+                # Drop the IDs allocated for the rejected batch
+                self.id_registry = self.build_id_registry()
+                return None
+
+            new_rows = pd.DataFrame({
+                'strategy_id': strategy_ids.astype(int),
+                'strategy_code': specs_df['strategy_code'],
+                'strategy': specs_df['yaml_file_suffix'],
+                'description': specs_df['description'],
+                'transformation_specification': [
+                    self.get_transformation_specification(suffix) for suffix in specs_df['yaml_file_suffix']
+                ],
+            })
+
+            self.data = pd.concat([self.data, new_rows], ignore_index=True)
             self.save_csv()
-            print(f"Updated row with strategy_id {custom_id}")
-            return
-        
-        # Check if a custom ID was provided
-        if custom_id is not None:
-            if custom_id in self.data['strategy_id'].values:
-                print(f"Error: strategy_id {custom_id} already exists. Please use a different ID or leave it to be auto-generated.")
-                return
-            strategy_id = custom_id
-        else:
-            strategy_id = self.get_strategy_id(strategy_group)
-
-        # Generate the strategy_code and check for uniqueness
-        strategy_code = self.get_strategy_code(strategy_group, yaml_file_suffix)
-        if strategy_code in self.data['strategy_code'].values:
-            print(f"Error: strategy_code {strategy_code} already exists. Please use a different code or eliminate the existing one.")
-            return
+            tracer.count('strategies_added', len(new_rows))
+            tracer.info(f"Added {len(new_rows)} strategies:", event='strategies_added',
+                        strategy_ids=new_rows['strategy_id'].tolist(), strategy_codes=new_rows['strategy_code'].tolist())
+            tracer.info(new_rows[['strategy_id', 'strategy_code', 'strategy']].to_string(index=False), event='strategies_table')
+            return new_rows
 
-        new_row = {
-            'strategy_id': strategy_id,  # Keep as an integer
-            'strategy_code': strategy_code,
-            'strategy': yaml_file_suffix,
-            'description': description,
-            'transformation_specification': self.get_transformation_specification(yaml_file_suffix)
-        }
+    @tracer.traced('update_strategies')
+    def update_strategies(self, strategy_specs):
+        """
+        Update the transformation specification of several existing strategies with a single load and
+        save of the CSV file.
 
-        self.data = pd.concat([self.data, pd.DataFrame([new_row])], ignore_index=True)
-        self.save_csv()
-        print(f"Updated file with new row: {new_row}")
-      
+        Every specification must provide the 'custom_id' of the strategy to update. All the IDs are
+        validated before anything is written: if any of them is missing, unknown or repeated, the errors
+        are logged through the tracer and nothing is committed. The CSV file is locked while it is read and written.
 
+        Args:
+            strategy_specs (list): The strategy specifications, see `get_strategy_specs_frame`.
+        Returns:
+            pd.DataFrame: The rows that were updated, or None if the batch was not committed.
+        """
+        with self.lock_csv():
+            # Reload the data to ensure we have the latest version
+            self.data = self.load_csv()
+            self.id_registry = self.build_id_registry()
+            if self.data is None:
+                tracer.warning("No strategies were updated.", event='strategies_not_updated', n_errors=1)
+                return None
+            specs_df = self.get_strategy_specs_frame(strategy_specs)
+            if specs_df.empty:
+                tracer.info("No strategies to update.", event='no_strategies')
+                return None
+
+            errors = []
+            custom_ids = specs_df['custom_id']
+            if custom_ids.isna().any():
+                errors.append("custom_id is required for updating a strategy.")
+            custom_ids = custom_ids.dropna()
+            for strategy_id in custom_ids[~custom_ids.isin(self.data['strategy_id'])].unique():
+                errors.append(f"strategy_id {strategy_id} does not exist. Please provide a valid ID.")
+            for strategy_id in custom_ids[custom_ids.duplicated()].unique():
+                errors.append(f"strategy_id {strategy_id} is updated more than once.")
+
+            if errors:
+                for error in errors:
+                    tracer.error(f"Error: {error}", event='strategy_rejected')
+                tracer.warning("No strategies were updated.", event='strategies_not_updated', n_errors=len(errors))
+                return None
+
+            # Update the transformation_specification of all the rows at once
+            specifications = {
+                int(strategy_id): self.get_transformation_specification(suffix)
+                for strategy_id, suffix in zip(specs_df['custom_id'], specs_df['yaml_file_suffix'])
+            }
+            mask = self.data['strategy_id'].isin(list(specifications))
+            self.data.loc[mask, 'transformation_specification'] = self.data.loc[mask, 'strategy_id'].map(specifications)
+
+            self.save_csv()
+            updated_rows = self.data.loc[mask]
+            tracer.count('strategies_updated', len(updated_rows))
+            tracer.info(f"Updated {len(updated_rows)} strategies:", event='strategies_updated',
+                        strategy_ids=updated_rows['strategy_id'].tolist(), strategy_codes=updated_rows['strategy_code'].tolist())
+            tracer.info(updated_rows[['strategy_id', 'strategy_code', 'strategy']].to_string(index=False), event='strategies_table')
+            return updated_rows
+
+    @tracer.traced('add_strategy_rows')
+    def add_strategy_rows(self, strategy_rows):
+        """
+        Add complete strategy rows to the dataset, e.g. the rows returned by `MagnitudeSweep.materialize`,
+        whose IDs and transformation specifications are already set.
+
+        The rows are validated like the strategies of `add_strategies`: if any strategy ID or code
+        collides with the dataset or with another row, the errors are logged through the tracer and
+        nothing is committed. The CSV file is locked while it is read, validated and written.
+
+        Args:
+            strategy_rows (pd.DataFrame): The rows, with the columns of the CSV file.
+        Returns:
+            pd.DataFrame: The rows that were added, or None if the rows were not committed.
+        """
+        columns = ['strategy_id', 'strategy_code', 'strategy', 'description', 'transformation_specification']
+        with self.lock_csv():
+            self.data = self.load_csv()
+            self.id_registry = self.build_id_registry()
+            if self.data is None:
+                tracer.warning("No strategies were added.", event='strategies_not_added', n_errors=1)
+                return None
+            new_rows = strategy_rows[columns].reset_index(drop=True)
+            if new_rows.empty:
+                tracer.info("No strategies to add.", event='no_strategies')
+                return None
+
+            errors = []
+            strategy_ids = new_rows['strategy_id']
+            for strategy_id in strategy_ids[strategy_ids.isin(self.data['strategy_id'])].unique():
+                errors.append(f"strategy_id {strategy_id} already exists.")
+            for strategy_id in strategy_ids[strategy_ids.duplicated()].unique():
+                errors.append(f"strategy_id {strategy_id} is used by more than one new strategy.")
+            codes = new_rows['strategy_code']
+            for strategy_code in codes[codes.isin(self.data['strategy_code'])].unique():
+                errors.append(f"strategy_code {strategy_code} already exists.")
+            for strategy_code in codes[codes.duplicated()].unique():
+                errors.append(f"strategy_code {strategy_code} is used by more than one new strategy.")
+
+            if errors:
+                for error in errors:
+                    tracer.error(f"Error: {error}", event='strategy_rejected')
+                tracer.warning("No strategies were added.", event='strategies_not_added', n_errors=len(errors))
+                return None
+
+            for strategy_id in strategy_ids:
+                self.id_registry.reserve(strategy_id)
+            self.data = pd.concat([self.data, new_rows], ignore_index=True)
+            self.save_csv()
+            tracer.count('strategies_added', len(new_rows))
+            tracer.info(f"Added {len(new_rows)} strategies.", event='strategies_added',
+                        strategy_ids=new_rows['strategy_id'].tolist(), strategy_codes=new_rows['strategy_code'].tolist())
+            return new_rows
 
-    
     def save_csv(self):
-        # Save the DataFrame back to the CSV file
+        # Save the DataFrame back to the CSV file, writing to a temporary file first so it is replaced atomically
+        tmp_file = f"{self.csv_file}.{os.getpid()}.tmp"
         try:
-            self.data.to_csv(self.csv_file, index=False)
-            print(f"Data saved to {self.csv_file}")
+            self.data.to_csv(tmp_file, index=False)
+            os.replace(tmp_file, self.csv_file)
+            tracer.info(f"Data saved to {self.csv_file}", event='csv_saved', csv_file=str(self.csv_file), n_rows=len(self.data))
         except Exception as e:
-            print(f"Error saving CSV file: {e}")
+            tracer.error(f"Error saving CSV file: {e}", event='csv_save_failed', csv_file=str(self.csv_file), error=repr(e))
@@ -0,0 +1,227 @@
+import numpy as np
+import pandas as pd
+
+
+class InputValidator:
+    """
+    Single-pass validation engine for regional SISEPUEDE input frames.
+
+    Rules are compiled once per column layout into NumPy index arrays and bound vectors, and
+    then evaluated over the whole 2-D array of the input frame at once:
+
+    - NaN: numeric columns that contain missing values.
+    - Bounds: values outside the (min, max) bounds given for a column prefix.
+    - Group sums: rows where a group of fraction columns (e.g. `frac_waso_non_recycled_`)
+      does not sum to one, or groups that have no columns at all.
+    - Time period: `time_period` not strictly increasing within a region.
+    - Regions: values of the `region` field that are not allowed.
+    - Prefixes: columns whose name doesn't start with an allowed prefix.
+
+    The result is a compact violation report with one row per rule and column (or group).
+    """
+
+    def __init__(
+        self,
+        bounds=None,
+        sum_to_one_groups=None,
+        allowed_regions=None,
+        allowed_prefixes=None,
+        check_nan=True,
+        time_period_field='time_period',
+        region_field='region',
+        tol=1e-6,
+    ):
+        """
+        Args:
+            bounds (dict, optional): A dictionary mapping a column prefix to a (min, max) tuple; use
+                None for an open bound. If a column matches several prefixes, the longest one wins.
+            sum_to_one_groups (list, optional): Column prefixes; the columns that start with each
+                prefix form a group that must sum to one in every row.
+            allowed_regions (list, optional): The allowed values of the region field.
+            allowed_prefixes (list, optional): The allowed column name prefixes. Identifier fields
+                (time period and region) are always allowed.
+            check_nan (bool, optional): Whether to report numeric columns with NaN values. Defaults to True.
+            time_period_field (str, optional): The time period field. Defaults to 'time_period'.
+            region_field (str, optional): The region field. Defaults to 'region'.
+            tol (float, optional): The tolerance of the group sum check. Defaults to 1e-6.
+        """
+        self.bounds = bounds or {}
+        self.sum_to_one_groups = list(sum_to_one_groups or [])
+        self.allowed_regions = None if allowed_regions is None else list(allowed_regions)
+        self.allowed_prefixes = None if allowed_prefixes is None else tuple(allowed_prefixes)
+        self.check_nan = check_nan
+        self.time_period_field = time_period_field
+        self.region_field = region_field
+        self.tol = tol
+        self._compiled = None
+
+    @classmethod
+    def default(cls, allowed_regions=None):
+        """
+        Build a validator with the rules usually checked before a run: NaN values, fractions
+        between 0 and 1, non-negative quantities and the non-recycled solid waste fractions summing
+        to one.
+
+        Args:
+            allowed_regions (list, optional): The allowed values of the region field.
+        Returns:
+            InputValidator: The validator.
+        """
+        return cls(
+            bounds={
+                'frac_': (0.0, 1.0),
+                # -999 is used as a "no limit" flag for these fractions
+                'frac_entc_max_elec_production_increase_to_satisfy_msp_': (None, None),
+                'qty_': (0.0, None),
+                'pop_': (0.0, None),
+                'area_': (0.0, None),
+            },
+            sum_to_one_groups=['frac_waso_non_recycled_'],
+            allowed_regions=allowed_regions,
+        )
+
+    def compile(self, df):
+        """
+        Compile the rules for the column layout of a frame. The compiled rules are reused for every
+        frame with the same columns.
+
+        Args:
+            df (pd.DataFrame): A frame with the column layout to compile for.
+        Returns:
+            dict: The compiled rules.
+        """
+        columns = tuple(df.columns)
+        if self._compiled is not None and self._compiled['columns'] == columns:
+            return self._compiled
+
+        id_fields = {self.time_period_field, self.region_field}
+        is_numeric = np.array([pd.api.types.is_numeric_dtype(dtype) for dtype in df.dtypes])
+        numeric_idx = np.flatnonzero(is_numeric)
+        numeric_cols = np.array(columns, dtype=object)[numeric_idx]
+
+        # Bound vectors over the numeric columns, the longest matching prefix wins
+        lower = np.full(len(numeric_cols), -np.inf)
+        upper = np.full(len(numeric_cols), np.inf)
+        prefixes = sorted(self.bounds, key=len)
+        for prefix in prefixes:
+            lo, hi = self.bounds[prefix]
+            mask = np.array([col.startswith(prefix) for col in numeric_cols], dtype=bool)
+            lower[mask] = -np.inf if lo is None else lo
+            upper[mask] = np.inf if hi is None else hi
+        bounded = np.flatnonzero(np.isfinite(lower) | np.isfinite(upper))
+
+        # Assignment matrix of numeric columns to sum-to-one groups
+        groups = []
+        membership = np.zeros((len(numeric_cols), len(self.sum_to_one_groups)))
+        for j, prefix in enumerate(self.sum_to_one_groups):
+            mask = np.array([col.startswith(prefix) for col in numeric_cols], dtype=bool)
+            membership[mask, j] = 1.0
+            groups.append(prefix)
+        has_members = membership.any(axis=0)
+        # Only the member columns take part in the matrix product
+        member_idx = np.flatnonzero(membership.any(axis=1))
+
+        bad_prefix_cols = []
+        if self.allowed_prefixes is not None:
+            bad_prefix_cols = [
+                col for col in columns
+                if col not in id_fields and not str(col).startswith(self.allowed_prefixes)
+            ]
+
+        self._compiled = {
+            'columns': columns,
+            'numeric_idx': numeric_idx,
+            'numeric_cols': numeric_cols,
+            'lower': lower[bounded],
+            'upper': upper[bounded],
+            'bounded': bounded,
+            'member_idx': member_idx,
+            'membership': membership[np.ix_(member_idx, has_members)],
+            'groups': np.array(groups, dtype=object)[has_members],
+            'missing_groups': [group for group, found in zip(groups, has_members) if not found],
+            'bad_prefix_cols': bad_prefix_cols,
+        }
+        return self._compiled
+
+    def validate(self, df):
+        """
+        Validate an input frame against all the rules in one pass.
+
+        Args:
+            df (pd.DataFrame): The input frame.
+        Returns:
+            pd.DataFrame: The violation report, with the columns 'rule', 'target', 'n_violations'
+                and 'first_row' (the index label of the first offending row, if any). An empty frame
+                means the input is valid.
+        """
+        compiled = self.compile(df)
+        values = df.iloc[:, compiled['numeric_idx']].to_numpy(dtype=float)
+        index = df.index.to_numpy()
+        violations = []
+
+        def report(rule, targets, mask):
+            # mask is (rows x targets); one report row per target with any violation
+            if mask.size == 0:
+                return
+            counts = mask.sum(axis=0)
+            first = mask.argmax(axis=0)
+            for j in np.flatnonzero(counts):
+                violations.append((rule, targets[j], int(counts[j]), index[first[j]]))
+
+        nan_mask = np.isnan(values)
+        if self.check_nan:
+            report('nan', compiled['numeric_cols'], nan_mask)
+
+        if len(compiled['bounded']) > 0:
+            bounded_values = values[:, compiled['bounded']]
+            with np.errstate(invalid='ignore'):
+                out_of_bounds = (bounded_values < compiled['lower']) | (bounded_values > compiled['upper'])
+            report('bounds', compiled['numeric_cols'][compiled['bounded']], out_of_bounds)
+
+        if compiled['membership'].shape[1] > 0:
+            member_values = values[:, compiled['member_idx']]
+            member_values = np.where(np.isnan(member_values), 0.0, member_values)
+            with np.errstate(invalid='ignore'):
+                group_sums = member_values @ compiled['membership']
+            # Written as a negation so that non-finite sums are reported too
+            report('sum_to_one', compiled['groups'], ~(np.abs(group_sums - 1.0) <= self.tol))
+        for group in compiled['missing_groups']:
+            violations.append(('missing_group', group, len(df), None))
+
+        if self.time_period_field in df.columns:
+            time_periods = df[self.time_period_field].to_numpy()
+            if self.region_field in df.columns:
+                regions = df[self.region_field].to_numpy()
+                same_region = regions[1:] == regions[:-1]
+            else:
+                same_region = np.ones(max(len(df) - 1, 0), dtype=bool)
+            not_increasing = same_region & (np.diff(time_periods) <= 0)
+            report('time_period', np.array([self.time_period_field], dtype=object), np.concatenate([[False], not_increasing])[:, None])
+
+        if self.allowed_regions is not None and self.region_field in df.columns:
+            bad_region = ~df[self.region_field].isin(self.allowed_regions).to_numpy()
+            report('region', np.array([self.region_field], dtype=object), bad_region[:, None])
+
+        for col in compiled['bad_prefix_cols']:
+            violations.append(('prefix', col, len(df), None))
+
+        return pd.DataFrame(violations, columns=['rule', 'target', 'n_violations', 'first_row'])
+
+    def validate_many(self, dfs):
+        """
+        Validate several input frames, e.g. one per region.
+
+        Args:
+            dfs (dict): A dictionary mapping a name (e.g. the region) to its input frame.
+        Returns:
+            pd.DataFrame: The violation reports of all the frames, with an additional 'name' column.
+        """
+        reports = []
+        for name, df in dfs.items():
+            report = self.validate(df)
+            report.insert(0, 'name', name)
+            reports.append(report)
+
+        if not reports:
+            return pd.DataFrame(columns=['name', 'rule', 'target', 'n_violations', 'first_row'])
+        return pd.concat(reports, ignore_index=True)